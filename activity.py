@@ -0,0 +1,121 @@
+"""
+Activity regions.
+
+Only the part of a level around the camera is simulated at full rate: the
+view plus a margin, so things wake up a little before they scroll into sight.
+Outside of it an entity is either
+
+    suspended: not updated at all, it picks up where it left off when the
+    region reaches it again, or
+    throttled: updated every few frames with all the frames it missed at once,
+    so it ends up exactly where it would have been. Its update has to step
+    frame by frame for that, and only sync its sprite at the end.
+
+Things that have to keep running wherever they are (spawners on a timer,
+missiles homing in on the player) just aren't added.
+"""
+
+
+# how far past the edges of the view things stay active
+ACTIVE_MARGIN = 200
+# frames between updates of throttled entities outside the region
+THROTTLE_INTERVAL = 8
+
+SUSPEND = "suspend"
+THROTTLE = "throttle"
+POLICIES = (SUSPEND, THROTTLE)
+
+
+class Activity():
+    """ an entity tracked by an ActivityRegion """
+
+    def __init__(self, sprite, update=None, policy=SUSPEND, on_change=None):
+        """ initializer """
+        if policy not in POLICIES:
+            raise ValueError(f"unknown activity policy {policy}")
+        self.sprite = sprite
+        # update(frames) advances the entity that many frames
+        self.update = update
+        self.policy = policy
+        # on_change(active) is called when it enters or leaves the region
+        self.on_change = on_change
+        self.active = True
+        # frames it hasn't been updated for
+        self.owed = 0
+
+
+class ActivityRegion():
+    """ the camera's view plus a margin, and the entities simulated by it """
+
+    def __init__(self, width, height, margin=ACTIVE_MARGIN, interval=THROTTLE_INTERVAL):
+        """ initializer, width and height are the view's """
+        self.width = width
+        self.height = height
+        self.margin = margin
+        self.interval = interval
+        self.activities = []
+        self.move_to(0, 0)
+
+    def move_to(self, view_left, view_bottom):
+        """ follow the camera, given the bottom left corner of the view """
+        self.left = view_left - self.margin
+        self.bottom = view_bottom - self.margin
+        self.right = view_left + self.width + self.margin
+        self.top = view_bottom + self.height + self.margin
+
+    def contains(self, left, bottom, right, top):
+        """ True if a box overlaps the region """
+        return left < self.right and right > self.left and bottom < self.top and top > self.bottom
+
+    def contains_sprite(self, sprite):
+        """ True if a sprite overlaps the region """
+        return self.contains(sprite.left, sprite.bottom, sprite.right, sprite.top)
+
+    def add(self, sprite, update=None, policy=SUSPEND, on_change=None):
+        """ track an entity by its sprite, returns its Activity """
+        activity = Activity(sprite, update, policy, on_change)
+        self.activities.append(activity)
+        return activity
+
+    def remove(self, activity):
+        """ stop tracking an entity """
+        self.activities.remove(activity)
+
+    def update(self):
+        """ advance every tracked entity by a frame, or suspend it """
+        for activity in self.activities:
+            activity.owed += 1
+            active = self.contains_sprite(activity.sprite)
+            if active != activity.active:
+                activity.active = active
+                if activity.on_change is not None:
+                    activity.on_change(active)
+            if not active and activity.policy == SUSPEND:
+                activity.owed = 0
+            elif active or activity.owed >= self.interval:
+                # back in view or due, catch up on everything missed
+                if activity.update is not None:
+                    activity.update(activity.owed)
+                activity.owed = 0
+
+    def reset(self):
+        """
+        Forget the frames owed, call when the entities are put back at their
+        start. They count as active again until the next update checks them.
+        """
+        for activity in self.activities:
+            activity.owed = 0
+            activity.active = True
+
+    def get_state(self):
+        """ where the view is, whether each entity is active and the frames it's owed, see snapshot.py """
+        return ((self.left + self.margin, self.bottom + self.margin),
+                tuple((activity.active, activity.owed) for activity in self.activities))
+
+    def set_state(self, state):
+        """ put back a state from get_state, on_change isn't called """
+        view, activities = state
+        self.move_to(*view)
+        for activity, (active, owed) in zip(self.activities, activities):
+            activity.active = active
+            activity.owed = owed
@@ -0,0 +1,330 @@
+"""
+Packed asset archive.
+
+The pack is one file: a header, a JSON index of name -> (offset, size) and the
+asset blobs. It holds the runtime set only (png sprites, sounds and compiled
+maps), the .xcf sources and Thumbs.db stay out. Every sprite sheet and tileset
+also gets downscaled copies (name@0.5, name@0.25), see load_texture. The game
+memory-maps it once and the loaders below read straight from it. Without a
+pack they fall back to the loose files, so the names are the same relative
+paths used everywhere.
+
+Run this file to build the pack:
+    python assetpack.py
+"""
+import glob
+import io
+import json
+import mmap
+import os
+import struct
+
+import arcade
+import PIL.Image
+import pyglet
+
+
+PACK_PATH = "data/assets.pak"
+
+MAGIC = b"EVLP"
+VERSION = 1
+# magic, version, asset count, index size
+HEADER = struct.Struct("<4sHHI")
+# blobs start on a 16 byte boundary
+ALIGN = 16
+
+# downscaled copies of the sprites, each half the size of the one before like a
+# mip chain. A texture drawn at scale 0.25 only needs the 0.25 copy.
+MIP_LEVELS = [0.5, 0.25]
+MIP_PATTERN = "data/sprites/*.png"
+
+# what goes in the pack
+PACK_PATTERNS = [
+    "data/sprites/*.png",
+    "data/sounds/*.wav",
+    "data/sounds/*.mp3",
+    "data/maps/*.bin",
+    "data/maps/*.traps.json",
+]
+
+
+def asset_name(file_name):
+    """ the name an asset is stored under, a relative path with forward slashes """
+    return os.path.normpath(str(file_name)).replace(os.sep, "/")
+
+
+def mip_name(file_name, level):
+    """ the name a downscaled copy is stored under """
+    return f"{asset_name(file_name)}@{level}"
+
+
+def mip_image(image, level):
+    """
+    Downscale an image by a mip level with a box filter, or None if its size
+    doesn't divide. Filtering is done premultiplied so transparent pixels
+    don't bleed their color into the edges.
+    """
+    factor = round(1 / level)
+    if image.width % factor or image.height % factor:
+        return None
+    return image.convert("RGBa").reduce(factor).convert("RGBA")
+
+
+class AssetPack():
+    """ a memory-mapped pack file """
+
+    def __init__(self, file_name=PACK_PATH):
+        """ initializer """
+        self.file_name = file_name
+        with open(file_name, "rb") as f:
+            self.buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, count, index_size = HEADER.unpack_from(self.buffer, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{file_name} is not an asset pack, or an old version of the format")
+        self.index = json.loads(self.buffer[HEADER.size:HEADER.size + index_size].decode("utf-8"))
+
+    def __contains__(self, file_name):
+        return asset_name(file_name) in self.index
+
+    def read(self, file_name):
+        """ the bytes of an asset, as a memoryview into the pack """
+        offset, size = self.index[asset_name(file_name)]
+        return memoryview(self.buffer)[offset:offset + size]
+
+
+def build_pack(out_name=PACK_PATH):
+    """ compile the maps, downscale the sprites and write every runtime asset into one pack, returns the output path """
+    import mapbin
+    mapbin.main()
+
+    assets = {}
+    for pattern in PACK_PATTERNS:
+        for file_name in sorted(glob.glob(pattern)):
+            with open(file_name, "rb") as f:
+                assets[asset_name(file_name)] = f.read()
+    for file_name in sorted(glob.glob(MIP_PATTERN)):
+        image = decode_image(file_name)
+        for level in MIP_LEVELS:
+            mip = mip_image(image, level)
+            if mip is not None:
+                blob = io.BytesIO()
+                mip.save(blob, "PNG", optimize=True)
+                assets[mip_name(file_name, level)] = blob.getvalue()
+
+    # the blobs go right after the index, grow the index slot until it fits
+    data_start = HEADER.size
+    while True:
+        entries = {}
+        offset = data_start
+        for name, blob in assets.items():
+            entries[name] = [offset, len(blob)]
+            offset += len(blob) + (-len(blob) % ALIGN)
+        index = json.dumps(entries).encode("utf-8")
+        if HEADER.size + len(index) <= data_start:
+            break
+        data_start = HEADER.size + len(index)
+        data_start += -data_start % ALIGN
+    index += b" " * (data_start - HEADER.size - len(index))
+
+    with open(out_name, "wb") as f:
+        f.write(HEADER.pack(MAGIC, VERSION, len(assets), len(index)))
+        f.write(index)
+        for blob in assets.values():
+            f.write(blob)
+            f.write(b"\0" * (-len(blob) % ALIGN))
+    return out_name
+
+
+# the pack opened by the loaders, False until the first lookup
+_pack = False
+
+
+def get_pack():
+    """ the game's asset pack, or None if it hasn't been built """
+    global _pack
+    if _pack is False:
+        _pack = AssetPack(PACK_PATH) if os.path.exists(PACK_PATH) else None
+    return _pack
+
+
+def read_asset(file_name):
+    """ the bytes of an asset, from the pack if it has it, otherwise from disk """
+    pack = get_pack()
+    if pack is not None and file_name in pack:
+        return pack.read(file_name)
+    with open(file_name, "rb") as f:
+        return f.read()
+
+
+def decode_image(file_name):
+    """ decode an image to RGBA, safe to call from worker threads """
+    return PIL.Image.open(io.BytesIO(read_asset(file_name))).convert("RGBA")
+
+
+def preload_images(file_names, executor, scale=None):
+    """
+    Decode images on a pool and put them in arcade's cache, so load_texture
+    finds them already opened. PIL drops the GIL while decoding.
+    With a scale that a mip level covers only the mip level is prepared, the
+    full images aren't kept.
+    """
+    levels = [level for level in MIP_LEVELS if scale is not None and level >= scale]
+    if levels:
+        list(executor.map(lambda file_name: _mip_source(file_name, min(levels)), file_names))
+        return
+    names = [str(file_name) for file_name in file_names if str(file_name) not in arcade.load_texture.texture_cache]
+    for name, image in zip(names, executor.map(decode_image, names)):
+        arcade.load_texture.texture_cache[name] = arcade.Texture(name, image)
+
+
+class ScaledTexture(arcade.Texture):
+    """
+    A downscaled copy standing in for a full resolution texture. It reports the
+    full size and the hit box traced on the full image, so sprites keep their
+    scale and collisions don't change, only the image sent to the atlas shrinks.
+    """
+
+    def __init__(self, name, image, full_size, hit_box_points):
+        """ initializer """
+        super().__init__(name, image)
+        self._full_size = full_size
+        self._hit_box_points = hit_box_points
+
+    @property
+    def width(self):
+        return self._full_size[0]
+
+    @property
+    def height(self):
+        return self._full_size[1]
+
+
+def _cache_image(name, load):
+    """ put a source image in arcade's cache, load is only called if it isn't there yet """
+    if name not in arcade.load_texture.texture_cache:
+        arcade.load_texture.texture_cache[name] = arcade.Texture(name, load())
+    return arcade.load_texture.texture_cache[name].image
+
+
+def _mip_source(file_name, level):
+    """ the downscaled copy of an image, from the pack if it was built, otherwise made now """
+    name = mip_name(file_name, level)
+    pack = get_pack()
+    if pack is not None and name in pack:
+        return _cache_image(name, lambda: decode_image(name))
+    if name in arcade.load_texture.texture_cache:
+        return arcade.load_texture.texture_cache[name].image
+    image = mip_image(_source_image(file_name), level)
+    return None if image is None else _cache_image(name, lambda: image)
+
+
+# the last full image decoded for a mip level's hit boxes, a sheet's cuts are loaded one after the other
+_last_source = (None, None)
+
+
+def _source_image(file_name):
+    """ a full image, from arcade's cache if it's there, without putting it in """
+    global _last_source
+    cached = arcade.load_texture.texture_cache.get(str(file_name))
+    if cached is not None:
+        return cached.image
+    if _last_source[0] != str(file_name):
+        _last_source = (str(file_name), decode_image(file_name))
+    return _last_source[1]
+
+
+def _cut(image, x, y, width, height, flipped_horizontally, flipped_vertically, flipped_diagonally):
+    """ cut and flip an image the way arcade.load_texture does """
+    if x or y or width or height:
+        image = image.crop((x, y, x + width, y + height))
+    if flipped_diagonally:
+        image = image.transpose(PIL.Image.TRANSPOSE)
+    if flipped_horizontally:
+        image = image.transpose(PIL.Image.FLIP_LEFT_RIGHT)
+    if flipped_vertically:
+        image = image.transpose(PIL.Image.FLIP_TOP_BOTTOM)
+    return image
+
+
+# what a mip level texture keeps of its full resolution cut, by the arguments of the cut:
+# (size of the source image, size of the cut, hit box points)
+_full_cuts = {}
+
+
+def _full_cut(file_name, cut, hit_box_algorithm, hit_box_detail):
+    """ the size and hit box of a full resolution cut, traced once, its image isn't kept """
+    key = (str(file_name), *cut, hit_box_algorithm, hit_box_detail)
+    if key not in _full_cuts:
+        source = _source_image(file_name)
+        x, y, width, height = cut[:4]
+        if x + width > source.width or y + height > source.height:
+            raise ValueError(f"can't cut {width}x{height} at {x}, {y} out of {file_name}, "
+                             f"it's {source.width}x{source.height}")
+        image = _cut(source, *cut)
+        texture = arcade.Texture(str(file_name), image, hit_box_algorithm=hit_box_algorithm,
+                                 hit_box_detail=hit_box_detail)
+        _full_cuts[key] = (source.size, image.size, texture.hit_box_points)
+    return _full_cuts[key]
+
+
+def load_texture(file_name, x=0, y=0, width=0, height=0, flipped_horizontally=False, flipped_vertically=False,
+                 flipped_diagonally=False, hit_box_algorithm="Simple", hit_box_detail=4.5, scale=None):
+    """
+    Same as arcade.load_texture, but the image comes from the pack.
+    The decoded image is put in arcade's cache under the file name, arcade then
+    cuts textures out of it like it does for a file it already opened.
+
+    Pass the scale the texture is drawn at to get the smallest mip level that
+    still covers it, as a ScaledTexture. Then only the mip level is cached,
+    of the full resolution image only the size and hit box of the cut are kept.
+    """
+    flips = (flipped_horizontally, flipped_vertically, flipped_diagonally)
+    for level in sorted(MIP_LEVELS):
+        if scale is None or level < scale:
+            continue
+        cache_name = f"{mip_name(file_name, level)}-{x}-{y}-{width}-{height}-{flipped_horizontally}-" \
+                     f"{flipped_vertically}-{flipped_diagonally}-{hit_box_algorithm} "
+        if cache_name in arcade.load_texture.texture_cache:
+            return arcade.load_texture.texture_cache[cache_name]
+        source_size, full_size, hit_box_points = _full_cut(file_name, (x, y, width, height, *flips),
+                                                           hit_box_algorithm, hit_box_detail)
+        factor = round(1 / level)
+        if any(value % factor for value in (x, y, width or source_size[0], height or source_size[1])):
+            continue
+        mip = _mip_source(file_name, level)
+        if mip is None:
+            continue
+        # same cut and flips, in mip level pixels
+        image = _cut(mip, x // factor, y // factor, width // factor, height // factor, *flips)
+        texture = ScaledTexture(cache_name, image, full_size, hit_box_points)
+        arcade.load_texture.texture_cache[cache_name] = texture
+        return texture
+
+    _cache_image(str(file_name), lambda: decode_image(file_name))
+    return arcade.load_texture(file_name, x, y, width, height, flipped_horizontally=flipped_horizontally,
+                               flipped_vertically=flipped_vertically, flipped_diagonally=flipped_diagonally,
+                               hit_box_algorithm=hit_box_algorithm, hit_box_detail=hit_box_detail)
+
+
+def load_sound(file_name, streaming=False):
+    """ same as arcade.load_sound, but the sound comes from the pack """
+    pack = get_pack()
+    if pack is None or file_name not in pack:
+        return arcade.load_sound(file_name, streaming)
+    sound = arcade.Sound.__new__(arcade.Sound)
+    sound.file_name = asset_name(file_name)
+    # pyglet picks the decoder from the name, the data comes from the file object
+    sound.source = pyglet.media.load(sound.file_name, file=io.BytesIO(pack.read(file_name)), streaming=streaming)
+    sound.min_distance = 100000000
+    return sound
+
+
+def main():
+    """ build the pack """
+    out_name = build_pack()
+    pack = AssetPack(out_name)
+    print(f"{out_name}: {len(pack.index)} assets, {os.path.getsize(out_name)} bytes")
+
+
+if __name__ == "__main__":
+    main()
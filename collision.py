@@ -0,0 +1,421 @@
+"""
+Batched polygon collision.
+
+arcade.check_for_collision_with_list tests one sprite at a time in Python.
+Here the hit boxes of a sprite list are kept in packed NumPy arrays and one
+shape is tested against all of them at once: arcade's collision radius
+rejection first, then the separating axis test on what's left. Hits are the
+same as arcade's, polygons that only touch don't collide. (Bounding boxes
+can't be used for the rejection: the Detailed hit boxes aren't always convex,
+and the separating axis test then reports hits a box test would reject.)
+
+Only lists that move as a whole are batched: map layers, triggers and
+MovingWalls. Their polygons are packed once and followed through the offset
+of their first sprite, or the offset of the group for a SpriteGroup. Lists
+whose sprites move on their own are passed on to arcade, re-packing them
+every frame costs more than it saves, and so are short lists, where the
+NumPy call overhead is more than arcade's loop.
+
+A whole layer is switched off by setting collidable = False on its sprite
+list (see collidable), or per world with CollisionWorld.set_enabled. Either
+is a flag checked once per layer before any per-sprite work, like arcade's
+own list-wide visible, alpha and color, which are one uniform at draw time.
+
+Fast movers are swept: given where a sprite was before it moved, the test
+uses the area its hit box covered on the way, so a thin spike or trigger
+can't be skipped between frames. The way is the one the physics engines
+take, along y and then along x, each leg the convex hull of the hit box at
+its two ends.
+"""
+import math
+import weakref
+
+import arcade
+import numpy as np
+
+
+# lists shorter than this are left to arcade
+BATCH_MIN = 32
+
+
+def list_offset(sprite_list, reference, origin):
+    """
+    How far a list moved as a whole has moved: its first sprite's move since
+    it was at origin, plus the group offset if it's a SpriteGroup.
+    """
+    x, y = getattr(sprite_list, "offset", (0, 0))
+    if reference is not None:
+        x += reference.center_x - origin[0]
+        y += reference.center_y - origin[1]
+    return x, y
+
+
+def collidable(sprite_list):
+    """ False if a whole sprite list is switched off for collisions """
+    return getattr(sprite_list, "collidable", True)
+
+
+def polygons_intersecting(polygon, points, valid):
+    """
+    Separating axis test of one polygon against N others.
+    polygon is (K, 2), points is (N, M, 2) padded by repeating the first vertex,
+    valid is (N, M) and False for the padding. Returns a (N,) bool array.
+    """
+    # edge normals of the single polygon, tested against every candidate
+    normals = np.roll(polygon, -1, axis=0) - polygon
+    normals = np.stack([normals[:, 1], -normals[:, 0]], axis=1)
+    own = polygon @ normals.T
+    other = points @ normals.T
+    separated = ((own.max(axis=0) <= other.min(axis=1)) | (other.max(axis=1) <= own.min(axis=0))).any(axis=1)
+
+    # edge normals of every candidate, the padding makes empty edges that are skipped
+    edges = np.roll(points, -1, axis=1) - points
+    normals = np.stack([edges[..., 1], -edges[..., 0]], axis=2)
+    own = np.einsum("kd,nmd->nmk", polygon, normals)
+    other = np.einsum("npd,nmd->nmp", points, normals)
+    separated |= (((own.max(axis=2) <= other.min(axis=2)) | (other.max(axis=2) <= own.min(axis=2))) & valid).any(axis=1)
+    return ~separated
+
+
+def convex_hull(points):
+    """ convex hull of a list of points, counter-clockwise (monotone chain) """
+    points = sorted(set((float(x), float(y)) for x, y in points))
+    if len(points) <= 2:
+        return points
+
+    def cross(o, a, b):
+        return (a[0] - o[0]) * (b[1] - o[1]) - (a[1] - o[1]) * (b[0] - o[0])
+
+    lower, upper = [], []
+    for point in points:
+        while len(lower) >= 2 and cross(lower[-2], lower[-1], point) <= 0:
+            lower.pop()
+        lower.append(point)
+    for point in reversed(points):
+        while len(upper) >= 2 and cross(upper[-2], upper[-1], point) <= 0:
+            upper.pop()
+        upper.append(point)
+    return lower[:-1] + upper[:-1]
+
+
+def _sweep(points, center, dx, dy, radius):
+    """ the area a hit box covered on a straight move of dx, dy ending at points, with its center and radius """
+    polygon = convex_hull(list(points) + [(x - dx, y - dy) for x, y in points])
+    return polygon, (center[0] - dx / 2, center[1] - dy / 2), radius + math.hypot(dx, dy) / 2
+
+
+def swept_hit_boxes(sprite, start):
+    """
+    The areas a sprite's hit box covered moving from start to where it is
+    now, as (polygon, center, collision radius) per leg. The physics engines
+    move along y first and then along x, so a diagonal move is swept as those
+    two legs: a straight line between the ends would cut the corner and hit
+    what the sprite went around.
+    """
+    dx, dy = sprite.center_x - start[0], sprite.center_y - start[1]
+    points = sprite.get_adjusted_hit_box()
+    radius = sprite.collision_radius
+    legs = []
+    if dy:
+        # up or down from start, ending straight below or above where the sprite is now
+        corner = [(x - dx, y) for x, y in points]
+        legs.append(_sweep(corner, (sprite.center_x - dx, sprite.center_y), 0, dy, radius))
+    if dx:
+        legs.append(_sweep(points, sprite.position, dx, 0, radius))
+    return legs
+
+
+def _collide_polygon(polygon, center, radius, sprite_list, exclude=None):
+    """ arcade's radius and SAT test of a polygon against every sprite of a list, in Python """
+    hits = []
+    for other in sprite_list:
+        if other is exclude:
+            continue
+        reach = radius + other.collision_radius
+        if (other.center_x - center[0]) ** 2 + (other.center_y - center[1]) ** 2 > reach * reach:
+            continue
+        if arcade.are_polygons_intersecting(polygon, other.get_adjusted_hit_box()):
+            hits.append(other)
+    return hits
+
+
+def pack_sprites(sprites):
+    """
+    The hit boxes of sprites packed for polygons_intersecting: points (N, M, 2),
+    valid (N, M), and positions (N, 2) and collision radii (N,) for the rejection.
+    """
+    polygons = [sprite.get_adjusted_hit_box() for sprite in sprites]
+    size = max((len(polygon) for polygon in polygons), default=1)
+    points = np.zeros((len(polygons), size, 2))
+    valid = np.zeros((len(polygons), size), dtype=bool)
+    for i, polygon in enumerate(polygons):
+        points[i, :len(polygon)] = polygon
+        points[i, len(polygon):] = polygon[0]
+        valid[i, :len(polygon)] = True
+    positions = np.array([sprite.position for sprite in sprites], dtype=float).reshape(len(polygons), 2)
+    radii = np.array([sprite.collision_radius for sprite in sprites], dtype=float)
+    return points, valid, positions, radii
+
+
+class PolygonBatch():
+    """
+    The hit boxes of a sprite list packed in arrays.
+
+    Polygons are stored where the sprites were when the batch was built, the
+    query is moved back by how far the first sprite has moved since. The batch
+    is rebuilt when sprites are added or removed.
+    """
+
+    def __init__(self, sprite_list):
+        """ initializer """
+        self.sprite_list = sprite_list
+        self.build()
+
+    def build(self):
+        """ (re)pack every hit box """
+        self.sprites = list(self.sprite_list)
+        self.points, self.valid, self.positions, self.radii = pack_sprites(self.sprites)
+        count = len(self.sprites)
+
+        self.reference = self.sprites[0] if count else None
+        self.origin = self.reference.position if self.reference else (0, 0)
+
+    @property
+    def offset(self):
+        """ how far the list has moved since the batch was built """
+        return list_offset(self.sprite_list, self.reference, self.origin)
+
+    def collide(self, sprite):
+        """ the sprites of the list whose hit box overlaps this sprite's """
+        return self.collide_polygon(sprite.get_adjusted_hit_box(), sprite.position, sprite.collision_radius, sprite)
+
+    def collide_polygon(self, polygon, center, radius, exclude=None):
+        """ the sprites of the list whose hit box overlaps a polygon, center and radius as for a sprite """
+        if len(self.sprite_list) != len(self.sprites) or (self.sprites and self.sprite_list[0] is not self.reference):
+            # sprites were added or removed
+            self.build()
+        if not self.sprites:
+            return []
+        offset = self.offset
+        polygon = np.array(polygon, dtype=float) - offset
+        center = np.array(center, dtype=float) - offset
+
+        # collision radius rejection, then SAT on the few candidates left
+        reach = self.radii + radius
+        distance = self.positions - center
+        candidates = np.nonzero((distance * distance).sum(axis=1) <= reach * reach)[0]
+        if not len(candidates):
+            return []
+        hits = candidates[polygons_intersecting(polygon, self.points[candidates], self.valid[candidates])]
+        return [self.sprites[i] for i in hits.tolist() if self.sprites[i] is not exclude]
+
+
+# one batch per sprite list, dropped with the list
+_batches = weakref.WeakKeyDictionary()
+
+
+def get_batch(sprite_list):
+    """ the cached batch of a sprite list """
+    batch = _batches.get(sprite_list)
+    if batch is None:
+        batch = _batches[sprite_list] = PolygonBatch(sprite_list)
+    return batch
+
+
+def check_for_collision_with_list(sprite, sprite_list, rigid=True, start=None):
+    """
+    Same as arcade.check_for_collision_with_list.
+    Pass rigid=False for lists whose sprites move on their own, they go to arcade.
+    Pass start, the sprite's position before it moved, to sweep the move.
+    """
+    # a SpriteGroup's sprites aren't where they're drawn, only the batch knows the offset
+    batched = rigid and (len(sprite_list) >= BATCH_MIN or hasattr(sprite_list, "offset"))
+    if start is not None and tuple(start) != tuple(sprite.position):
+        hits = []
+        for polygon, center, radius in swept_hit_boxes(sprite, start):
+            if batched:
+                found = get_batch(sprite_list).collide_polygon(polygon, center, radius, sprite)
+            else:
+                found = _collide_polygon(polygon, center, radius, sprite_list, sprite)
+            hits += [other for other in found if other not in hits]
+        return hits
+    if batched:
+        return get_batch(sprite_list).collide(sprite)
+    return arcade.check_for_collision_with_list(sprite, sprite_list)
+
+
+def check_for_collision_with_lists(sprite, sprite_lists, rigid=True, start=None):
+    """ same as arcade.check_for_collision_with_lists """
+    hits = []
+    for sprite_list in sprite_lists:
+        hits += check_for_collision_with_list(sprite, sprite_list, rigid, start)
+    return hits
+
+
+# layer categories of a CollisionWorld
+HAZARD = "hazard"
+TRIGGER = "trigger"
+SOLID = "solid"
+PICKUP = "pickup"
+# walls that shove the player when touched rather than being stood on
+PUSHER = "pusher"
+CATEGORIES = (HAZARD, TRIGGER, SOLID, PICKUP, PUSHER)
+
+
+class Layer():
+    """ a sprite list registered in a CollisionWorld """
+
+    def __init__(self, name, sprite_list, category, rigid=True):
+        """ initializer """
+        if category not in CATEGORIES:
+            raise ValueError(f"unknown collision category {category}")
+        self.name = name
+        self.sprite_list = sprite_list
+        self.category = category
+        self.rigid = rigid
+        self.enabled = True
+        # the first sprite and where it was when the layer was packed, and the
+        # last one: a removal and an append in the same frame keep the count
+        self.count = 0
+        self.reference = None
+        self.origin = (0, 0)
+        self.last = None
+
+    def mark(self):
+        """ remember the layer as it is now, when it gets packed """
+        self.count = len(self.sprite_list)
+        self.reference = self.sprite_list[0] if self.count else None
+        self.origin = self.reference.position if self.reference else (0, 0)
+        self.last = self.sprite_list[-1] if self.count else None
+
+    def changed(self):
+        """ True if sprites were added or removed since it was packed """
+        return len(self.sprite_list) != self.count or (self.count and (
+            self.sprite_list[0] is not self.reference or self.sprite_list[-1] is not self.last))
+
+    @property
+    def offset(self):
+        """ how far the layer has moved since it was packed """
+        return list_offset(self.sprite_list, self.reference, self.origin)
+
+    @property
+    def last_move(self):
+        """ how far a SpriteGroup moved on its last update """
+        return getattr(self.sprite_list, "last_move", (0, 0))
+
+
+class CollisionWorld():
+    """
+    Sprite lists registered by name and category (hazard, trigger, solid,
+    pickup, pusher), all checked in one query.
+
+    The rigid layers are packed together, one row per sprite with the layer
+    it belongs to, so a query does the radius rejection and SAT for all of
+    them in one call, each row moved by its layer's offset. A layer that
+    moved on this update (a MovingWall) is swept in its own frame. Layers
+    whose sprites move on their own are checked in Python after.
+    """
+
+    def __init__(self):
+        """ initializer """
+        self.layers = {}
+        self.packed = None
+
+    def add_layer(self, name, sprite_list, category, rigid=True):
+        """ register a sprite list, rigid as for check_for_collision_with_list """
+        self.layers[name] = Layer(name, sprite_list, category, rigid)
+        self.packed = None
+
+    def remove_layer(self, name):
+        """ stop checking a layer """
+        del self.layers[name]
+        self.packed = None
+
+    def set_enabled(self, name, enabled):
+        """ a disabled layer is skipped by queries, without repacking """
+        self.layers[name].enabled = enabled
+
+    def _pack(self):
+        """ pack the hit boxes of every rigid layer together """
+        self.packed = [layer for layer in self.layers.values() if layer.rigid]
+        self.sprites = []
+        rows = []
+        for i, layer in enumerate(self.packed):
+            layer.mark()
+            self.sprites += layer.sprite_list
+            rows += [i] * len(layer.sprite_list)
+        self.rows = np.array(rows, dtype=int)
+        self.points, self.valid, self.positions, self.radii = pack_sprites(self.sprites)
+
+    def query(self, sprite, start=None, categories=CATEGORIES):
+        """
+        Everything a sprite overlaps, as {category: {layer name: [sprites]}}
+        with every category present. With start, where the sprite was before
+        it moved, the move is swept.
+        """
+        if self.packed is None or any(layer.changed() for layer in self.packed):
+            self._pack()
+        hits = {category: {} for category in CATEGORIES}
+        moved = start is not None and tuple(start) != tuple(sprite.position)
+        if moved:
+            legs = swept_hit_boxes(sprite, start)
+        else:
+            legs = [(sprite.get_adjusted_hit_box(), sprite.position, sprite.collision_radius)]
+
+        if self.sprites:
+            offsets = np.array([layer.offset for layer in self.packed], dtype=float).reshape(len(self.packed), 2)
+            wanted = np.array([layer.enabled and collidable(layer.sprite_list) and layer.category in categories
+                               for layer in self.packed])
+            # layers that moved this update get their own sweep below
+            sliding = np.array([layer.last_move != (0, 0) for layer in self.packed]) & (start is not None)
+            for leg in legs:
+                self._collide_rows(sprite, *leg, wanted & ~sliding, offsets, hits)
+            for i in np.nonzero(wanted & sliding)[0].tolist():
+                layer = self.packed[i]
+                for leg in swept_hit_boxes(sprite, (start[0] + layer.last_move[0], start[1] + layer.last_move[1])):
+                    self._collide_rows(sprite, *leg, np.arange(len(self.packed)) == i, offsets, hits)
+
+        for layer in self.layers.values():
+            if not layer.rigid and layer.enabled and collidable(layer.sprite_list) and layer.category in categories:
+                found = []
+                for polygon, center, radius in legs:
+                    found += [other for other in _collide_polygon(polygon, center, radius, layer.sprite_list, sprite)
+                              if other not in found]
+                if found:
+                    hits[layer.category][layer.name] = found
+        return hits
+
+    def _collide_rows(self, sprite, polygon, center, radius, layers, offsets, hits):
+        """ test a polygon against the packed rows of the chosen layers, adds to hits """
+        row_offsets = offsets[self.rows]
+        distance = self.positions + row_offsets - center
+        reach = self.radii + radius
+        candidates = np.nonzero(layers[self.rows] & ((distance * distance).sum(axis=1) <= reach * reach))[0]
+        if not len(candidates):
+            return
+        points = self.points[candidates] + row_offsets[candidates][:, None, :]
+        found = candidates[polygons_intersecting(np.array(polygon, dtype=float), points, self.valid[candidates])]
+        for i in found.tolist():
+            if self.sprites[i] is sprite:
+                continue
+            layer = self.packed[self.rows[i]]
+            layer_hits = hits[layer.category].setdefault(layer.name, [])
+            # a sweep's legs can both hit a sprite
+            if self.sprites[i] not in layer_hits:
+                layer_hits.append(self.sprites[i])
+
+    def sprite_positions(self, categories=CATEGORIES):
+        """ where the sprites of the layers a query would check are, as an (N, 2) array, for the categories given """
+        if self.packed is None or any(layer.changed() for layer in self.packed):
+            self._pack()
+        found = []
+        if self.sprites:
+            offsets = np.array([layer.offset for layer in self.packed], dtype=float).reshape(len(self.packed), 2)
+            wanted = np.array([layer.enabled and collidable(layer.sprite_list) and layer.category in categories
+                               for layer in self.packed])
+            rows = np.nonzero(wanted[self.rows])[0]
+            found.append(self.positions[rows] + offsets[self.rows[rows]])
+        for layer in self.layers.values():
+            if not layer.rigid and layer.enabled and collidable(layer.sprite_list) and layer.category in categories:
+                found.append(np.array([sprite.position for sprite in layer.sprite_list], dtype=float).reshape(-1, 2))
+        return np.concatenate(found) if found else np.zeros((0, 2))
@@ -0,0 +1,196 @@
+"""
+Batched level environments.
+
+Gym style reset() and step(actions) over many independent runs of one level,
+without a window, for training and testing agents on the traps offline. The
+runs are stepped one after the other in a plain loop, on one level in one
+process: it's a batch in the shape of gym's vector environments, not a
+vectorized or parallel simulation, a step costs num_envs times one run's.
+That's a few hundred env steps a second. A NumPy core stepping every run at
+once would have to be a second copy of the levels' physics and traps, and
+drift from what LevelN.update() does, so the levels' own code is run instead.
+
+Every run is a state of one HeadlessLevel (see headless.py): a step puts the
+run's state in the level, plays its action for frame_skip ticks and takes the
+state back out. A run costs a few KB of state instead of a loaded level, and
+runs don't share anything, random numbers included. The state of the run
+stepped last stays in the level until another one needs it.
+
+Actions are indexes into the level's actions (HeadlessLevel.actions). What
+comes back is batched over the runs:
+
+    observations  a dict of NumPy arrays
+        patch     uint8 (N, 2, PATCH_CELLS, PATCH_CELLS), the grid cells around
+                  the player, row 0 at the bottom: solid tiles, then hazards
+        velocity  float32 (N, 2), the player's change_x and change_y
+        hazards   float32 (N, HAZARD_COUNT, 3), the nearest hazards as x, y
+                  from the player and 1, rows of zeros when there are fewer
+    rewards       float32 (N,), the progress made (see HeadlessLevel.progress)
+                  less STEP_COST, plus FINISH_REWARD or less DEATH_PENALTY
+    dones         bool (N,), the run finished, died or ran out of time
+    infos         {"finished": bool (N,)}
+
+A run that's done starts over, the observation returned for it is already
+the new run's first, like gym's vector environments.
+
+Run this file to measure the throughput on a level:
+    python envs.py 1 --envs 16 --steps 200
+"""
+import argparse
+import random
+import time
+
+import numpy as np
+
+# first, headless.py's display and audio options only count before arcade is imported
+from headless import HeadlessLevel, STEP, PLAYING, FINISHED, DEAD
+from collision import HAZARD
+from physics import CELL_SIZE
+
+
+# cells per side of the patch, odd so the player is in the middle one
+PATCH_CELLS = 11
+HAZARD_COUNT = 8
+# ticks an action is held for
+FRAME_SKIP = 4
+# a run is cut off after this many seconds of play
+MAX_SECONDS = 60
+
+PROGRESS_SCALE = 0.01
+STEP_COST = 0.01
+FINISH_REWARD = 100.0
+DEATH_PENALTY = 10.0
+
+
+class SequentialLevelEnv():
+    """ num_envs runs of one level, stepped one after the other and returned as a batch """
+
+    def __init__(self, number, num_envs, seed=0, frame_skip=FRAME_SKIP, max_seconds=MAX_SECONDS):
+        """ initializer """
+        self.level = HeadlessLevel(number, seed)
+        self.actions = self.level.actions
+        self.action_count = len(self.actions)
+        self.num_envs = num_envs
+        self.frame_skip = frame_skip
+        self.max_ticks = int(max_seconds / STEP)
+        # seeds the random numbers of every new run
+        self.rng = np.random.default_rng(seed)
+        self.start_state = self.level.capture()
+        self.states = [self.start_state] * num_envs
+        # the progress of each run at its last step
+        self.scores = np.zeros(num_envs)
+        # the run whose state is in the level, its entry in states is out of date
+        self.loaded = None
+
+    def _stash(self):
+        """ take the loaded run's state out of the level """
+        if self.loaded is not None:
+            self.states[self.loaded] = self.level.capture()
+            self.loaded = None
+
+    def _load(self, index):
+        """ put a run's state in the level """
+        if self.loaded == index:
+            return
+        self._stash()
+        self.level.restore(self.states[index])
+        self.loaded = index
+
+    def _start(self, index):
+        """ start a run over, with random numbers of its own """
+        self._stash()
+        self.level.restore(self.start_state)
+        random.seed(int(self.rng.integers(1 << 32)))
+        self.loaded = index
+        self.scores[index] = self.level.progress()
+
+    def _empty_observations(self):
+        """ observations of num_envs runs, zeroed """
+        return {
+            "patch": np.zeros((self.num_envs, 2, PATCH_CELLS, PATCH_CELLS), dtype=np.uint8),
+            "velocity": np.zeros((self.num_envs, 2), dtype=np.float32),
+            "hazards": np.zeros((self.num_envs, HAZARD_COUNT, 3), dtype=np.float32),
+        }
+
+    def _observe(self, index, observations):
+        """ fill in the observation of the loaded run """
+        view = self.level.view
+        player = view.player_sprite
+        x, y = player.center_x, player.center_y
+        size = PATCH_CELLS * CELL_SIZE
+        left, bottom = x - size / 2, y - size / 2
+
+        patch = observations["patch"][index]
+        for box_left, box_bottom, box_right, box_top, _ in view.physics_engine.hits(left, bottom, left + size, bottom + size):
+            first_col = max(0, int((box_left - left) // CELL_SIZE))
+            last_col = min(PATCH_CELLS, int(-((left - box_right) // CELL_SIZE)))
+            first_row = max(0, int((box_bottom - bottom) // CELL_SIZE))
+            last_row = min(PATCH_CELLS, int(-((bottom - box_top) // CELL_SIZE)))
+            patch[0, first_row:last_row, first_col:last_col] = 1
+
+        hazards = view.collision_world.sprite_positions((HAZARD,)) - (x, y)
+        if len(hazards):
+            cells = np.floor((hazards + size / 2) / CELL_SIZE).astype(int)
+            inside = ((cells >= 0) & (cells < PATCH_CELLS)).all(axis=1)
+            patch[1, cells[inside, 1], cells[inside, 0]] = 1
+            nearest = np.argsort((hazards * hazards).sum(axis=1))[:HAZARD_COUNT]
+            observations["hazards"][index, :len(nearest), :2] = hazards[nearest]
+            observations["hazards"][index, :len(nearest), 2] = 1
+        observations["velocity"][index] = (player.change_x, player.change_y)
+
+    def reset(self):
+        """ start every run over, returns their observations """
+        observations = self._empty_observations()
+        for index in range(self.num_envs):
+            self._start(index)
+            self._observe(index, observations)
+        return observations
+
+    def step(self, actions):
+        """ play an action in every run, returns (observations, rewards, dones, infos) """
+        observations = self._empty_observations()
+        rewards = np.zeros(self.num_envs, dtype=np.float32)
+        dones = np.zeros(self.num_envs, dtype=bool)
+        finished = np.zeros(self.num_envs, dtype=bool)
+        for index, action in enumerate(actions):
+            self._load(index)
+            status, _ = self.level.step(self.actions[action], self.frame_skip)
+            score = self.level.progress()
+            reward = (score - self.scores[index]) * PROGRESS_SCALE - STEP_COST
+            if status == FINISHED:
+                reward += FINISH_REWARD
+            elif status == DEAD:
+                reward -= DEATH_PENALTY
+            rewards[index] = reward
+            self.scores[index] = score
+            if status != PLAYING or self.level.ticks >= self.max_ticks:
+                dones[index] = True
+                finished[index] = status == FINISHED
+                self._start(index)
+            self._observe(index, observations)
+        return observations, rewards, dones, {"finished": finished}
+
+
+def main():
+    """ main method, random actions to measure the throughput """
+    parser = argparse.ArgumentParser(description="measure the batched environments")
+    parser.add_argument("level", type=int)
+    parser.add_argument("--envs", type=int, default=16)
+    parser.add_argument("--steps", type=int, default=200)
+    args = parser.parse_args()
+
+    env = SequentialLevelEnv(args.level, args.envs)
+    env.reset()
+    rng = np.random.default_rng(0)
+    started = time.perf_counter()
+    episodes = 0
+    for _ in range(args.steps):
+        _, _, dones, _ = env.step(rng.integers(env.action_count, size=args.envs))
+        episodes += int(dones.sum())
+    elapsed = time.perf_counter() - started
+    print(f"level {args.level}: {args.envs * args.steps / elapsed:.0f} env steps/s "
+          f"({args.envs * args.steps * env.frame_skip / elapsed:.0f} ticks/s), {episodes} runs ended")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,256 @@
+"""
+Ghost runs.
+
+The best run of each level is kept on disk and played back as a translucent
+ghost of the player while the level is played again.
+
+A run is one record per tick of the player's position and animation, stored
+as int16s: the position as the move since the previous tick in QUANTUM
+pixel steps, the animation as an anim code (see encode_anim). Moves too big
+for an int16 are spread over the next ticks, the recorder always measures
+from where the ghost will be, so the error never builds up. A minute of play
+is about 21KB. A run is one try: the level starts a new recorder and the
+ghost over after every death, and takes both back when time is rewound.
+
+A ghost file is one header followed by the records:
+
+    magic, version, tick count, start x, start y (QUANTUM steps, int32), start anim
+
+Playing it back memory-maps the file and reads the records in order, so a
+ghost costs one sprite update per frame and none of the run is loaded.
+"""
+import mmap
+import os
+import struct
+import sys
+from array import array
+
+import arcade
+import numpy as np
+
+from texture_cache import load_texture
+
+
+MAGIC = b"EVLG"
+VERSION = 1
+HEADER = struct.Struct("<4sHIiih")
+# dx, dy, anim per tick
+RECORD = np.dtype([("dx", "<i2"), ("dy", "<i2"), ("anim", "<i2")])
+# pixels per position step
+QUANTUM = 0.25
+INT16_MIN = -(1 << 15)
+INT16_MAX = (1 << 15) - 1
+
+GHOST_DIR = "ghosts"
+GHOST_ALPHA = 90
+
+# anim code of a player that isn't shown (dying)
+HIDDEN = -1
+# set in the anim code of a walking animation, unset for a still frame
+ANIMATED = 0x100
+FRAME_SIZE = 128
+# ms per frame, the same as the levels' set_anim and clear_anim
+WALK_FRAME_TIME = 50
+STILL_FRAME_TIME = 10
+
+
+def ghost_path(level_name):
+    """ the ghost file of a level """
+    return os.path.join(GHOST_DIR, f"{level_name}.ghost")
+
+
+def encode_anim(x, y, animated):
+    """ the anim code of a frame of the sprite sheet, the first of a walking row if animated """
+    code = (y // FRAME_SIZE) * 16 + x // FRAME_SIZE
+    return code | ANIMATED if animated else code
+
+
+def decode_anim(code):
+    """ (x, y, animated) from an anim code """
+    frame = code & ~ANIMATED
+    return (frame % 16) * FRAME_SIZE, (frame // 16) * FRAME_SIZE, bool(code & ANIMATED)
+
+
+def file_size(ticks):
+    """ the size of a ghost file of a run of ticks """
+    return HEADER.size + ticks * RECORD.itemsize
+
+
+def best_ticks(file_name):
+    """ the length of the run in a ghost file, None if there's no usable one """
+    try:
+        with open(file_name, "rb") as f:
+            magic, version, ticks, _, _, _ = HEADER.unpack(f.read(HEADER.size))
+        size = os.path.getsize(file_name)
+    except (OSError, struct.error):
+        return None
+    # a file cut short doesn't have the run its header says
+    if magic != MAGIC or version != VERSION or size < file_size(ticks):
+        return None
+    return ticks
+
+
+class GhostRecorder():
+    """ records the run being played """
+
+    def __init__(self):
+        """ initializer """
+        # dx, dy, anim, ... as int16
+        self.records = array("h")
+        self.start = None
+        # where the ghost is, in steps, the next move is measured from there
+        self.x = 0
+        self.y = 0
+
+    def __len__(self):
+        """ ticks recorded """
+        return len(self.records) // 3
+
+    def record(self, x, y, anim):
+        """ add a tick, the player at x, y showing anim """
+        step_x = round(x / QUANTUM)
+        step_y = round(y / QUANTUM)
+        if self.start is None:
+            self.start = (step_x, step_y, anim)
+            self.x, self.y = step_x, step_y
+        dx = max(INT16_MIN, min(INT16_MAX, step_x - self.x))
+        dy = max(INT16_MIN, min(INT16_MAX, step_y - self.y))
+        self.x += dx
+        self.y += dy
+        self.records.extend((dx, dy, anim))
+
+    def rewind(self, ticks=1):
+        """ forget the last ticks recorded, time went back over them """
+        ticks = min(ticks, len(self))
+        if ticks <= 0:
+            return
+        dropped = self.records[-3 * ticks:]
+        del self.records[-3 * ticks:]
+        self.x -= sum(dropped[0::3])
+        self.y -= sum(dropped[1::3])
+        if not self.records:
+            self.start = None
+
+    def save(self, file_name):
+        """ write the run to a ghost file """
+        records = self.records
+        if sys.byteorder == "big":
+            records = array("h", records)
+            records.byteswap()
+        start_x, start_y, start_anim = self.start or (0, 0, HIDDEN)
+        os.makedirs(os.path.dirname(file_name) or ".", exist_ok=True)
+        # written next to it and swapped in, a crash never leaves half a ghost
+        temp_name = file_name + ".tmp"
+        with open(temp_name, "wb") as f:
+            f.write(HEADER.pack(MAGIC, VERSION, len(self), start_x, start_y, start_anim))
+            f.write(records.tobytes())
+        os.replace(temp_name, file_name)
+
+    def save_if_best(self, file_name):
+        """ write the run if it's shorter than the one in the file, True if it was """
+        best = best_ticks(file_name)
+        if best is not None and best <= len(self):
+            return False
+        self.save(file_name)
+        return True
+
+
+class Ghost(arcade.AnimatedTimeBasedSprite):
+    """ a recorded run played back, one tick per advance() """
+
+    def __init__(self, file_name, sprite_path, scale):
+        """ initializer, sprite_path is the player's sprite sheet """
+        super().__init__()
+        self.sprite_path = sprite_path
+        self.sprite_scale = scale
+        with open(file_name, "rb") as f:
+            self.buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(self.buffer) < HEADER.size:
+            self.buffer.close()
+            raise ValueError("not a ghost file")
+        magic, version, ticks, start_x, start_y, start_anim = HEADER.unpack_from(self.buffer, 0)
+        if magic != MAGIC or version != VERSION:
+            self.buffer.close()
+            raise ValueError("not a ghost file, or an old version of the format")
+        if len(self.buffer) < file_size(ticks):
+            self.buffer.close()
+            raise ValueError("the ghost file was cut short")
+        self.records = np.frombuffer(self.buffer, dtype=RECORD, count=ticks, offset=HEADER.size)
+        self.start = (start_x, start_y, start_anim)
+        self.scale = scale
+        self.restart()
+
+    @classmethod
+    def open(cls, level_name, sprite_path, scale):
+        """ the ghost of a level's best run, None if it has none yet """
+        file_name = ghost_path(level_name)
+        if best_ticks(file_name) is None:
+            return None
+        try:
+            return cls(file_name, sprite_path, scale)
+        except (OSError, ValueError):
+            return None
+
+    def restart(self):
+        """ back to the start of the run """
+        self.tick = 0
+        self.x, self.y, _ = self.start
+        self.anim = None
+        self.set_anim(self.start[2])
+        self.center_x = self.x * QUANTUM
+        self.center_y = self.y * QUANTUM
+
+    def set_anim(self, code):
+        """ show an anim code, the frames only change when it does """
+        if code == self.anim:
+            return
+        self.anim = code
+        # arcade keeps visibility as the alpha, a hidden ghost is a transparent one
+        if code == HIDDEN:
+            self.alpha = 0
+            return
+        self.alpha = GHOST_ALPHA
+        x, y, animated = decode_anim(code)
+        self.frames.clear()
+        for i in range(4):
+            texture = load_texture(self.sprite_path, i * FRAME_SIZE if animated else x, y, FRAME_SIZE, FRAME_SIZE,
+                                   scale=self.sprite_scale)
+            self.frames.append(arcade.AnimationKeyframe(i, WALK_FRAME_TIME if animated else STILL_FRAME_TIME, texture))
+        self.cur_frame_idx = 0
+        self.time_counter = 0.0
+        self.texture = self.frames[0].texture
+
+    def advance(self, delta_time=1 / 60):
+        """ play the next tick, the ghost is hidden once the run is over """
+        # counted past the end too, rewind() goes back over those ticks first
+        self.tick += 1
+        if self.tick > len(self.records):
+            self.set_anim(HIDDEN)
+            return
+        dx, dy, anim = self.records[self.tick - 1].tolist()
+        self.x += dx
+        self.y += dy
+        self.center_x = self.x * QUANTUM
+        self.center_y = self.y * QUANTUM
+        self.set_anim(anim)
+        if anim != HIDDEN:
+            self.update_animation(delta_time)
+
+    def rewind(self, ticks=1):
+        """ go back over the last ticks played, time went back over them """
+        played = min(self.tick, len(self.records))
+        self.tick = max(0, self.tick - ticks)
+        back = self.records[min(self.tick, played):played]
+        self.x -= int(back["dx"].sum())
+        self.y -= int(back["dy"].sum())
+        self.center_x = self.x * QUANTUM
+        self.center_y = self.y * QUANTUM
+        if self.tick == 0:
+            self.set_anim(self.start[2])
+        elif self.tick <= len(self.records):
+            self.set_anim(int(self.records[self.tick - 1]["anim"]))
+
+    def close(self):
+        """ let go of the file, before it's replaced by a better run """
+        self.records = self.records[:0].copy()
+        self.buffer.close()
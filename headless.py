@@ -0,0 +1,198 @@
+"""
+Headless levels.
+
+A level played by code instead of a keyboard: in a window that's never shown
+(without a display on Linux, pyglet's headless mode), with the sound off,
+one fixed step of 1/60 s per tick. What's pressed is a set of button bits,
+turned into the key and mouse events the level already handles, so the
+level runs the same code as when it's played.
+
+Import this before arcade, the display and audio options only count then.
+
+The state of a headless level is the level's snapshot (see snapshot.py)
+plus what only matters when the level isn't drawn: the camera, which level 2
+reads to turn its controls around and which otherwise only moves when drawn,
+the level's clock and the buttons held. capture() and restore() hand it
+over as plain data, get_state() and set_state() as bytes for another process.
+"""
+import importlib
+import math
+import os
+import random
+import sys
+
+import pyglet
+
+if sys.platform.startswith("linux") and not os.environ.get("DISPLAY"):
+    pyglet.options["headless"] = True
+# arcade sets pyglet's audio option itself when it's imported, from this
+os.environ["ARCADE_SOUND_BACKENDS"] = "silent"
+pyglet.options["audio"] = ("silent",)
+
+import arcade
+
+from ghost import GhostRecorder
+from rewind import Rewind
+from snapshot import dumps, loads
+
+
+SCREEN_WIDTH = 1000
+SCREEN_HEIGHT = 600
+LEVELS = (1, 2, 3, 4, 5, 6)
+STEP = 1 / 60
+
+# buttons
+LEFT = 1
+RIGHT = 2
+JUMP = 4
+# throw a stone at the BOSS, level 6. A click, at the first tick of a step
+THROW = 8
+BUTTON_NAMES = {LEFT: "left", RIGHT: "right", JUMP: "jump", THROW: "throw"}
+BUTTON_KEYS = {LEFT: arcade.key.LEFT, RIGHT: arcade.key.RIGHT, JUMP: arcade.key.UP}
+
+# the inputs worth trying, level 6 is won by throwing stones
+ACTIONS = [0, LEFT, RIGHT, JUMP, LEFT | JUMP, RIGHT | JUMP]
+BOSS_ACTIONS = ACTIONS + [buttons | THROW for buttons in ACTIONS]
+
+# the status of a step
+PLAYING = "playing"
+DEAD = "dead"
+FINISHED = "finished"
+
+_window = None
+
+
+def get_window():
+    """ the hidden window every headless level of this process shares """
+    global _window
+    if _window is None:
+        _window = arcade.Window(SCREEN_WIDTH, SCREEN_HEIGHT, "headless", visible=False)
+    return _window
+
+
+def buttons_name(buttons):
+    """ 'right+jump' for RIGHT | JUMP, 'none' for 0 """
+    return "+".join(name for bit, name in BUTTON_NAMES.items() if buttons & bit) or "none"
+
+
+def parse_buttons(name):
+    """ the buttons of a buttons_name """
+    bits = {name: bit for bit, name in BUTTON_NAMES.items()}
+    return sum(bits[part] for part in name.split("+") if part != "none")
+
+
+class HeadlessLevel():
+    """ one level, stepped by code """
+
+    def __init__(self, number, seed=0):
+        """ initializer, the level's random numbers start from seed """
+        if number not in LEVELS:
+            raise ValueError(f"there's no level {number}")
+        self.number = number
+        self.seed = seed
+        module = importlib.import_module(f"level{number}")
+        # seeded before the level starts, its snapshot's start state has it
+        random.seed(seed)
+        self.view = getattr(module, f"Level{number}")(get_window())
+        self.view.window.show_view(self.view)
+        # nothing to rewind or race against in a simulation, they'd only cost
+        self.view.recording.rewind = Rewind(self.view.snapshot, seconds=0)
+        self.view.recording.ghost = None
+        camera = self.view.camera_sprites
+        self.view.snapshot.add("camera", lambda: (tuple(camera.position), tuple(camera.goal_position),
+                                                  tuple(camera.shake_offset), tuple(camera.shake_velocity)),
+                               self._set_camera)
+        self.view.snapshot.add_attrs("clock", self.view, ("time",))
+        self.buttons = 0
+        self.ticks = 0
+        self.start_state = self.get_state()
+
+    def _set_camera(self, state):
+        """ put back the camera """
+        camera = self.view.camera_sprites
+        position, goal, shake_offset, shake_velocity = state
+        camera.position = pyglet.math.Vec2(*position)
+        camera.goal_position = pyglet.math.Vec2(*goal)
+        camera.shake_offset = pyglet.math.Vec2(*shake_offset)
+        camera.shake_velocity = pyglet.math.Vec2(*shake_velocity)
+
+    @property
+    def actions(self):
+        """ the inputs worth trying in this level """
+        return BOSS_ACTIONS if self.number == 6 else ACTIONS
+
+    @property
+    def dead(self):
+        """ True once the player died, the level is running its death burst """
+        return self.view.is_resetting
+
+    @property
+    def finished(self):
+        """ True once the door is reached, or the BOSS beaten in level 6 """
+        return not self.view.game_on or getattr(self.view, "boss_defeated", False)
+
+    def press(self, buttons):
+        """ hold buttons from now on, the ones not in it are let go """
+        for bit, key in BUTTON_KEYS.items():
+            if buttons & bit and not self.buttons & bit:
+                self.view.on_key_press(key, 0)
+            elif self.buttons & bit and not buttons & bit:
+                self.view.on_key_release(key, 0)
+        self.buttons = buttons & ~THROW
+        if buttons & THROW:
+            boss = self.view.boss_sprite
+            self.view.on_mouse_press(boss.center_x - self.view.camera_target_x, boss.center_y,
+                                     arcade.MOUSE_BUTTON_LEFT, 0)
+
+    def step(self, buttons, ticks=1):
+        """ hold buttons for some ticks, returns (status, ticks run), it stops early when the player dies or finishes """
+        self.press(buttons)
+        for tick in range(1, ticks + 1):
+            self.view.update(STEP)
+            # the camera moves when it's used to draw
+            self.view.camera_sprites.update()
+            self.ticks += 1
+            if self.dead:
+                return DEAD, tick
+            if self.finished:
+                return FINISHED, tick
+        return PLAYING, ticks
+
+    def progress(self):
+        """ how far along the player is, higher is better: closer to the door, or for level 6 the BOSS more hurt """
+        view = self.view
+        if self.number == 6:
+            # a hurt BOSS first, then stones to throw at it
+            return -view.boss_sprite.health * 100 + view.stone_inventory * 10 + len(view.thrown_stone_list) * 20
+        player = view.player_sprite
+        return -math.hypot(view.door.pos_x - player.center_x, view.door.pos_y - player.center_y)
+
+    def capture(self):
+        """ everything about the level as it is now """
+        return {"level": self.view.snapshot.capture(), "buttons": self.buttons, "ticks": self.ticks}
+
+    def restore(self, state):
+        """ put back a state from capture, or its loads(dumps()) """
+        self.view.is_resetting = False
+        self.view.particle_run = False
+        self.view.snapshot.restore(state["level"])
+        # let go of everything first, a death lets go of the level's keys behind our back
+        for key in BUTTON_KEYS.values():
+            self.view.on_key_release(key, 0)
+        self.buttons = 0
+        self.press(state["buttons"])
+        self.ticks = state["ticks"]
+        # a simulation has no run worth keeping as a ghost
+        self.view.recording.ghost_recorder = GhostRecorder()
+
+    def get_state(self):
+        """ capture() as bytes """
+        return dumps(self.capture())
+
+    def set_state(self, data):
+        """ put back a state from get_state """
+        self.restore(loads(data))
+
+    def reset(self):
+        """ back to the start of the level """
+        self.set_state(self.start_state)
@@ -5,7 +5,17 @@ import math
 import time
 from pyglet.math import Vec2
 
-from modals import MovingWall, Door, EndScreen
+from modals import Door, EndScreen
+from texture_cache import texture_cache, load_texture
+from mapbin import load_tilemap
+from assetpack import load_sound
+from physics import GridPhysicsEnginePlatformer
+from collision import CollisionWorld, HAZARD, TRIGGER
+from scheduler import Scheduler
+from traps import TrapEngine, load_definitions
+from snapshot import Snapshot
+from ghost import encode_anim
+from recording import LevelRecording
 
 
 SCREEN_WIDTH = 1000
@@ -17,6 +27,8 @@ TILE_SCALING = 0.25
 MOVE_SPEED = 3
 JUMP_SPEED = 8
 GRAVITY = 0.6
+# frames between shakes of the earthquake
+EARTHQUAKE_INTERVAL = 20
 
 VIEWPORT_MARGIN = 400
 CAMERA_SPEED = 0.5
@@ -41,24 +53,20 @@ class Level1(arcade.View):
 
         # sprite lists
         self.player_list = None
-        self.bkg_list = None
-        self.background = None
-        self.spike_list = None
         self.door = None
-        self.vis_sprites_list = None
-        self.moving_wall_list = None
+        self.collision_world = None
+        # timed events, in frames
+        self.scheduler = None
+        # the map's walls, spikes and triggers, see data/maps/level1.traps.json
+        self.traps = None
+        # the level's mutable state, and how it was at the start to reset to
+        self.snapshot = None
+        self.start_state = None
+        # the rewind buffer, the ghost and the telemetry stream, see recording.py
+        self.recording = None
+        self.anim_code = encode_anim(0, 0, False)
 
         # specific to the levels
-        self.ceiling_list = None
-        self.trig1_list = None
-        self.gap1_list = None
-        self.trig2_list = None
-        self.spike2_list = None
-        self.trig3_list = None
-        self.gap3_list = None
-        self.trig4_list = None
-        self.trig5_list = None
-        self.gap5_list = None
         self.arrow_sprite = None
         
         # player info
@@ -76,7 +84,7 @@ class Level1(arcade.View):
         self.frames_since_land = 0
         self.was_on_ground = False
         self.jump_sound_ready = True
-        self.jump_sound = arcade.load_sound("data/sounds/jump.wav")
+        self.jump_sound = load_sound("data/sounds/jump.wav")
         
         # CAMERAS
         self.camera_sprites = arcade.Camera(SCREEN_WIDTH, SCREEN_HEIGHT)
@@ -92,7 +100,6 @@ class Level1(arcade.View):
         self.PARTICLE_BURST_TIME = 0.5
         # particle shader
         self.particle_run = False
-        self.frame_cnt = 0
         self.time = 0.0
         self.time_particle_start = 0.0
         file_name = "particles.glsl"
@@ -108,11 +115,10 @@ class Level1(arcade.View):
         arcade.set_background_color((122, 9, 2))
         # sprite lists
         self.player_list = arcade.SpriteList()
-        self.bkg_list = arcade.SpriteList()
         self.player_sprite = arcade.AnimatedTimeBasedSprite()
 
         # set up player animation sprites
-        texture = arcade.load_texture(SPRITE_PATH, 0, 0, 128, 128)
+        texture = texture_cache.load_texture(SPRITE_PATH, 0, 0, 128, 128, scale=SPRITE_SCALING_PLAYER)
         anim = arcade.AnimationKeyframe(1, 10, texture)
         self.player_sprite.frames.append(anim)
         self.player_sprite.scale = SPRITE_SCALING_PLAYER
@@ -124,51 +130,38 @@ class Level1(arcade.View):
 
         # set up the map from Tiled
         map_name = "data/maps/level1.json"
-        self.tile_map = arcade.load_tilemap(map_name, scaling=TILE_SCALING, hit_box_algorithm="Detailed")
+        self.tile_map = load_tilemap(map_name, scaling=TILE_SCALING, hit_box_algorithm="Detailed")
+        texture_cache.enter_level(self.tile_map)
 
-        # sprite_list is from Tiled map layers
         self.door = Door(2100, 180)
-        self.background = self.tile_map.sprite_lists["background"]
-        self.bkg_list = self.tile_map.sprite_lists["bkg"]
-        self.spike_list = self.tile_map.sprite_lists["spikes"]
-        self.arrow_sprite = arcade.Sprite("data/sprites/arrow_left.png", scale=0.25, center_x=2200, center_y=400)
+        self.arrow_sprite = arcade.Sprite(texture=load_texture("data/sprites/arrow_left.png", scale=0.25), scale=0.25, center_x=2200, center_y=400)
         self.arrow_sprite.visible = False
 
-        self.ceiling_list = MovingWall(self.tile_map.sprite_lists["ceiling"], 0.15, 400, 'vertical')
+        # walls, spikes, triggers and what the triggers do come from the map's trap file
+        self.traps = TrapEngine(self.tile_map, load_definitions(map_name, self.tile_map), {"escape": self.escape})
 
-        # Set up triggers and traps
-        self.trig1_list = self.tile_map.sprite_lists["trig1"]
-        self.gap1_list = MovingWall(self.tile_map.sprite_lists["gap1"], 10, 400, 'vertical')
-
-        self.trig2_list = self.tile_map.sprite_lists["trig2"]
-        self.triggered2 = False
-        self.spike2_list = self.tile_map.sprite_lists["spike2"]
-
-        self.trig3_list = self.tile_map.sprite_lists["trig3"]
-        self.gap3_list = MovingWall(self.tile_map.sprite_lists["gap3"], 0.2, 200, 'horizontal')
-
-        self.trig4_list = self.tile_map.sprite_lists["trig4"]
-        self.triggered4 = False
-
-        self.trig5_list = self.tile_map.sprite_lists["trig5"]
-        self.gap5_list = MovingWall(self.tile_map.sprite_lists["gap5"], 10, 400, 'vertical')
-
-        self.moving_wall_list = [self.gap1_list, self.gap3_list, self.gap5_list]
-        self.vis_sprites_list = [self.bkg_list, self.gap1_list.wall_list, self.gap3_list.wall_list, self.gap5_list.wall_list]
+        # everything the player is checked against, in one query per frame
+        self.collision_world = CollisionWorld()
+        self.traps.register(self.collision_world)
 
         # Set the background color to what is specified in the map
         # if self.tile_map.background_color:
         #     arcade.set_background_color(self.tile_map.background_color)
 
         # setup physics engine
-        self.physics_engine = arcade.PhysicsEnginePlatformer(
+        self.physics_engine = GridPhysicsEnginePlatformer(
             self.player_sprite, 
-            self.vis_sprites_list, 
+            self.traps.lists("solid"), 
             GRAVITY)
+
+        self.scheduler = Scheduler(self)
+        self.scheduler.every(EARTHQUAKE_INTERVAL, self.earthquake)
         
         self.game_on = True
+        self.setup_snapshot()
         print("level 1 started")
         self.level_start_time = time.time()
+        self.recording = LevelRecording(self, "level1", SPRITE_PATH, SPRITE_SCALING_PLAYER)
 
 
     def on_draw(self):
@@ -177,16 +170,12 @@ class Level1(arcade.View):
         # select the camera to use before drawing sprites
         self.camera_sprites.use()
 
-        self.background.draw()
+        self.traps.draw_behind()
         self.door.draw()
+        self.recording.draw()
         self.player_list.draw()
         # self.player_list.draw_hit_boxes()
-        self.ceiling_list.wall_list.draw()
-        # draw the sprite lists
-        for sprite_list in self.vis_sprites_list:
-            sprite_list.draw()
-        self.spike_list.draw()
-        self.spike2_list.draw()
+        self.traps.draw()
         self.arrow_sprite.draw()
 
         # Run the GLSL code
@@ -240,6 +229,7 @@ class Level1(arcade.View):
             return
         if not self.game_on:
             return
+        self.recording.on_key_press(key)
         if key == arcade.key.UP or key == arcade.key.SPACE or key == arcade.key.W:
             self.jump_pressed = True
         if key == arcade.key.LEFT or key == arcade.key.A:
@@ -251,6 +241,7 @@ class Level1(arcade.View):
     def on_key_release(self, key, modifiers):
         """Called when the user releases a key. """
 
+        self.recording.on_key_release(key)
         if key == arcade.key.UP or key == arcade.key.SPACE or key == arcade.key.W:
             self.jump_pressed = False
         if key == arcade.key.LEFT or key == arcade.key.A:
@@ -277,7 +268,7 @@ class Level1(arcade.View):
         if self.paused:
             return
         self.time += delta_time
-        self.frame_cnt += 1
+        self.recording.frame(delta_time)
 
         # If we're currently running the reset particle burst, wait until it finishes
         if self.is_resetting:
@@ -287,6 +278,12 @@ class Level1(arcade.View):
             # While the burst is active, do not advance game logic
             return
         
+        # going back in time instead of forward, see recording.py
+        if self.game_on:
+            if self.recording.tick(delta_time):
+                self.scroll_to_player()
+                return
+
         if not self.game_on:
             self.player_sprite.center_x = self.door.pos_x
             self.player_sprite.center_y = self.door.pos_y
@@ -296,26 +293,18 @@ class Level1(arcade.View):
             if self.door.move_over:
                 self.level_complete()
         
-        if not self.ceiling_list.is_moving:
-            self.ceiling_list.start_moving()
+        self.scheduler.advance(1)
 
-        # earthquake
-        # print(self.time % 1)
-        if self.game_on and self.frame_cnt % 20 == 0 and self.time > 0.5:
-            if not self.triggered4:
-                self.earthquake_camera(1.5, 0.4)
-            else:
-                self.earthquake_camera(2.0, 0.9)
+        # where the player was before moving, trap and trigger checks sweep from here
+        player_start = self.player_sprite.position
 
         # Call update on all sprites
         self.door.update()
         self.player_list.update()
         self.player_list.update_animation()
-        for wall_list in self.moving_wall_list:
-            wall_list.update()
         if self.game_on:
+            self.traps.update()
             self.physics_engine.update()
-            self.ceiling_list.update()
         
         # Calculate speed based on the keys pressed, if in air, does not stop immedietly
         self.player_sprite.change_x *= 0.92
@@ -352,8 +341,8 @@ class Level1(arcade.View):
         else:
             self.clear_anim(0, 0)
 
-        spike_hit = arcade.check_for_collision_with_lists(self.player_sprite, [self.spike_list, self.spike2_list, self.ceiling_list.wall_list])
-        if spike_hit:
+        hits = self.collision_world.query(self.player_sprite, player_start)
+        if hits[HAZARD]:
             self.reset()
 
         # out of limit, death
@@ -364,36 +353,7 @@ class Level1(arcade.View):
             return
         
         # trigger traps
-        if not self.gap1_list.triggered:
-            trigger_hit = arcade.check_for_collision_with_list(self.player_sprite, self.trig1_list)
-            if trigger_hit:
-                self.gap1_list.start_moving()
-
-        if not self.triggered2:
-            trigger_hit = arcade.check_for_collision_with_list(self.player_sprite, self.trig2_list)
-            if trigger_hit:
-                self.triggered2 = True
-                self.spike2_list.visible = True
-
-        if not self.gap3_list.triggered:
-            trigger_hit = arcade.check_for_collision_with_list(self.player_sprite, self.trig3_list)
-            if trigger_hit:
-                self.gap3_list.start_moving()
-        
-        if not self.triggered4:
-            trigger_hit = arcade.check_for_collision_with_list(self.player_sprite, self.trig4_list)
-            if trigger_hit:
-                self.triggered4 = True
-                print("trig4 touched")
-                # door moves, ceiling comes down faster
-                self.door.start_moving_right(5, 300)
-                self.ceiling_list.move_speed = 0.4
-                self.arrow_sprite.visible = True
-
-        if self.triggered4 and not self.gap5_list.triggered:
-            trigger_hit = arcade.check_for_collision_with_list(self.player_sprite, self.trig5_list)
-            if trigger_hit:
-                self.gap5_list.start_moving()
+        self.traps.fire(hits[TRIGGER])
 
         # check if touched the door
         collided_w_door = self.door.check_collision(self.player_sprite.left, self.player_sprite.right, self.player_sprite.bottom)
@@ -409,6 +369,7 @@ class Level1(arcade.View):
         """
         resets the scene after death
         """
+        self.recording.died()
         # Start the particle burst and freeze the game; the actual reset will occur in finish_reset() after the burst duration elapses.
         # Set uniform data to send to the GLSL shader
         # Convert world position to screen (camera) coordinates so shader lines up with what the player sees.
@@ -446,20 +407,23 @@ class Level1(arcade.View):
         self.is_resetting = False
         self.death += 1
 
-        # reset moving parts
-        self.door.reset()
-        self.ceiling_list.reset()
-        for wall_list in self.moving_wall_list:
-            if wall_list.triggered:
-                wall_list.reset()
-        self.triggered2 = False
-        self.triggered4 = False
-        self.spike2_list.visible = False
-        self.arrow_sprite.visible = False
-
-        self.player_sprite.center_x = START_POS[0]
-        self.player_sprite.center_y = START_POS[1]
-        self.player_list.visible = True
+        # everything back the way the level started, the random numbers keep going
+        self.snapshot.restore(self.start_state, skip=("random",))
+        # a new try, recorded and raced against the ghost from its start
+        self.recording.restart()
+
+    def setup_snapshot(self):
+        """ register where the level keeps its state, see snapshot.py, and capture the start """
+        self.snapshot = Snapshot()
+        self.snapshot.add_sprite("player", self.player_sprite)
+        self.snapshot.add_attrs("player_list", self.player_list, ("visible",))
+        self.snapshot.add_attrs("level", self, ("game_on", "frames_since_land", "was_on_ground", "jump_sound_ready"))
+        self.snapshot.add_object("door", self.door)
+        self.snapshot.add_object("traps", self.traps)
+        self.snapshot.add_attrs("arrow", self.arrow_sprite, ("visible",))
+        self.snapshot.add_object("scheduler", self.scheduler)
+        self.snapshot.add_random()
+        self.start_state = self.snapshot.capture()
 
     
     def game_over(self):
@@ -473,6 +437,21 @@ class Level1(arcade.View):
         self.shake_camera()
 
     
+    def escape(self):
+        """ trig4: the door runs away, the ceiling comes down faster (set in the trap file) """
+        print("trig4 touched")
+        self.door.start_moving_right(5, 300)
+        self.arrow_sprite.visible = True
+
+    def earthquake(self):
+        """ the ground shakes all level long, harder once the fourth trap went off """
+        if not self.game_on or self.time <= 0.5:
+            return
+        if not self.traps.has_fired("trig4"):
+            self.earthquake_camera(1.5, 0.4)
+        else:
+            self.earthquake_camera(2.0, 0.9)
+
     def earthquake_camera(self, magnitude, shake_damping):
         """ Shake the camera constantly """
         
@@ -543,9 +522,10 @@ class Level1(arcade.View):
 
     def set_anim(self, y):
         """ set up walking animation, input y in the sprite sheet """
+        self.anim_code = encode_anim(0, y, True)
         self.player_sprite.frames.clear()
         for i in range(4):
-            texture = arcade.load_texture(SPRITE_PATH, i * 128, y, 128, 128)
+            texture = load_texture(SPRITE_PATH, i * 128, y, 128, 128, scale=SPRITE_SCALING_PLAYER)
             # frame i, speed 50ms per frame
             anim = arcade.AnimationKeyframe(i, 50, texture)
             self.player_sprite.frames.append(anim)
@@ -553,9 +533,10 @@ class Level1(arcade.View):
 
     def clear_anim(self, x, y):
         """ clear animation to a static texture, input x,y in the sprite sheet """
+        self.anim_code = encode_anim(x, y, False)
         self.player_sprite.frames.clear()
         for i in range(4):
-            texture = arcade.load_texture(SPRITE_PATH, x, y, 128, 128)
+            texture = load_texture(SPRITE_PATH, x, y, 128, 128, scale=SPRITE_SCALING_PLAYER)
             # frame i, speed 10ms per frame
             anim = arcade.AnimationKeyframe(i, 10, texture)
             self.player_sprite.frames.append(anim)
@@ -563,6 +544,7 @@ class Level1(arcade.View):
     def level_complete(self):
         self.door.move_over = False
         self.shake_camera()
+        self.recording.complete()
         elapsed = time.time() - self.level_start_time
         attempts = self.death + 1
         from level2 import Level2
@@ -5,7 +5,17 @@ import math
 import time
 from pyglet.math import Vec2
 
-from modals import MovingWall, Door, Button, EndScreen
+from modals import Door, Button, EndScreen
+from texture_cache import texture_cache, load_texture
+from mapbin import load_tilemap
+from assetpack import load_sound
+from physics import GridPhysicsEnginePlatformer
+from collision import CollisionWorld, HAZARD, TRIGGER
+from scheduler import Scheduler
+from traps import TrapEngine, load_definitions
+from snapshot import Snapshot
+from ghost import encode_anim
+from recording import LevelRecording
 
 # constants
 SPRITE_SCALING_PLAYER = 0.25
@@ -13,6 +23,11 @@ TILE_SCALING = 0.25
 MOVE_SPEED = 3
 JUMP_SPEED = 8
 GRAVITY = 0.6
+# frames between the real spikes going in and out, and before the first time
+SPIKE_INTERVAL = 100
+SPIKE_DELAY = 20
+# frames the inverted controls text stays up
+INVERTED_TEXT_FRAMES = 150
 
 SCREEN_WIDTH = 1000
 SCREEN_HEIGHT = 600
@@ -44,24 +59,23 @@ class Level2(arcade.View):
 
         # sprite lists
         self.player_list = None
-        self.platform_list = None
-        self.background = None
-        self.spike_list = None
         self.door = None
-        self.vis_sprites_list = None
-        self.moving_wall_list = None
-
-        # specific to the levels
-        self.trig1_list = None
-        self.gap1_list = None
-        self.trig2_list = None
-        self.gap2_list = None
-        self.trig3_list = None
-        self.gap3_list = None
+        self.collision_world = None
+        # timed events, in frames
+        self.scheduler = None
+        # the map's walls, spikes and triggers, see data/maps/level2.traps.json
+        self.traps = None
+        # the level's mutable state, and how it was at the start to reset to
+        self.snapshot = None
+        self.start_state = None
+        # the rewind buffer, the ghost and the telemetry stream, see recording.py
+        self.recording = None
+        self.anim_code = encode_anim(0, 0, False)
+
+        # specific to the levels, the spikes the rhythm switches
         self.realspike_list = None
         self.fakespike_list = None
         self.fakerealspike_list = None
-        self.fakeplatform_list = None
         self.button1 = None
         self.button1on = False
         self.realspike_on = True
@@ -84,7 +98,7 @@ class Level2(arcade.View):
         self.frames_since_land = 0
         self.was_on_ground = False
         self.jump_sound_ready = True
-        self.jump_sound = arcade.load_sound("data/sounds/jump.wav")
+        self.jump_sound = load_sound("data/sounds/jump.wav")
         
         # CAMERAS
         self.camera_sprites = arcade.Camera(SCREEN_WIDTH, SCREEN_HEIGHT)
@@ -100,7 +114,6 @@ class Level2(arcade.View):
         self.PARTICLE_BURST_TIME = 0.5
         # particle shader
         self.particle_run = False
-        self.frame_cnt = 0
         self.time = 0.0
         self.time_particle_start = 0.0
         file_name = "particles.glsl"
@@ -115,11 +128,10 @@ class Level2(arcade.View):
         arcade.set_background_color((163, 100, 222))
         # sprite lists
         self.player_list = arcade.SpriteList()
-        self.platform_list = arcade.SpriteList()
         self.player_sprite = arcade.AnimatedTimeBasedSprite()
 
         # set up player animation sprites
-        texture = arcade.load_texture(SPRITE_PATH, 0, 0, 128, 128)
+        texture = texture_cache.load_texture(SPRITE_PATH, 0, 0, 128, 128, scale=SPRITE_SCALING_PLAYER)
         anim = arcade.AnimationKeyframe(1, 10, texture)
         self.player_sprite.frames.append(anim)
         self.player_sprite.scale = SPRITE_SCALING_PLAYER
@@ -131,41 +143,40 @@ class Level2(arcade.View):
 
         # set up the map from Tiled
         map_name = "data/maps/level2.json"
-        self.tile_map = arcade.load_tilemap(map_name, scaling=TILE_SCALING, hit_box_algorithm="Detailed")
+        self.tile_map = load_tilemap(map_name, scaling=TILE_SCALING, hit_box_algorithm="Detailed")
+        texture_cache.enter_level(self.tile_map)
 
         # sprite_list is from Tiled map layers
         self.door = Door(2620, 310)
-        self.background = self.tile_map.sprite_lists["background"]
-        self.platform_list = self.tile_map.sprite_lists["platforms"]
-        self.spike_list = self.tile_map.sprite_lists["spikes"]
+        # walls, spikes, triggers and what the triggers do come from the map's trap file
+        self.traps = TrapEngine(self.tile_map, load_definitions(map_name, self.tile_map))
+        # the spikes the rhythm switches stay the level's
         self.realspike_list = self.tile_map.sprite_lists["realspike"]
         self.fakespike_list = self.tile_map.sprite_lists["fakespike"]
         self.fakerealspike_list = self.tile_map.sprite_lists["fakerealspike"]
-        self.fakeplatform_list = self.tile_map.sprite_lists["fakeplatform"]
-
-        # Set up triggers and traps
-        self.trig1_list = self.tile_map.sprite_lists["trig1"]
-        self.gap1_list = MovingWall(self.tile_map.sprite_lists["gap1"], 8, 400, 'vertical')
-
-        self.trig2_list = self.tile_map.sprite_lists["trig2"]
-        self.gap2_list = MovingWall(self.tile_map.sprite_lists["gap2"], 8, 400, 'vertical')
-
-        self.trig3_list = self.tile_map.sprite_lists["trig3"]
-        self.gap3_list = MovingWall(self.tile_map.sprite_lists["gap3"], 6, 96, 'horizontal', True, self.player_sprite)
 
         self.button1 = Button(982, 450)
 
-        self.moving_wall_list = [self.gap1_list, self.gap2_list, self.gap3_list]
-        self.vis_sprites_list = [self.platform_list, self.gap1_list.wall_list, self.gap2_list.wall_list, self.gap3_list.wall_list]
+        # everything the player is checked against, in one query per frame
+        self.collision_world = CollisionWorld()
+        self.traps.register(self.collision_world)
+        self.collision_world.add_layer("fakerealspike", self.fakerealspike_list, HAZARD)
+        self.collision_world.add_layer("realspike", self.realspike_list, HAZARD)
+        self.collision_world.add_layer("button1", self.button1.sprite_list, TRIGGER)
 
         # setup physics engine
-        self.physics_engine = arcade.PhysicsEnginePlatformer(
+        self.physics_engine = GridPhysicsEnginePlatformer(
             self.player_sprite, 
-            self.vis_sprites_list, 
+            self.traps.lists("solid"), 
             GRAVITY)
+
+        self.scheduler = Scheduler(self)
+        self.set_realspike(True)
         
         self.game_on = True
+        self.setup_snapshot()
         self.level_start_time = time.time()
+        self.recording = LevelRecording(self, "level2", SPRITE_PATH, SPRITE_SCALING_PLAYER)
 
 
     def on_draw(self):
@@ -174,19 +185,16 @@ class Level2(arcade.View):
         # select the camera to use before drawing sprites
         self.camera_sprites.use()
 
-        self.background.draw()
+        self.traps.draw_behind()
         self.door.draw()
         self.button1.draw()
-        self.spike_list.draw()
         self.realspike_list.draw()
         self.fakespike_list.draw()
         self.fakerealspike_list.draw()
-        self.fakeplatform_list.draw()
+        self.recording.draw()
         self.player_list.draw()
         # self.player_list.draw_hit_boxes()
-        # draw the sprite lists
-        for sprite_list in self.vis_sprites_list:
-            sprite_list.draw()
+        self.traps.draw()
 
         # Run the GLSL code
         if self.particle_run:
@@ -242,6 +250,7 @@ class Level2(arcade.View):
             return
         if not self.game_on:
             return
+        self.recording.on_key_press(key)
         if key == arcade.key.UP or key == arcade.key.SPACE or key == arcade.key.W:
             self.jump_pressed = True
         if key == arcade.key.LEFT or key == arcade.key.A:
@@ -253,6 +262,7 @@ class Level2(arcade.View):
     def on_key_release(self, key, modifiers):
         """Called when the user releases a key. """
 
+        self.recording.on_key_release(key)
         if key == arcade.key.UP or key == arcade.key.SPACE or key == arcade.key.W:
             self.jump_pressed = False
         if key == arcade.key.LEFT or key == arcade.key.A:
@@ -279,7 +289,7 @@ class Level2(arcade.View):
         if self.paused:
             return
         self.time += delta_time
-        self.frame_cnt += 1
+        self.recording.frame(delta_time)
 
         # If we're currently running the reset particle burst, wait until it finishes
         if self.is_resetting:
@@ -289,6 +299,12 @@ class Level2(arcade.View):
             # While the burst is active, do not advance game logic
             return
         
+        # going back in time instead of forward, see recording.py
+        if self.game_on:
+            if self.recording.tick(delta_time):
+                self.update_camera_pos()
+                return
+
         if not self.game_on:
             self.player_sprite.center_x = self.door.pos_x
             self.player_sprite.center_y = self.door.pos_y
@@ -298,23 +314,24 @@ class Level2(arcade.View):
             if self.door.move_over:
                 self.level_complete()
 
+        # where the player was before moving, trap and trigger checks sweep from here
+        player_start = self.player_sprite.position
+
         # Call update on all sprites
         self.door.update()
         self.player_list.update()
         self.player_list.update_animation()
-        for wall_list in self.moving_wall_list:
-            wall_list.update()
+        self.traps.update()
         if self.game_on:
             self.physics_engine.update()
+            # the spike rhythm and the timers stop with the level
+            self.scheduler.advance(1)
         
         if self.stage == 3 and abs(self.camera_sprites.position.x - CAMERA_POS[3].x) < 10 and not self.control_inverted:
             self.shake_camera()
             self.control_inverted = True
             self.inverted_text_on = True
-            self.frame_cnt = 0
-        
-        if self.inverted_text_on and self.frame_cnt > 150:
-            self.inverted_text_on = False
+            self.scheduler.after(INVERTED_TEXT_FRAMES, self.hide_inverted_text)
 
         # Calculate speed based on the keys pressed, if in air, does not stop immedietly
         self.player_sprite.change_x *= 0.92
@@ -361,28 +378,9 @@ class Level2(arcade.View):
         if not self.game_on:
             return
         
-        # spike rhythm part
-        if self.button1on:
-            if self.frame_cnt % 100 == 0:
-                if self.realspike_on == True:
-                    self.realspike_list.visible = False
-                    self.fakespike_list.alpha = 120
-                    self.realspike_on = False
-                    self.shake_camera()
-                else:
-                    self.realspike_list.visible = True
-                    self.realspike_on = True
-                    self.fakespike_list.alpha = 255
-                    self.shake_camera()
-        
-        spike_hit = arcade.check_for_collision_with_lists(self.player_sprite, [self.spike_list, self.fakerealspike_list])
-        if spike_hit:
+        hits = self.collision_world.query(self.player_sprite, player_start)
+        if hits[HAZARD]:
             self.reset()
-        
-        if self.realspike_on:
-            spike_hit = arcade.check_for_collision_with_list(self.player_sprite, self.realspike_list)
-            if spike_hit:
-                self.reset()
 
         # out of limit, death
         if self.player_sprite.center_y < 180:
@@ -397,28 +395,14 @@ class Level2(arcade.View):
                 self.game_over()
             
         # trigger traps
-        if self.stage == 1:
-            if not self.gap1_list.triggered:
-                trigger_hit = arcade.check_for_collision_with_list(self.player_sprite, self.trig1_list)
-                if trigger_hit:
-                    self.gap1_list.start_moving()
-
-            if not self.gap2_list.triggered:
-                trigger_hit = arcade.check_for_collision_with_list(self.player_sprite, self.trig2_list)
-                if trigger_hit:
-                    self.gap2_list.start_moving()
-
-            if not self.gap3_list.triggered:
-                trigger_hit = arcade.check_for_collision_with_list(self.player_sprite, self.trig3_list)
-                if trigger_hit:
-                    self.gap3_list.start_moving()
+        self.traps.fire(hits[TRIGGER])
 
         if self.stage == 2:
-            trigger_hit = arcade.check_for_collision_with_list(self.player_sprite, self.button1.sprite_list)
+            trigger_hit = "button1" in hits[TRIGGER]
             if not self.button1.triggered and trigger_hit:
                 self.button1.touched()
                 self.button1on = True
-                self.frame_cnt = -20
+                self.start_spike_rhythm()
             elif self.button1.triggered and not trigger_hit:
                 self.button1.reset()
 
@@ -433,7 +417,9 @@ class Level2(arcade.View):
             self.stage = 3
             self.update_camera_pos()
             self.button1on = False
+            self.stop_spike_rhythm()
             self.realspike_list.visible = True
+            self.realspike_list.collidable = True
             self.realspike_on = True
         # Scroll the screen to the player
         # self.scroll_to_player()
@@ -442,6 +428,7 @@ class Level2(arcade.View):
         """
         resets the scene after death
         """
+        self.recording.died()
         # Start the particle burst and freeze the game; the actual reset will occur in finish_reset() after the burst duration elapses.
         # Set uniform data to send to the GLSL shader
         # Convert world position to screen (camera) coordinates so shader lines up with what the player sees.
@@ -472,31 +459,66 @@ class Level2(arcade.View):
         self.player_list.visible = False
 
         self.button1on = False
-        self.realspike_list.visible = True
-        self.realspike_on = True
-        self.fakespike_list.alpha = 255
+        self.set_realspike(True)
         self.control_inverted = False
         self.inverted_text_on = False
+        self.scheduler.cancel_all()
         arcade.print_timings()
 
+    def start_spike_rhythm(self):
+        """ (re)start the real spikes going in and out """
+        self.stop_spike_rhythm()
+        self.scheduler.every(SPIKE_INTERVAL, self.toggle_realspike, SPIKE_DELAY)
+
+    def stop_spike_rhythm(self):
+        """ stop the real spikes where they are """
+        self.scheduler.cancel("toggle_realspike")
+
+    def toggle_realspike(self):
+        """ the real spikes go in if they're out, come out if they're in """
+        self.set_realspike(not self.realspike_on)
+        self.shake_camera()
+
+    def set_realspike(self, on):
+        """ real spikes out (they hurt) or in, the fake ones fade while they're in. Whole-layer flags, no per-sprite work """
+        self.realspike_on = on
+        self.realspike_list.visible = on
+        # the real spikes only hurt once they're out
+        self.realspike_list.collidable = on
+        self.fakespike_list.alpha = 255 if on else 120
+
+    def hide_inverted_text(self):
+        """ take the inverted controls text down """
+        self.inverted_text_on = False
+
     def finish_reset(self):
         """Complete the reset after the particle burst has finished."""
         # stop rendering particles
         self.particle_run = False
         self.is_resetting = False
         self.death += 1
-        self.stage = 1
-        self.update_camera_pos()
 
-        # reset moving parts
-        self.door.reset()
-        for wall_list in self.moving_wall_list:
-            if wall_list.triggered:
-                wall_list.reset()
+        # everything back the way the level started, the random numbers keep going
+        self.snapshot.restore(self.start_state, skip=("random",))
+        # a new try, recorded and raced against the ghost from its start
+        self.recording.restart()
+        self.update_camera_pos()
 
-        self.player_sprite.center_x = START_POS[0]
-        self.player_sprite.center_y = START_POS[1]
-        self.player_list.visible = True
+    def setup_snapshot(self):
+        """ register where the level keeps its state, see snapshot.py, and capture the start """
+        self.snapshot = Snapshot()
+        self.snapshot.add_sprite("player", self.player_sprite)
+        self.snapshot.add_attrs("player_list", self.player_list, ("visible",))
+        self.snapshot.add_attrs("level", self, ("game_on", "stage", "button1on", "realspike_on", "control_inverted",
+                                                "inverted_text_on", "frames_since_land", "was_on_ground", "jump_sound_ready"))
+        self.snapshot.add_object("door", self.door)
+        self.snapshot.add_object("traps", self.traps)
+        self.snapshot.add_object("button1", self.button1)
+        self.snapshot.add_attrs("realspike", self.realspike_list, ("visible", "collidable"))
+        self.snapshot.add_attrs("fakespike", self.fakespike_list, ("alpha",))
+        self.snapshot.add_object("scheduler", self.scheduler)
+        self.snapshot.add_random()
+        self.start_state = self.snapshot.capture()
 
     
     def game_over(self):
@@ -561,9 +583,10 @@ class Level2(arcade.View):
 
     def set_anim(self, y):
         """ set up walking animation, input y in the sprite sheet """
+        self.anim_code = encode_anim(0, y, True)
         self.player_sprite.frames.clear()
         for i in range(4):
-            texture = arcade.load_texture(SPRITE_PATH, i * 128, y, 128, 128)
+            texture = load_texture(SPRITE_PATH, i * 128, y, 128, 128, scale=SPRITE_SCALING_PLAYER)
             # frame i, speed 50ms per frame
             anim = arcade.AnimationKeyframe(i, 50, texture)
             self.player_sprite.frames.append(anim)
@@ -571,9 +594,10 @@ class Level2(arcade.View):
 
     def clear_anim(self, x, y):
         """ clear animation to a static texture, input x,y in the sprite sheet """
+        self.anim_code = encode_anim(x, y, False)
         self.player_sprite.frames.clear()
         for i in range(4):
-            texture = arcade.load_texture(SPRITE_PATH, x, y, 128, 128)
+            texture = load_texture(SPRITE_PATH, x, y, 128, 128, scale=SPRITE_SCALING_PLAYER)
             # frame i, speed 10ms per frame
             anim = arcade.AnimationKeyframe(i, 10, texture)
             self.player_sprite.frames.append(anim)
@@ -581,6 +605,7 @@ class Level2(arcade.View):
     def level_complete(self):
         self.door.move_over = False
         self.shake_camera()
+        self.recording.complete()
         elapsed = time.time() - self.level_start_time
         attempts = self.death + 1
         from level3 import Level3
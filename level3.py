@@ -5,7 +5,17 @@ import math
 import time
 from pyglet.math import Vec2
 
-from modals import MovingWall, Door, Button, EndScreen
+from modals import Door, Button, EndScreen
+from texture_cache import texture_cache, load_texture
+from mapbin import load_tilemap
+from assetpack import load_sound
+from physics import GridPhysicsEnginePlatformer
+from collision import CollisionWorld, HAZARD, TRIGGER, PUSHER
+from scheduler import Scheduler
+from traps import TrapEngine, load_definitions
+from snapshot import Snapshot
+from ghost import encode_anim
+from recording import LevelRecording
 
 # constants
 SPRITE_SCALING_PLAYER = 0.25
@@ -14,6 +24,10 @@ MOVE_SPEED = 3
 JUMP_SPEED = 15
 JUMP_SPEED_2 = 5
 GRAVITY = 0.3
+# frames from the button to the first wall moving
+WALL1_DELAY = 10
+# frames from platforms 3 and 4 moving to platform 5 moving
+PLATFORM5_DELAY = 5 * 60
 
 SCREEN_WIDTH = 1000
 SCREEN_HEIGHT = 600
@@ -43,23 +57,22 @@ class Level3(arcade.View):
 
         # sprite lists
         self.player_list = None
-        self.platform_list = None
-        self.background = None
-        self.spike_list = None
         self.door = None
-        self.vis_sprites_list = None
-        self.moving_wall_list = None
+        self.collision_world = None
+        # timed events, in frames
+        self.scheduler = None
+        # the map's walls, spikes and triggers, see data/maps/level3.traps.json
+        self.traps = None
+        # the level's mutable state, and how it was at the start to reset to
+        self.snapshot = None
+        self.start_state = None
+        # the rewind buffer, the ghost and the telemetry stream, see recording.py
+        self.recording = None
+        self.anim_code = encode_anim(0, 0, False)
 
         # specific to the levels
-        self.ceiling_list = None
-        self.wall1_list = None
         self.button1 = None
         self.button1on = False
-        self.trig2_list = None
-        self.platform2_list = None
-        self.platform3_list = None
-        self.platform4_list = None
-        self.platform5_list = None
         
         # player info
         self.death = 0
@@ -77,9 +90,7 @@ class Level3(arcade.View):
         self.frames_since_land = 0
         self.was_on_ground = False
         self.jump_sound_ready = True
-        self.jump_sound = arcade.load_sound("data/sounds/jump.wav")
-        self.player_on_platform = False
-        self.platform_speed = 0
+        self.jump_sound = load_sound("data/sounds/jump.wav")
         
         # CAMERAS
         self.camera_sprites = arcade.Camera(SCREEN_WIDTH, SCREEN_HEIGHT)
@@ -95,7 +106,6 @@ class Level3(arcade.View):
         self.PARTICLE_BURST_TIME = 0.5
         # particle shader
         self.particle_run = False
-        self.frame_cnt = 0
         self.time = 0.0
         self.time_particle_start = 0.0
         file_name = "particles.glsl"
@@ -110,11 +120,10 @@ class Level3(arcade.View):
         arcade.set_background_color((122, 9, 2))
         # sprite lists
         self.player_list = arcade.SpriteList()
-        self.platform_list = arcade.SpriteList()
         self.player_sprite = arcade.AnimatedTimeBasedSprite()
 
         # set up player animation sprites
-        texture = arcade.load_texture(SPRITE_PATH, 0, 0, 128, 128)
+        texture = texture_cache.load_texture(SPRITE_PATH, 0, 0, 128, 128, scale=SPRITE_SCALING_PLAYER)
         anim = arcade.AnimationKeyframe(1, 10, texture)
         self.player_sprite.frames.append(anim)
         self.player_sprite.scale = SPRITE_SCALING_PLAYER
@@ -126,36 +135,34 @@ class Level3(arcade.View):
 
         # set up the map from Tiled
         map_name = "data/maps/level3.json"
-        self.tile_map = arcade.load_tilemap(map_name, scaling=TILE_SCALING, hit_box_algorithm="Detailed")
+        self.tile_map = load_tilemap(map_name, scaling=TILE_SCALING, hit_box_algorithm="Detailed")
+        texture_cache.enter_level(self.tile_map)
 
         # sprite_list is from Tiled map layers
         self.door = Door(2380, 115)
-        self.background = self.tile_map.sprite_lists["background"]
-        self.platform_list = self.tile_map.sprite_lists["platforms"]
-        self.spike_list = self.tile_map.sprite_lists["spikes"]
-        self.ceiling_list = self.tile_map.sprite_lists["ceiling"]
-
-        # Set up triggers and traps
-        self.wall1_list = MovingWall(self.tile_map.sprite_lists["wall1"], -20, 160, 'horizontal')
-        self.trig2_list = self.tile_map.sprite_lists["trig2"]
-        self.platform2_list = MovingWall(self.tile_map.sprite_lists["platform2"], -5, 96, 'horizontal', True, self.player_sprite)
-        self.platform3_list = MovingWall(self.tile_map.sprite_lists["platform3"], -2.5, 640, 'horizontal', True, self.player_sprite, True)
-        self.platform4_list = MovingWall(self.tile_map.sprite_lists["platform4"], 2.5, 1024, 'horizontal', True, self.player_sprite, True)
-        self.platform5_list = MovingWall(self.tile_map.sprite_lists["platform5"], -1.5, 1024, 'horizontal', True, self.player_sprite, False, False)
+        # walls, spikes, triggers and what the triggers do come from the map's trap file,
+        # the walls set off by the button and by how far the player got are started below
+        self.traps = TrapEngine(self.tile_map, load_definitions(map_name, self.tile_map))
 
         self.button1 = Button(200, 110, False)
 
-        self.moving_wall_list = [self.wall1_list, self.platform2_list, self.platform3_list, self.platform4_list, self.platform5_list]
-        self.vis_sprites_list = [self.platform_list, self.platform2_list.wall_list, self.platform3_list.wall_list, self.platform4_list.wall_list, self.platform5_list.wall_list]
+        # everything the player is checked against, in one query per frame
+        self.collision_world = CollisionWorld()
+        self.traps.register(self.collision_world)
+        self.collision_world.add_layer("button1", self.button1.sprite_list, TRIGGER)
 
         # setup physics engine
-        self.physics_engine = arcade.PhysicsEnginePlatformer(
+        self.physics_engine = GridPhysicsEnginePlatformer(
             self.player_sprite, 
-            self.vis_sprites_list, 
+            self.traps.lists("solid"), 
             GRAVITY)
+
+        self.scheduler = Scheduler(self)
         
         self.game_on = True
+        self.setup_snapshot()
         self.level_start_time = time.time()
+        self.recording = LevelRecording(self, "level3", SPRITE_PATH, SPRITE_SCALING_PLAYER)
 
 
     def on_draw(self):
@@ -164,17 +171,13 @@ class Level3(arcade.View):
         # select the camera to use before drawing sprites
         self.camera_sprites.use()
 
-        self.background.draw()
+        self.traps.draw_behind()
         self.door.draw()
         self.button1.draw()
-        self.spike_list.draw()
+        self.recording.draw()
         self.player_list.draw()
-        self.wall1_list.wall_list.draw()
-        self.ceiling_list.draw()
         # self.player_list.draw_hit_boxes()
-        # draw the sprite lists
-        for sprite_list in self.vis_sprites_list:
-            sprite_list.draw()
+        self.traps.draw()
 
         # Run the GLSL code
         if self.particle_run:
@@ -227,6 +230,7 @@ class Level3(arcade.View):
             return
         if not self.game_on:
             return
+        self.recording.on_key_press(key)
         if key == arcade.key.UP or key == arcade.key.SPACE or key == arcade.key.W:
             self.jump_pressed = True
         if key == arcade.key.LEFT or key == arcade.key.A:
@@ -238,6 +242,7 @@ class Level3(arcade.View):
     def on_key_release(self, key, modifiers):
         """Called when the user releases a key. """
 
+        self.recording.on_key_release(key)
         if key == arcade.key.UP or key == arcade.key.SPACE or key == arcade.key.W:
             self.jump_pressed = False
         if key == arcade.key.LEFT or key == arcade.key.A:
@@ -264,8 +269,7 @@ class Level3(arcade.View):
         if self.paused:
             return
         self.time += delta_time
-        self.frame_cnt += 1
-        self.player_on_platform = False
+        self.recording.frame(delta_time)
 
         # If we're currently running the reset particle burst, wait until it finishes
         if self.is_resetting:
@@ -275,6 +279,12 @@ class Level3(arcade.View):
             # While the burst is active, do not advance game logic
             return
         
+        # going back in time instead of forward, see recording.py
+        if self.game_on:
+            if self.recording.tick(delta_time):
+                self.update_camera_pos()
+                return
+
         if not self.game_on:
             self.player_sprite.center_x = self.door.pos_x
             self.player_sprite.center_y = self.door.pos_y
@@ -284,16 +294,14 @@ class Level3(arcade.View):
             if self.door.move_over:
                 self.level_complete()
 
+        # where the player was before moving, trap and trigger checks sweep from here
+        player_start = self.player_sprite.position
+
         # Call update on all sprites
         self.door.update()
         self.player_list.update()
         self.player_list.update_animation()
-        for wall_list in self.moving_wall_list:
-            wall_list.update()
-            if wall_list.player_on_platform:
-                self.player_on_platform = True
-                self.platform_speed = -wall_list.move_speed/2
-                
+        self.traps.update()
         if self.game_on:
             self.physics_engine.update()
         
@@ -320,63 +328,53 @@ class Level3(arcade.View):
 
         MOVE_SPEED = 3 if self.stage == 1 else 2
         if self.left_pressed and not self.right_pressed:
-            self.player_sprite.change_x = -MOVE_SPEED if self.player_on_platform == False else self.platform_speed - MOVE_SPEED
+            self.player_sprite.change_x = -MOVE_SPEED
             self.set_anim(256)
         elif self.right_pressed and not self.left_pressed:
-            self.player_sprite.change_x = MOVE_SPEED if self.player_on_platform == False else self.platform_speed + MOVE_SPEED
+            self.player_sprite.change_x = MOVE_SPEED
             self.set_anim(384)
         else:
-            if self.player_on_platform:
-                self.player_sprite.change_x = self.platform_speed
             self.clear_anim(0, 0)
                 
+        hits = self.collision_world.query(self.player_sprite, player_start)
+
         # first moving wall overwrites the movement
-        trigger_hit = arcade.check_for_collision_with_list(self.player_sprite, self.wall1_list.wall_list)
-        if trigger_hit:
-            self.player_sprite.change_x = -self.wall1_list.move_speed
+        if "wall1" in hits[PUSHER]:
+            self.player_sprite.change_x = -self.traps.walls["wall1"].move_speed
             if self.jump_pressed:
                 self.player_sprite.change_y = JUMP_SPEED
                 self._play_jump_sound()
 
-        trigger_hit = arcade.check_for_collision_with_list(self.player_sprite, self.ceiling_list)
-        if trigger_hit:
+        if "ceiling" in hits[PUSHER]:
             self.player_sprite.change_x = 1
             self.player_sprite.change_y = -4
 
         if not self.game_on:
             return
         
-        spike_hit = arcade.check_for_collision_with_list(self.player_sprite, self.spike_list)
-        if spike_hit:
+        if hits[HAZARD]:
             self.reset()
         
         # out of limit, death
         if self.player_sprite.center_y < 0:
             self.reset()
             
-        trigger_hit = arcade.check_for_collision_with_list(self.player_sprite, self.button1.sprite_list)
+        self.scheduler.advance(1)
+
+        trigger_hit = "button1" in hits[TRIGGER]
         if not self.button1.triggered and trigger_hit:
             self.button1.touched()
             self.button1on = True
-            self.frame_cnt = 0
+            self.scheduler.after(WALL1_DELAY, self.start_wall1)
         elif self.button1.triggered and not trigger_hit:
             self.button1.reset()
-
-        if not self.wall1_list.triggered and self.button1on and self.frame_cnt == 10:
-            self.wall1_list.start_moving()
         
-        if not self.platform2_list.triggered:
-            trigger_hit = arcade.check_for_collision_with_list(self.player_sprite, self.trig2_list)
-            if trigger_hit:
-                self.platform2_list.start_moving()
-        
-        if not self.platform3_list.triggered and self.player_sprite.center_x > 1060:
-            self.platform3_list.start_moving()
-            self.platform4_list.start_moving()
-            self.frame_cnt = 0
-        
-        if self.platform4_list.triggered and self.frame_cnt == 5 * 60:
-            self.platform5_list.start_moving()
+        self.traps.fire(hits[TRIGGER])
+
+        if not self.traps.walls["platform3"].triggered and self.player_sprite.center_x > 1060:
+            self.traps.walls["platform3"].start_moving()
+            self.traps.walls["platform4"].start_moving()
+            self.scheduler.after(PLATFORM5_DELAY, self.start_platform5)
         
         collided_w_door = self.door.check_collision(self.player_sprite.left, self.player_sprite.right, self.player_sprite.bottom)
         if collided_w_door:
@@ -399,6 +397,7 @@ class Level3(arcade.View):
         """
         resets the scene after death
         """
+        self.recording.died()
         # Start the particle burst and freeze the game; the actual reset will occur in finish_reset() after the burst duration elapses.
         # Set uniform data to send to the GLSL shader
         # Convert world position to screen (camera) coordinates so shader lines up with what the player sees.
@@ -429,26 +428,45 @@ class Level3(arcade.View):
         self.player_list.visible = False
 
         self.button1on = False
+        self.scheduler.cancel_all()
         arcade.print_timings()
 
+    def start_wall1(self):
+        """ the first wall moves a little after the button was pressed """
+        if not self.traps.walls["wall1"].triggered and self.button1on:
+            self.traps.walls["wall1"].start_moving()
+
+    def start_platform5(self):
+        """ platform 5 follows platforms 3 and 4 """
+        if self.traps.walls["platform4"].triggered:
+            self.traps.walls["platform5"].start_moving()
+
     def finish_reset(self):
         """Complete the reset after the particle burst has finished."""
         # stop rendering particles
         self.particle_run = False
         self.is_resetting = False
         self.death += 1
-        self.stage = 1
-        self.update_camera_pos()
 
-        # reset moving parts
-        self.door.reset()
-        for wall_list in self.moving_wall_list:
-            if wall_list.triggered:
-                wall_list.reset()
+        # everything back the way the level started, the random numbers keep going
+        self.snapshot.restore(self.start_state, skip=("random",))
+        # a new try, recorded and raced against the ghost from its start
+        self.recording.restart()
+        self.update_camera_pos()
 
-        self.player_sprite.center_x = START_POS[0]
-        self.player_sprite.center_y = START_POS[1]
-        self.player_list.visible = True
+    def setup_snapshot(self):
+        """ register where the level keeps its state, see snapshot.py, and capture the start """
+        self.snapshot = Snapshot()
+        self.snapshot.add_sprite("player", self.player_sprite)
+        self.snapshot.add_attrs("player_list", self.player_list, ("visible",))
+        self.snapshot.add_attrs("level", self, ("game_on", "stage", "button1on", "frames_since_land", "was_on_ground",
+                                                "jump_sound_ready"))
+        self.snapshot.add_object("door", self.door)
+        self.snapshot.add_object("traps", self.traps)
+        self.snapshot.add_object("button1", self.button1)
+        self.snapshot.add_object("scheduler", self.scheduler)
+        self.snapshot.add_random()
+        self.start_state = self.snapshot.capture()
 
     
     def game_over(self):
@@ -513,9 +531,10 @@ class Level3(arcade.View):
 
     def set_anim(self, y):
         """ set up walking animation, input y in the sprite sheet """
+        self.anim_code = encode_anim(0, y, True)
         self.player_sprite.frames.clear()
         for i in range(4):
-            texture = arcade.load_texture(SPRITE_PATH, i * 128, y, 128, 128)
+            texture = load_texture(SPRITE_PATH, i * 128, y, 128, 128, scale=SPRITE_SCALING_PLAYER)
             # frame i, speed 50ms per frame
             anim = arcade.AnimationKeyframe(i, 50, texture)
             self.player_sprite.frames.append(anim)
@@ -523,9 +542,10 @@ class Level3(arcade.View):
 
     def clear_anim(self, x, y):
         """ clear animation to a static texture, input x,y in the sprite sheet """
+        self.anim_code = encode_anim(x, y, False)
         self.player_sprite.frames.clear()
         for i in range(4):
-            texture = arcade.load_texture(SPRITE_PATH, x, y, 128, 128)
+            texture = load_texture(SPRITE_PATH, x, y, 128, 128, scale=SPRITE_SCALING_PLAYER)
             # frame i, speed 10ms per frame
             anim = arcade.AnimationKeyframe(i, 10, texture)
             self.player_sprite.frames.append(anim)
@@ -533,6 +553,7 @@ class Level3(arcade.View):
     def level_complete(self):
         self.door.move_over = False
         self.shake_camera()
+        self.recording.complete()
         elapsed = time.time() - self.level_start_time
         attempts = self.death + 1
         from level4 import Level4
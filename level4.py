@@ -3,9 +3,20 @@ from arcade.experimental import Shadertoy
 import random
 import math
 import time
+from functools import partial
 from pyglet.math import Vec2
 
-from modals import MovingWall, Door, FireBall, Missile, Button, EndScreen
+from modals import MovingWall, Door, FireBall, Cannon, Button, EndScreen
+from texture_cache import texture_cache, load_texture
+from mapbin import load_tilemap
+from assetpack import load_sound
+from physics import GridPhysicsEnginePlatformer
+from collision import CollisionWorld, HAZARD, TRIGGER, SOLID
+from activity import ActivityRegion, THROTTLE
+from scheduler import Scheduler
+from snapshot import Snapshot
+from ghost import encode_anim
+from recording import LevelRecording
 
 
 SCREEN_WIDTH = 1000
@@ -28,84 +39,6 @@ START_POS = (240, 250)
 SPRITE_PATH = "data/sprites/sprite_jetpack.png"
 
 
-class Cannon:
-    """Cannon class that spawns missiles periodically"""
-    
-    def __init__(self, pos_x: int, pos_y: int, player_sprite, flipped = False):
-        """Initialize cannon at given position"""
-        self.sprite = arcade.Sprite()
-        self.sprite.scale = 0.5
-        self.sprite.center_x = pos_x
-        self.sprite.center_y = pos_y
-        self.flipped = flipped
-        self.sprite.flipped_horizontally = self.flipped
-        self.player_sprite = player_sprite
-        self.missile_list = []
-        self.last_spawn_time = 0.0
-        self.spawn_interval = 3.0  # spawn every 3 seconds
-        self.animation_duration = 0.5  # duration of firing animation in seconds
-        self.firing_start_time = None
-        
-        # Load animation textures
-        self.idle_texture = arcade.load_texture("data/sprites/cannon.png", flipped_horizontally=self.flipped)
-        self.firing_textures = [
-            arcade.load_texture("data/sprites/cannon2.png", flipped_horizontally=self.flipped),
-            arcade.load_texture("data/sprites/cannon3.png", flipped_horizontally=self.flipped),
-            arcade.load_texture("data/sprites/cannon4.png", flipped_horizontally=self.flipped),
-            arcade.load_texture("data/sprites/cannon5.png", flipped_horizontally=self.flipped),
-        ]
-        
-        # Set initial texture to idle
-        self.sprite.texture = self.idle_texture
-    
-    def draw(self):
-        """Draw the cannon and all active missiles"""
-        self.sprite.draw()
-        for missile in self.missile_list:
-            missile.draw()
-    
-    def start_firing_animation(self, current_time: float):
-        """Start the firing animation"""
-        self.firing_start_time = current_time
-        # Set to first frame of firing animation
-        self.sprite.texture = self.firing_textures[0]
-    
-    def update(self, current_time: float):
-        """Update cannon and missiles, spawn new missile if interval elapsed"""
-        # Spawn new missile if enough time has passed
-        if current_time - self.last_spawn_time >= self.spawn_interval:
-            if (self.flipped and self.player_sprite.center_x < 735) or (not self.flipped and self.player_sprite.center_x > 735):
-                missile = Missile(self.sprite.center_x + 30 if self.flipped else self.sprite.center_x - 30, self.sprite.center_y - 10, self.player_sprite, "right" if self.flipped else "left")
-                self.missile_list.append(missile)
-                self.start_firing_animation(current_time)
-            self.last_spawn_time = current_time
-            # Start firing animation
-        
-        # Update firing animation
-        if self.firing_start_time is not None:
-            elapsed = current_time - self.firing_start_time
-            if elapsed >= self.animation_duration:
-                # Animation complete, return to idle
-                self.sprite.texture = self.idle_texture
-                self.firing_start_time = None
-            else:
-                # Calculate which frame to show
-                frame_index = int((elapsed / self.animation_duration) * len(self.firing_textures))
-                frame_index = min(frame_index, len(self.firing_textures) - 1)  # Clamp to valid range
-                self.sprite.texture = self.firing_textures[frame_index]
-        
-        # Update all missiles
-        for missile in self.missile_list[:]:  # Use slice to safely iterate while modifying
-            missile.update()
-    
-    def reset(self, current_time: float = 0.0):
-        """Reset cannon state"""
-        self.missile_list.clear()
-        self.last_spawn_time = current_time
-        self.sprite.texture = self.idle_texture
-        self.firing_start_time = None
-
-
 class Level4(arcade.View):
     """ windows class """
 
@@ -126,6 +59,16 @@ class Level4(arcade.View):
         self.door = None
         self.vis_sprites_list = None
         self.moving_wall_list = None
+        self.collision_world = None
+        # timed events, in seconds of play
+        self.scheduler = None
+        self.activity_region = None
+        # the level's mutable state, and how it was at the start to reset to
+        self.snapshot = None
+        self.start_state = None
+        # the rewind buffer, the ghost and the telemetry stream, see recording.py
+        self.recording = None
+        self.anim_code = encode_anim(0, 0, False)
 
         # specific to the levels
         self.fireball1 = None
@@ -135,6 +78,7 @@ class Level4(arcade.View):
         self.fireball5 = None
         self.fireball6 = None
         self.fireball_list = None
+        self.fireball_sprites = None
         self.cannon = None
         self.cannon2 = None
         self.button_list = None
@@ -155,8 +99,8 @@ class Level4(arcade.View):
         self.frames_since_land = 0
         self.was_on_ground = False
         self.jump_sound_ready = True
-        self.jump_sound = arcade.load_sound("data/sounds/jump.wav")
-        self.jetpack_sound = arcade.load_sound("data/sounds/jetpack.mp3", streaming=True)
+        self.jump_sound = load_sound("data/sounds/jump.wav")
+        self.jetpack_sound = load_sound("data/sounds/jetpack.mp3", streaming=True)
         self.jetpack_sound_player = None
         
         # CAMERAS
@@ -200,7 +144,7 @@ class Level4(arcade.View):
         self.player_sprite = arcade.AnimatedTimeBasedSprite()
 
         # set up player animation sprites
-        texture = arcade.load_texture(SPRITE_PATH, 0, 0, 128, 128)
+        texture = texture_cache.load_texture(SPRITE_PATH, 0, 0, 128, 128, scale=SPRITE_SCALING_PLAYER)
         anim = arcade.AnimationKeyframe(1, 10, texture)
         self.player_sprite.frames.append(anim)
         self.player_sprite.scale = SPRITE_SCALING_PLAYER
@@ -212,7 +156,8 @@ class Level4(arcade.View):
 
         # set up the map from Tiled
         map_name = "data/maps/level4.json"
-        self.tile_map = arcade.load_tilemap(map_name, scaling=TILE_SCALING, hit_box_algorithm="Detailed")
+        self.tile_map = load_tilemap(map_name, scaling=TILE_SCALING, hit_box_algorithm="Detailed")
+        texture_cache.enter_level(self.tile_map)
 
         # sprite_list is from Tiled map layers
         self.door = Door(1470, 276)
@@ -235,8 +180,21 @@ class Level4(arcade.View):
         self.fireball6 = FireBall(1400, 520, 265)
         self.fireball_list = [self.fireball1, self.fireball2, self.fireball3, self.fireball4, self.fireball5, self.fireball6]
 
-        self.cannon = Cannon(170, 445, self.player_sprite, True)
-        self.cannon2 = Cannon(1550, 480, self.player_sprite, False) # another one at (1550, 445)
+        # everything the player and the missiles are checked against, in one query each
+        self.collision_world = CollisionWorld()
+        self.collision_world.add_layer("platforms", self.platform_list, SOLID)
+        for i, button in enumerate(self.button_list):
+            self.collision_world.add_layer(f"button{i}", button.sprite_list, TRIGGER)
+        self.fireball_sprites = arcade.SpriteList()
+        for fireball in self.fireball_list:
+            self.fireball_sprites.append(fireball.sprite)
+        self.collision_world.add_layer("fireballs", self.fireball_sprites, HAZARD, rigid=False)
+
+        # fireballs away from the camera are stepped a few frames at a time
+        self.activity_region = ActivityRegion(SCREEN_WIDTH, SCREEN_HEIGHT)
+        self.activity_region.move_to(self.view_left, CAMERA_OFFSET_Y)
+        for fireball in self.fireball_list:
+            self.activity_region.add(fireball.sprite, partial(fireball.update, GRAVITY), THROTTLE)
 
         self.vis_sprites_list = [self.platform_list]
 
@@ -245,14 +203,21 @@ class Level4(arcade.View):
         #     arcade.set_background_color(self.tile_map.background_color)
 
         # setup physics engine
-        self.physics_engine = arcade.PhysicsEnginePlatformer(
+        self.physics_engine = GridPhysicsEnginePlatformer(
             self.player_sprite, 
             self.vis_sprites_list, 
             GRAVITY)
+
+        self.scheduler = Scheduler(self)
+        # missiles look for the player through the same tile grid
+        self.cannon = Cannon(170, 445, self.player_sprite, self.scheduler, True, self.physics_engine.line_of_sight, 735)
+        self.cannon2 = Cannon(1550, 480, self.player_sprite, self.scheduler, False, self.physics_engine.line_of_sight, 735) # another one at (1550, 445)
         
         self.game_on = True
+        self.setup_snapshot()
         print("level 4 started")
         self.level_start_time = time.time()
+        self.recording = LevelRecording(self, "level4", SPRITE_PATH, SPRITE_SCALING_PLAYER)
 
 
     def on_draw(self):
@@ -265,6 +230,7 @@ class Level4(arcade.View):
         # Only draw door if it's active (can_be_touched)
         if self.door.can_be_touched:
             self.door.draw()
+        self.recording.draw()
         self.player_list.draw()
         self.cannon.draw()
         self.cannon2.draw()
@@ -340,6 +306,7 @@ class Level4(arcade.View):
             return
         if not self.game_on:
             return
+        self.recording.on_key_press(key)
         if key == arcade.key.UP or key == arcade.key.SPACE or key == arcade.key.W:
             self.jump_pressed = True
         if key == arcade.key.LEFT or key == arcade.key.A:
@@ -351,6 +318,7 @@ class Level4(arcade.View):
     def on_key_release(self, key, modifiers):
         """Called when the user releases a key. """
 
+        self.recording.on_key_release(key)
         if key == arcade.key.UP or key == arcade.key.SPACE or key == arcade.key.W:
             self.jump_pressed = False
         if key == arcade.key.LEFT or key == arcade.key.A:
@@ -384,6 +352,7 @@ class Level4(arcade.View):
         if self.paused:
             return
         self.time += delta_time
+        self.recording.frame(delta_time)
         self.frame_cnt += 1
 
         # If we're currently running the reset particle burst, wait until it finishes
@@ -396,6 +365,14 @@ class Level4(arcade.View):
             # While the burst is active, do not advance game logic
             return
         
+        # going back in time instead of forward, see recording.py
+        if self.game_on:
+            if self.recording.tick(delta_time):
+                self.jetpack_particle_run = False
+                self._stop_jetpack_sound()
+                self.scroll_to_player()
+                return
+
         if not self.game_on:
             self.player_sprite.center_x = self.door.pos_x
             self.player_sprite.center_y = self.door.pos_y
@@ -406,16 +383,19 @@ class Level4(arcade.View):
             if self.door.move_over:
                 self.level_complete()
         
+        # where the player was before moving, trap and trigger checks sweep from here
+        player_start = self.player_sprite.position
+
         # Call update on all sprites
         self.door.update()
         self.player_list.update()
         self.player_list.update_animation()
         if self.game_on:
             self.physics_engine.update()
-            for fireball in self.fireball_list:
-                fireball.update(GRAVITY)
-            self.cannon.update(self.time)
-            self.cannon2.update(self.time)
+            self.activity_region.update()
+            self.scheduler.advance(delta_time)
+            self.cannon.update(self.scheduler.now, self.activity_region.contains_sprite(self.cannon.sprite))
+            self.cannon2.update(self.scheduler.now, self.activity_region.contains_sprite(self.cannon2.sprite))
         
         # Calculate speed based on the keys pressed, if in air, does not stop immedietly
         self.player_sprite.change_x *= 0.97
@@ -485,9 +465,11 @@ class Level4(arcade.View):
         if not self.game_on:
             return
         
+        hits = self.collision_world.query(self.player_sprite, player_start, (HAZARD, TRIGGER))
+
         # Check button collisions
-        for button in self.button_list:
-            trigger_hit = arcade.check_for_collision_with_list(self.player_sprite, button.sprite_list)
+        for i, button in enumerate(self.button_list):
+            trigger_hit = f"button{i}" in hits[TRIGGER]
             if not button.triggered and trigger_hit:
                 # Button just got triggered
                 button.touched()
@@ -509,14 +491,9 @@ class Level4(arcade.View):
             self.game_on = False
             self.game_over()
         
-        for fireball in self.fireball_list:
-            # bounced = arcade.check_for_collision_with_list(fireball.sprite, self.platform_list)
-            # if bounced:
-            #     fireball.bounce()
-                
-            collided_w_player = arcade.check_for_collision(self.player_sprite, fireball.sprite)
-            if collided_w_player:
-                self.reset()
+        # fireballs
+        if hits[HAZARD]:
+            self.reset()
         
         # Check missile collisions
         for missile in self.cannon.missile_list[:]:  # Use slice to safely iterate while modifying
@@ -527,7 +504,7 @@ class Level4(arcade.View):
                 break  # Reset will handle clearing missiles, so break to avoid processing more
             
             # Check collision with platforms
-            collided_w_platform = arcade.check_for_collision_with_list(missile.sprite, self.platform_list)
+            collided_w_platform = self.collision_world.query(missile.sprite, missile.start, (SOLID,))[SOLID]
             if collided_w_platform:
                 # Trigger particle explosion at missile location
                 self.trigger_particle_explosion(missile.pos_x, missile.pos_y)
@@ -542,7 +519,7 @@ class Level4(arcade.View):
                 break  # Reset will handle clearing missiles, so break to avoid processing more
             
             # Check collision with platforms
-            collided_w_platform = arcade.check_for_collision_with_list(missile.sprite, self.platform_list)
+            collided_w_platform = self.collision_world.query(missile.sprite, missile.start, (SOLID,))[SOLID]
             if collided_w_platform:
                 # Trigger particle explosion at missile location
                 self.trigger_particle_explosion(missile.pos_x, missile.pos_y)
@@ -571,6 +548,7 @@ class Level4(arcade.View):
         """
         resets the scene after death
         """
+        self.recording.died()
         self.trigger_particle_explosion(self.player_sprite.center_x, self.player_sprite.center_y)
         self.shake_camera()
         # disable jetpack particles during reset
@@ -597,23 +575,29 @@ class Level4(arcade.View):
         self.is_resetting = False
         self.death += 1
 
-        # reset moving parts
-        self.door.reset()
-        self.door.can_be_touched = False
-        self.door.opacity = 0  # Hide door again
-        self.jetpack_fuel = 100
-        for fireball in self.fireball_list:
-            fireball.reset()
-        self.cannon.reset(self.time)
-        self.cannon2.reset(self.time)
-        # Reset buttons
-        for button in self.button_list:
-            button.reset()
-            button.sprite_list.visible = True
-        self.buttons_pressed_count = 0
-        self.player_sprite.center_x = START_POS[0]
-        self.player_sprite.center_y = START_POS[1]
-        self.player_list.visible = True
+        # everything back the way the level started, the random numbers keep going
+        self.snapshot.restore(self.start_state, skip=("random",))
+        # a new try, recorded and raced against the ghost from its start
+        self.recording.restart()
+
+    def setup_snapshot(self):
+        """ register where the level keeps its state, see snapshot.py, and capture the start """
+        self.snapshot = Snapshot()
+        self.snapshot.add_sprite("player", self.player_sprite)
+        self.snapshot.add_attrs("player_list", self.player_list, ("visible",))
+        self.snapshot.add_attrs("level", self, ("game_on", "jetpack_fuel", "buttons_pressed_count", "frames_since_land",
+                                                "was_on_ground", "jump_sound_ready"))
+        self.snapshot.add_object("door", self.door)
+        for i, button in enumerate(self.button_list):
+            self.snapshot.add_object(f"button{i}", button)
+        for i, fireball in enumerate(self.fireball_list):
+            self.snapshot.add_object(f"fireball{i}", fireball)
+        self.snapshot.add_object("activity", self.activity_region)
+        self.snapshot.add_object("cannon", self.cannon)
+        self.snapshot.add_object("cannon2", self.cannon2)
+        self.snapshot.add_object("scheduler", self.scheduler)
+        self.snapshot.add_random()
+        self.start_state = self.snapshot.capture()
 
     
     def game_over(self):
@@ -693,13 +677,15 @@ class Level4(arcade.View):
 
         # Scroll to the proper location
         self.camera_sprites.move_to(Vec2(self.view_left, CAMERA_OFFSET_Y), CAMERA_SPEED)
+        self.activity_region.move_to(self.view_left, CAMERA_OFFSET_Y)
 
 
     def set_anim(self, y):
         """ set up walking animation, input y in the sprite sheet """
+        self.anim_code = encode_anim(0, y, True)
         self.player_sprite.frames.clear()
         for i in range(4):
-            texture = arcade.load_texture(SPRITE_PATH, i * 128, y, 128, 128)
+            texture = load_texture(SPRITE_PATH, i * 128, y, 128, 128, scale=SPRITE_SCALING_PLAYER)
             # frame i, speed 50ms per frame
             anim = arcade.AnimationKeyframe(i, 50, texture)
             self.player_sprite.frames.append(anim)
@@ -707,9 +693,10 @@ class Level4(arcade.View):
 
     def clear_anim(self, x, y):
         """ clear animation to a static texture, input x,y in the sprite sheet """
+        self.anim_code = encode_anim(x, y, False)
         self.player_sprite.frames.clear()
         for i in range(4):
-            texture = arcade.load_texture(SPRITE_PATH, x, y, 128, 128)
+            texture = load_texture(SPRITE_PATH, x, y, 128, 128, scale=SPRITE_SCALING_PLAYER)
             # frame i, speed 10ms per frame
             anim = arcade.AnimationKeyframe(i, 10, texture)
             self.player_sprite.frames.append(anim)
@@ -717,6 +704,7 @@ class Level4(arcade.View):
     def level_complete(self):
         self.door.move_over = False
         self.shake_camera()
+        self.recording.complete()
         elapsed = time.time() - self.level_start_time
         attempts = self.death + 1
         from level5 import Level5
@@ -3,9 +3,21 @@ from arcade.experimental import Shadertoy
 import random
 import math
 import time
+from functools import partial
+import pymunk
 from pyglet.math import Vec2
 
-from modals import MovingWall, Door, FireBall, Missile, Button, EndScreen
+from modals import MovingWall, Door, FireBall, Cannon, Button, EndScreen
+from texture_cache import texture_cache, load_texture
+from mapbin import load_tilemap
+from assetpack import load_sound
+from physics import GridPhysicsEnginePlatformer, merge_tiles
+from collision import CollisionWorld, HAZARD, TRIGGER, SOLID
+from activity import ActivityRegion
+from scheduler import Scheduler
+from snapshot import Snapshot
+from ghost import encode_anim
+from recording import LevelRecording
 
 
 SCREEN_WIDTH = 1000
@@ -30,6 +42,11 @@ FIREBALL_MIN_SPEED = 500
 FIREBALL_MAX_SPEED = 700
 FIREBALL_FRICTION = 0.0
 FIREBALL_ELASTICITY = 1.0
+# pymunk runs in fixed steps, at most PYMUNK_MAX_STEPS per frame
+PYMUNK_STEP = 1 / 120
+PYMUNK_MAX_STEPS = 8
+# only put to sleep by the activity region, fireballs never come to rest on their own
+PYMUNK_SLEEP_TIME = 1.0
 
 VIEWPORT_MARGIN = 500
 CAMERA_SPEED = 0.5
@@ -40,84 +57,6 @@ START_POS = (500, 780)
 SPRITE_PATH = "data/sprites/sprite_jetpack.png"
 
 
-class Cannon:
-    """Cannon class that spawns missiles periodically"""
-    
-    def __init__(self, pos_x: int, pos_y: int, player_sprite, flipped = False):
-        """Initialize cannon at given position"""
-        self.sprite = arcade.Sprite()
-        self.sprite.scale = 0.5
-        self.sprite.center_x = pos_x
-        self.sprite.center_y = pos_y
-        self.flipped = flipped
-        self.sprite.flipped_horizontally = self.flipped
-        self.player_sprite = player_sprite
-        self.missile_list = []
-        self.last_spawn_time = 0.0
-        self.spawn_interval = 3.0  # spawn every 3 seconds
-        self.animation_duration = 0.5  # duration of firing animation in seconds
-        self.firing_start_time = None
-        
-        # Load animation textures
-        self.idle_texture = arcade.load_texture("data/sprites/cannon.png", flipped_horizontally=self.flipped)
-        self.firing_textures = [
-            arcade.load_texture("data/sprites/cannon2.png", flipped_horizontally=self.flipped),
-            arcade.load_texture("data/sprites/cannon3.png", flipped_horizontally=self.flipped),
-            arcade.load_texture("data/sprites/cannon4.png", flipped_horizontally=self.flipped),
-            arcade.load_texture("data/sprites/cannon5.png", flipped_horizontally=self.flipped),
-        ]
-        
-        # Set initial texture to idle
-        self.sprite.texture = self.idle_texture
-    
-    def draw(self):
-        """Draw the cannon and all active missiles"""
-        self.sprite.draw()
-        for missile in self.missile_list:
-            missile.draw()
-    
-    def start_firing_animation(self, current_time: float):
-        """Start the firing animation"""
-        self.firing_start_time = current_time
-        # Set to first frame of firing animation
-        self.sprite.texture = self.firing_textures[0]
-    
-    def update(self, current_time: float):
-        """Update cannon and missiles, spawn new missile if interval elapsed"""
-        # Spawn new missile if enough time has passed
-        if current_time - self.last_spawn_time >= self.spawn_interval:
-            if (self.flipped and self.player_sprite.center_x < 1000) or (not self.flipped and self.player_sprite.center_x > 900):
-                missile = Missile(self.sprite.center_x + 30 if self.flipped else self.sprite.center_x - 30, self.sprite.center_y - 10, self.player_sprite, "right" if self.flipped else "left")
-                self.missile_list.append(missile)
-                self.start_firing_animation(current_time)
-            self.last_spawn_time = current_time
-            # Start firing animation
-        
-        # Update firing animation
-        if self.firing_start_time is not None:
-            elapsed = current_time - self.firing_start_time
-            if elapsed >= self.animation_duration:
-                # Animation complete, return to idle
-                self.sprite.texture = self.idle_texture
-                self.firing_start_time = None
-            else:
-                # Calculate which frame to show
-                frame_index = int((elapsed / self.animation_duration) * len(self.firing_textures))
-                frame_index = min(frame_index, len(self.firing_textures) - 1)  # Clamp to valid range
-                self.sprite.texture = self.firing_textures[frame_index]
-        
-        # Update all missiles
-        for missile in self.missile_list[:]:  # Use slice to safely iterate while modifying
-            missile.update()
-    
-    def reset(self, current_time: float = 0.0):
-        """Reset cannon state"""
-        self.missile_list.clear()
-        self.last_spawn_time = current_time
-        self.sprite.texture = self.idle_texture
-        self.firing_start_time = None
-
-
 class Level5(arcade.View):
     """ windows class """
 
@@ -138,6 +77,16 @@ class Level5(arcade.View):
         self.door = None
         self.vis_sprites_list = None
         self.moving_wall_list = None
+        self.collision_world = None
+        # timed events, in seconds of play
+        self.scheduler = None
+        self.activity_region = None
+        # the level's mutable state, and how it was at the start to reset to
+        self.snapshot = None
+        self.start_state = None
+        # the rewind buffer, the ghost and the telemetry stream, see recording.py
+        self.recording = None
+        self.anim_code = encode_anim(0, 0, False)
 
         # specific to the levels
         self.fireball1 = None
@@ -147,6 +96,7 @@ class Level5(arcade.View):
         self.fireball5 = None
         self.fireball6 = None
         self.fireball_list = None
+        self.fireball_sprites = None
         self.cannon = None
         self.cannon2 = None
         self.button_list = None
@@ -163,13 +113,15 @@ class Level5(arcade.View):
         self.right_pressed = False
         self.physics_engine = None
         self.pymunk_engine = None
+        # time pymunk still has to catch up on
+        self.pymunk_time = 0.0
         self.tile_map = None
         # coyote time
         self.frames_since_land = 0
         self.was_on_ground = False
         self.jump_sound_ready = True
-        self.jump_sound = arcade.load_sound("data/sounds/jump.wav")
-        self.jetpack_sound = arcade.load_sound("data/sounds/jetpack.mp3", streaming=True)
+        self.jump_sound = load_sound("data/sounds/jump.wav")
+        self.jetpack_sound = load_sound("data/sounds/jetpack.mp3", streaming=True)
         self.jetpack_sound_player = None
         
         # CAMERAS
@@ -213,7 +165,7 @@ class Level5(arcade.View):
         self.player_sprite = arcade.AnimatedTimeBasedSprite()
 
         # set up player animation sprites
-        texture = arcade.load_texture(SPRITE_PATH, 0, 0, 128, 128)
+        texture = texture_cache.load_texture(SPRITE_PATH, 0, 0, 128, 128, scale=SPRITE_SCALING_PLAYER)
         anim = arcade.AnimationKeyframe(1, 10, texture)
         self.player_sprite.frames.append(anim)
         self.player_sprite.scale = SPRITE_SCALING_PLAYER
@@ -225,7 +177,8 @@ class Level5(arcade.View):
 
         # set up the map from Tiled
         map_name = "data/maps/level5.json"
-        self.tile_map = arcade.load_tilemap(map_name, scaling=TILE_SCALING, hit_box_algorithm="Detailed")
+        self.tile_map = load_tilemap(map_name, scaling=TILE_SCALING, hit_box_algorithm="Detailed")
+        texture_cache.enter_level(self.tile_map)
 
         # sprite_list is from Tiled map layers
         self.door = Door(980, 440)
@@ -250,8 +203,21 @@ class Level5(arcade.View):
         self.fireball6 = FireBall(1400, 860, 665)
         self.fireball_list = [self.fireball1, self.fireball2, self.fireball3, self.fireball4, self.fireball5, self.fireball6]
 
-        self.cannon = Cannon(170, 608, self.player_sprite, True)
-        self.cannon2 = Cannon(1700, 608, self.player_sprite, False)
+        # everything the player and the missiles are checked against, in one query each
+        self.collision_world = CollisionWorld()
+        self.collision_world.add_layer("platforms", self.platform_list, SOLID)
+        for i, button in enumerate(self.button_list):
+            self.collision_world.add_layer(f"button{i}", button.sprite_list, TRIGGER)
+        self.fireball_sprites = arcade.SpriteList()
+        for fireball in self.fireball_list:
+            self.fireball_sprites.append(fireball.sprite)
+        self.collision_world.add_layer("fireballs", self.fireball_sprites, HAZARD, rigid=False)
+
+        # fireballs away from the camera sleep in the pymunk space
+        self.activity_region = ActivityRegion(SCREEN_WIDTH, SCREEN_HEIGHT)
+        self.activity_region.move_to(self.view_left, self.view_bottom)
+        for fireball in self.fireball_list:
+            self.activity_region.add(fireball.sprite, on_change=partial(self.set_fireball_active, fireball))
 
         self.vis_sprites_list = [self.platform_list]
 
@@ -261,10 +227,17 @@ class Level5(arcade.View):
 
         # setup physics engine
         self.setup_physics()
+
+        self.scheduler = Scheduler(self)
+        # missiles look for the player through the same tile grid
+        self.cannon = Cannon(170, 608, self.player_sprite, self.scheduler, True, self.physics_engine.line_of_sight, 1000)
+        self.cannon2 = Cannon(1700, 608, self.player_sprite, self.scheduler, False, self.physics_engine.line_of_sight, 900)
         
         self.game_on = True
+        self.setup_snapshot()
         print("level 5 started")
         self.level_start_time = time.time()
+        self.recording = LevelRecording(self, "level5", SPRITE_PATH, SPRITE_SCALING_PLAYER)
 
 
     def on_draw(self):
@@ -277,6 +250,7 @@ class Level5(arcade.View):
         # Only draw door if it's active (can_be_touched)
         if self.door.can_be_touched:
             self.door.draw()
+        self.recording.draw()
         self.player_list.draw()
         self.cannon.draw()
         self.cannon2.draw()
@@ -352,6 +326,7 @@ class Level5(arcade.View):
             return
         if not self.game_on:
             return
+        self.recording.on_key_press(key)
         if key == arcade.key.UP or key == arcade.key.SPACE or key == arcade.key.W:
             self.jump_pressed = True
         if key == arcade.key.LEFT or key == arcade.key.A:
@@ -363,6 +338,7 @@ class Level5(arcade.View):
     def on_key_release(self, key, modifiers):
         """Called when the user releases a key. """
 
+        self.recording.on_key_release(key)
         if key == arcade.key.UP or key == arcade.key.SPACE or key == arcade.key.W:
             self.jump_pressed = False
         if key == arcade.key.LEFT or key == arcade.key.A:
@@ -396,6 +372,7 @@ class Level5(arcade.View):
         if self.paused:
             return
         self.time += delta_time
+        self.recording.frame(delta_time)
         self.frame_cnt += 1
 
         # If we're currently running the reset particle burst, wait until it finishes
@@ -408,6 +385,14 @@ class Level5(arcade.View):
             # While the burst is active, do not advance game logic
             return
         
+        # going back in time instead of forward, see recording.py
+        if self.game_on:
+            if self.recording.tick(delta_time):
+                self.jetpack_particle_run = False
+                self._stop_jetpack_sound()
+                self.scroll_to_player()
+                return
+
         if not self.game_on:
             self.player_sprite.center_x = self.door.pos_x
             self.player_sprite.center_y = self.door.pos_y
@@ -418,15 +403,24 @@ class Level5(arcade.View):
             if self.door.move_over:
                 self.level_complete()
         
+        # where the player was before moving, trap and trigger checks sweep from here
+        player_start = self.player_sprite.position
+
         # Call update on all sprites
         self.door.update()
         self.player_list.update()
         self.player_list.update_animation()
         if self.game_on:
             self.physics_engine.update()
-            self.pymunk_engine.step(delta_time)
-            self.cannon.update(self.time)
-            self.cannon2.update(self.time)
+            self.activity_region.update()
+            if any(activity.active for activity in self.activity_region.activities):
+                self.step_pymunk(delta_time)
+            else:
+                # every fireball is asleep, nothing to step
+                self.pymunk_time = 0.0
+            self.scheduler.advance(delta_time)
+            self.cannon.update(self.scheduler.now, self.activity_region.contains_sprite(self.cannon.sprite))
+            self.cannon2.update(self.scheduler.now, self.activity_region.contains_sprite(self.cannon2.sprite))
 
         # Calculate speed based on the keys pressed, if in air, does not stop immediately
         self.player_sprite.change_x *= 0.97
@@ -495,9 +489,11 @@ class Level5(arcade.View):
         if not self.game_on:
             return
         
+        hits = self.collision_world.query(self.player_sprite, player_start, (HAZARD, TRIGGER))
+
         # Check button collisions
-        for button in self.button_list:
-            trigger_hit = arcade.check_for_collision_with_list(self.player_sprite, button.sprite_list)
+        for i, button in enumerate(self.button_list):
+            trigger_hit = f"button{i}" in hits[TRIGGER]
             if not button.triggered and trigger_hit:
                 # Button just got triggered
                 button.touched()
@@ -519,14 +515,9 @@ class Level5(arcade.View):
             self.game_on = False
             self.game_over()
         
-        for fireball in self.fireball_list:
-            # bounced = arcade.check_for_collision_with_list(fireball.sprite, self.platform_list)
-            # if bounced:
-            #     fireball.bounce()
-                
-            collided_w_player = arcade.check_for_collision(self.player_sprite, fireball.sprite)
-            if collided_w_player:
-                self.reset()
+        # fireballs
+        if hits[HAZARD]:
+            self.reset()
         
         # Check missile collisions
         for missile in self.cannon.missile_list[:]:  # Use slice to safely iterate while modifying
@@ -537,7 +528,7 @@ class Level5(arcade.View):
                 break  # Reset will handle clearing missiles, so break to avoid processing more
             
             # Check collision with platforms
-            collided_w_platform = arcade.check_for_collision_with_list(missile.sprite, self.platform_list)
+            collided_w_platform = self.collision_world.query(missile.sprite, missile.start, (SOLID,))[SOLID]
             if collided_w_platform:
                 # Trigger particle explosion at missile location
                 self.trigger_particle_explosion(missile.pos_x, missile.pos_y)
@@ -552,7 +543,7 @@ class Level5(arcade.View):
                 break  # Reset will handle clearing missiles, so break to avoid processing more
             
             # Check collision with platforms
-            collided_w_platform = arcade.check_for_collision_with_list(missile.sprite, self.platform_list)
+            collided_w_platform = self.collision_world.query(missile.sprite, missile.start, (SOLID,))[SOLID]
             if collided_w_platform:
                 # Trigger particle explosion at missile location
                 self.trigger_particle_explosion(missile.pos_x, missile.pos_y)
@@ -581,6 +572,7 @@ class Level5(arcade.View):
         """
         resets the scene after death
         """
+        self.recording.died()
         self.trigger_particle_explosion(self.player_sprite.center_x, self.player_sprite.center_y)
         self.shake_camera()
         # disable jetpack particles during reset
@@ -607,24 +599,33 @@ class Level5(arcade.View):
         self.is_resetting = False
         self.death += 1
 
-        # reset moving parts
-        self.door.reset()
-        self.door.can_be_touched = False
-        self.door.opacity = 0  # Hide door again
-        self.jetpack_fuel = JETPACK_FUEL_MAX
-        self.reset_fireballs()
-        self.cannon.reset(self.time)
-        self.cannon2.reset(self.time)
-        # Reset buttons
-        for button in self.button_list:
-            button.reset()
-            button.sprite_list.visible = True
-        self.buttons_pressed_count = 0
-        self.player_sprite.center_x = START_POS[0]
-        self.player_sprite.center_y = START_POS[1]
-        self.player_sprite.change_x = 0
-        self.player_sprite.change_y = 0
-        self.player_list.visible = True
+        # everything back the way the level started, the random numbers keep going
+        self.snapshot.restore(self.start_state, skip=("random",))
+        # a new try, recorded and raced against the ghost from its start
+        self.recording.restart()
+        # and the fireballs fly off a new way every try
+        for fireball in self.fireball_list:
+            self.launch_fireball(fireball)
+
+    def setup_snapshot(self):
+        """ register where the level keeps its state, see snapshot.py, and capture the start """
+        self.snapshot = Snapshot()
+        self.snapshot.add_sprite("player", self.player_sprite)
+        self.snapshot.add_attrs("player_list", self.player_list, ("visible",))
+        self.snapshot.add_attrs("level", self, ("game_on", "jetpack_fuel", "buttons_pressed_count", "frames_since_land",
+                                                "was_on_ground", "jump_sound_ready", "pymunk_time"))
+        self.snapshot.add_object("door", self.door)
+        for i, button in enumerate(self.button_list):
+            self.snapshot.add_object(f"button{i}", button)
+        for i, fireball in enumerate(self.fireball_list):
+            self.snapshot.add(f"fireball{i}", partial(self.get_fireball_state, fireball),
+                              partial(self.set_fireball_state, fireball))
+        self.snapshot.add_object("activity", self.activity_region)
+        self.snapshot.add_object("cannon", self.cannon)
+        self.snapshot.add_object("cannon2", self.cannon2)
+        self.snapshot.add_object("scheduler", self.scheduler)
+        self.snapshot.add_random()
+        self.start_state = self.snapshot.capture()
 
     
     def game_over(self):
@@ -687,13 +688,15 @@ class Level5(arcade.View):
 
         # Scroll to the proper location
         self.camera_sprites.move_to(Vec2(self.view_left, self.view_bottom), CAMERA_SPEED)
+        self.activity_region.move_to(self.view_left, self.view_bottom)
 
 
     def set_anim(self, y):
         """ set up walking animation, input y in the sprite sheet """
+        self.anim_code = encode_anim(0, y, True)
         self.player_sprite.frames.clear()
         for i in range(4):
-            texture = arcade.load_texture(SPRITE_PATH, i * 128, y, 128, 128)
+            texture = load_texture(SPRITE_PATH, i * 128, y, 128, 128, scale=SPRITE_SCALING_PLAYER)
             # frame i, speed 50ms per frame
             anim = arcade.AnimationKeyframe(i, 50, texture)
             self.player_sprite.frames.append(anim)
@@ -701,9 +704,10 @@ class Level5(arcade.View):
 
     def clear_anim(self, x, y):
         """ clear animation to a static texture, input x,y in the sprite sheet """
+        self.anim_code = encode_anim(x, y, False)
         self.player_sprite.frames.clear()
         for i in range(4):
-            texture = arcade.load_texture(SPRITE_PATH, x, y, 128, 128)
+            texture = load_texture(SPRITE_PATH, x, y, 128, 128, scale=SPRITE_SCALING_PLAYER)
             # frame i, speed 10ms per frame
             anim = arcade.AnimationKeyframe(i, 10, texture)
             self.player_sprite.frames.append(anim)
@@ -711,6 +715,7 @@ class Level5(arcade.View):
     def level_complete(self):
         self.door.move_over = False
         self.shake_camera()
+        self.recording.complete()
         elapsed = time.time() - self.level_start_time
         attempts = self.death + 1
         from level6 import Level6
@@ -727,19 +732,22 @@ class Level5(arcade.View):
         arcade.draw_rectangle_outline(x, y, 6, 50, (0, 0, 0))
 
     def setup_physics(self):
-        self.physics_engine = arcade.PhysicsEnginePlatformer(
+        self.physics_engine = GridPhysicsEnginePlatformer(
             self.player_sprite,
             self.vis_sprites_list,
             GRAVITY,
         )
 
         self.pymunk_engine = arcade.PymunkPhysicsEngine(gravity=(0, PYMUNK_GRAVITY), damping=1.0)
-        self.pymunk_engine.add_sprite_list(
-            self.platform_list,
-            body_type=arcade.PymunkPhysicsEngine.STATIC,
-            friction=1.0,
-            elasticity=FIREBALL_ELASTICITY,
-        )
+        self.pymunk_time = 0.0
+        # the platforms go in as a few merged rectangles instead of one shape per tile
+        space = self.pymunk_engine.space
+        space.sleep_time_threshold = PYMUNK_SLEEP_TIME
+        for left, bottom, right, top in merge_tiles(self.platform_list):
+            shape = pymunk.Poly(space.static_body, [(left, bottom), (right, bottom), (right, top), (left, top)])
+            shape.friction = 1.0
+            shape.elasticity = FIREBALL_ELASTICITY
+            space.add(shape)
 
         for fireball in self.fireball_list:
             self.pymunk_engine.add_sprite(
@@ -755,6 +763,19 @@ class Level5(arcade.View):
 
         self.reset_fireballs()
 
+    def step_pymunk(self, delta_time):
+        """ advance pymunk in fixed steps, the sprites are synced once at the end """
+        self.pymunk_time += delta_time
+        steps = 0
+        while self.pymunk_time >= PYMUNK_STEP and steps < PYMUNK_MAX_STEPS:
+            self.pymunk_engine.step(PYMUNK_STEP, resync_sprites=False)
+            self.pymunk_time -= PYMUNK_STEP
+            steps += 1
+        if steps == PYMUNK_MAX_STEPS:
+            # fell too far behind (a hitch), drop the rest instead of spiralling
+            self.pymunk_time = 0.0
+        self.pymunk_engine.resync_sprites()
+
     def reset_fireballs(self):
         for fireball in self.fireball_list:
             fireball.sprite.center_x = fireball.init_x
@@ -763,6 +784,28 @@ class Level5(arcade.View):
             self.pymunk_engine.set_velocity(fireball.sprite, (0, 0))
             self.launch_fireball(fireball)
 
+    def set_fireball_active(self, fireball, active):
+        """ wake a fireball up when the camera gets near, put it to sleep when it's left behind """
+        body = self.pymunk_engine.get_physics_object(fireball.sprite).body
+        if active:
+            body.activate()
+        else:
+            body.sleep()
+
+    def get_fireball_state(self, fireball):
+        """ a fireball's pymunk body: position, velocity and whether it's asleep """
+        body = self.pymunk_engine.get_physics_object(fireball.sprite).body
+        return (tuple(body.position), tuple(body.velocity), body.is_sleeping)
+
+    def set_fireball_state(self, fireball, state):
+        """ put back a state from get_fireball_state """
+        position, velocity, sleeping = state
+        fireball.sprite.center_x, fireball.sprite.center_y = position
+        self.pymunk_engine.set_position(fireball.sprite, position)
+        self.pymunk_engine.set_velocity(fireball.sprite, velocity)
+        if sleeping:
+            self.pymunk_engine.get_physics_object(fireball.sprite).body.sleep()
+
     def launch_fireball(self, fireball):
         angle = random.uniform(0, math.tau)
         speed = random.uniform(FIREBALL_MIN_SPEED, FIREBALL_MAX_SPEED)
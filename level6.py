@@ -5,7 +5,17 @@ import math
 import time
 from pyglet.math import Vec2
 
-from modals import EndScreen
+from modals import EndScreen, SpriteGroup
+from texture_cache import texture_cache, load_texture
+from mapbin import load_tilemap
+from assetpack import load_sound
+from physics import GridPhysicsEnginePlatformer
+from collision import CollisionWorld, HAZARD, PICKUP, check_for_collision_with_list
+from activity import ActivityRegion
+from scheduler import Scheduler
+from snapshot import Snapshot
+from ghost import encode_anim
+from recording import LevelRecording
 
 
 SCREEN_WIDTH = 1000
@@ -27,10 +37,20 @@ START_POS = (300, 250)
 
 SPRITE_PATH = "data/sprites/sprite_jetpack.png"
 
+# obstacle sprite and scale
+OBSTACLE_TYPES = [
+    ("data/sprites/bombline.png", 1.0),
+    ("data/sprites/lightning_32x32.png", 1.0),
+    ("data/sprites/lightning_32x64.png", 1.0),
+    ("data/sprites/spike.png", 0.5)
+]
+# obstacle angles are snapped to this many steps
+OBSTACLE_ANGLE_STEPS = 64
+
 class Stone(arcade.Sprite):
     """Stone class for throwable objects"""
     def __init__(self, center_x: float, center_y: float, scale: float = 0.25):
-        super().__init__("data/sprites/stone.png", scale=scale)
+        super().__init__(texture=load_texture("data/sprites/stone.png", scale=scale), scale=scale)
         self.center_x = center_x
         self.center_y = center_y
         self.v_x = 0.0
@@ -40,18 +60,54 @@ class Stone(arcade.Sprite):
 class ThrownStone(arcade.Sprite):
     """Thrown stone with physics"""
     def __init__(self, center_x: float, center_y: float, v_x: float, v_y: float):
-        super().__init__("data/sprites/stone.png", scale=0.25)
+        super().__init__(texture=load_texture("data/sprites/stone.png", scale=0.25), scale=0.25)
         self.center_x = center_x
         self.center_y = center_y
         self.v_x = v_x
         self.v_y = v_y
 
+class Obstacle(arcade.Sprite):
+    """
+    Rotated obstacle. Its angle is snapped to one of OBSTACLE_ANGLE_STEPS and
+    the hit box rotated to that step comes from a table made once per
+    obstacle type, so spawning and moving it only translates the points.
+    """
+    # (texture name, scale) -> hit box at every angle step, around the center
+    hit_box_tables = {}
+
+    @classmethod
+    def hit_box_table(cls, texture, scale):
+        """ the rotated hit boxes of an obstacle type, worked out the first time it's asked for """
+        key = (texture.name, scale)
+        if key not in cls.hit_box_tables:
+            table = []
+            for step in range(OBSTACLE_ANGLE_STEPS):
+                angle = step * 360 / OBSTACLE_ANGLE_STEPS
+                # rotated and scaled the way arcade does it for the sprite's own hit box
+                points = [arcade.rotate_point(x, y, 0, 0, angle) if angle else (x, y) for x, y in texture.hit_box_points]
+                table.append([[x * scale, y * scale] for x, y in points])
+            cls.hit_box_tables[key] = table
+        return cls.hit_box_tables[key]
+
+    def __init__(self, texture, scale, angle, center_x, center_y):
+        super().__init__(texture=texture, scale=scale, center_x=center_x, center_y=center_y)
+        step = round(angle * OBSTACLE_ANGLE_STEPS / 360) % OBSTACLE_ANGLE_STEPS
+        self.angle = step * 360 / OBSTACLE_ANGLE_STEPS
+        self.rotated_hit_box = self.hit_box_table(texture, scale)[step]
+
+    def get_adjusted_hit_box(self):
+        """ the hit box for this angle step, moved to where the obstacle is """
+        if self._point_list_cache is None:
+            x, y = self._position
+            self._point_list_cache = [[point_x + x, point_y + y] for point_x, point_y in self.rotated_hit_box]
+        return self._point_list_cache
+
 class BOSS(arcade.AnimatedTimeBasedSprite):
     def __init__(self, center_x: float = 0, center_y: float = 0, scale: float = 1.0):
         super().__init__()
         self.boss_sprite_path = "data/sprites/stickman.png"
         for i in range(4):
-            texture = arcade.load_texture(self.boss_sprite_path, i * 256, 0, 256, 256)
+            texture = load_texture(self.boss_sprite_path, i * 256, 0, 256, 256)
             anim = arcade.AnimationKeyframe(i, 150, texture)  # 250ms per frame
             self.frames.append(anim)
         self.scale = scale
@@ -63,6 +119,14 @@ class BOSS(arcade.AnimatedTimeBasedSprite):
         self.hurt_end_time = 0.0
         self.is_dead = False
     
+    def load_frames(self, y, duration):
+        """ animate a row of the sprite sheet, duration in ms per frame """
+        self.frames.clear()
+        for i in range(4):
+            texture = load_texture(self.boss_sprite_path, i * 256, y, 256, 256)
+            anim = arcade.AnimationKeyframe(i, duration, texture)
+            self.frames.append(anim)
+
     def hurt(self, current_time: float):
         """Apply damage and swap to hurt textures"""
         self.health -= 15
@@ -71,31 +135,19 @@ class BOSS(arcade.AnimatedTimeBasedSprite):
             print("BOSS defeated")
         self.is_hurt = True
         self.hurt_end_time = current_time + 0.3
-        self.frames.clear()
-        for i in range(4):
-            # Use the red-tinted row of the sprite sheet
-            texture = arcade.load_texture(self.boss_sprite_path, i * 256, 256, 256, 256)
-            anim = arcade.AnimationKeyframe(i, 150, texture)
-            self.frames.append(anim)
+        # Use the red-tinted row of the sprite sheet
+        self.load_frames(256, 150)
     
     def reset_anim(self):
         """Restore normal textures"""
-        self.frames.clear()
-        for i in range(4):
-            texture = arcade.load_texture(self.boss_sprite_path, i * 256, 0, 256, 256)
-            anim = arcade.AnimationKeyframe(i, 150, texture)
-            self.frames.append(anim)
+        self.load_frames(0, 150)
         self.is_hurt = False
         self.hurt_end_time = 0.0
         self.is_dead = False
     
     def set_death_anim(self):
         """Swap to death animation row."""
-        self.frames.clear()
-        for i in range(4):
-            texture = arcade.load_texture(self.boss_sprite_path, i * 256, 512, 256, 256)
-            anim = arcade.AnimationKeyframe(i, 250, texture)
-            self.frames.append(anim)
+        self.load_frames(512, 250)
         # Reset animation to the first frame
         self.texture = self.frames[0].texture
         if hasattr(self, "cur_frame_idx"):
@@ -104,6 +156,36 @@ class BOSS(arcade.AnimatedTimeBasedSprite):
             self.time_since_last_frame = 0.0
         self.is_dead = True
 
+    def get_state(self):
+        """ health and which animation it's in, see snapshot.py. The sprite's own state is separate """
+        return (self.health, self.is_hurt, self.hurt_end_time, self.is_dead)
+
+    def set_state(self, state):
+        """ put back a state from get_state """
+        health, is_hurt, hurt_end_time, is_dead = state
+        if is_dead:
+            self.set_death_anim()
+        else:
+            self.reset_anim()
+            if is_hurt:
+                self.load_frames(256, 150)
+        self.health, self.is_hurt, self.hurt_end_time = health, is_hurt, hurt_end_time
+
+def obstacle_state(obstacle):
+    """ what an obstacle is made again from, see Level6.make_obstacle """
+    return (obstacle.kind, obstacle.angle, obstacle.center_x, obstacle.center_y)
+
+
+def ground_spike_state(ground_spike):
+    """ what a ground spike is made again from, see Level6.make_ground_spike """
+    return (ground_spike.center_x,)
+
+
+def stone_state(stone):
+    """ where a stone waiting to be picked up is """
+    return (stone.center_x, stone.center_y)
+
+
 class Level6(arcade.View):
     """ windows class """
 
@@ -123,9 +205,20 @@ class Level6(arcade.View):
         self.spike_list = None
         self.vis_sprites_list = None
         self.moving_wall_list = None
+        self.collision_world = None
+        # spawn timers, in seconds while the BOSS is alive
+        self.scheduler = None
+        # the level's mutable state, and how it was at the start to reset to
+        self.snapshot = None
+        self.start_state = None
+        # the rewind buffer, the ghost and the telemetry stream, see recording.py
+        self.recording = None
+        self.anim_code = encode_anim(0, 0, False)
+        self.activity_region = None
         self.boss_list = None
         self.obstacle_list = None
         self.stone_list = None
+        self.runner_groups = None
         self.thrown_stone_list = None
 
         # specific to the levels
@@ -143,16 +236,13 @@ class Level6(arcade.View):
         self.scroll_deceleration = 0.02
         self.camera_max_x = 200
         
-        # obstacle spawning
-        self.obstacle_spawn_timer = 0.0
+        # obstacle spawning, time until the next one
         self.obstacle_spawn_interval = 0.5
         self.obstacle_speed = 3.0
         self.ground_spike_list = None
-        self.ground_spike_spawn_timer = 0.0
         self.ground_spike_spawn_interval = 0.5
         
         # stone spawning
-        self.stone_spawn_timer = 0.0
         self.stone_spawn_interval = 2.0
         
         # player info
@@ -184,8 +274,8 @@ class Level6(arcade.View):
         self.frames_since_land = 0
         self.was_on_ground = False
         self.jump_sound_ready = True
-        self.jump_sound = arcade.load_sound("data/sounds/jump.wav")
-        self.jetpack_sound = arcade.load_sound("data/sounds/jetpack.mp3", streaming=True)
+        self.jump_sound = load_sound("data/sounds/jump.wav")
+        self.jetpack_sound = load_sound("data/sounds/jetpack.mp3", streaming=True)
         self.jetpack_sound_player = None
         
         # CAMERAS
@@ -224,15 +314,27 @@ class Level6(arcade.View):
         self.player_list = arcade.SpriteList()
         self.bkg_list = arcade.SpriteList()
         self.boss_list = arcade.SpriteList()
-        self.obstacle_list = arcade.SpriteList()
-        self.ground_spike_list = arcade.SpriteList()
-        self.stone_list = arcade.SpriteList()
+        # the runner's entities live in a frame scrolling left, the groups move
+        # as a whole and the sprites in them never do
+        self.obstacle_list = SpriteGroup()
+        self.ground_spike_list = SpriteGroup()
+        self.stone_list = SpriteGroup()
+        self.runner_groups = [self.obstacle_list, self.ground_spike_list, self.stone_list]
         self.thrown_stone_list = arcade.SpriteList()
         self.player_sprite = arcade.AnimatedTimeBasedSprite()
-        self.stone_icon_texture = arcade.load_texture("data/sprites/stone.png")
+
+        # what the player runs into, packed once per spawn and followed through the frame offset
+        self.collision_world = CollisionWorld()
+        self.collision_world.add_layer("obstacles", self.obstacle_list, HAZARD)
+        self.collision_world.add_layer("ground_spikes", self.ground_spike_list, HAZARD)
+        self.collision_world.add_layer("stones", self.stone_list, PICKUP)
+        self.stone_icon_texture = load_texture("data/sprites/stone.png", scale=0.25)
+        # rotate the obstacle hit boxes now, not when they spawn
+        for sprite_path, scale in OBSTACLE_TYPES:
+            Obstacle.hit_box_table(load_texture(sprite_path, hit_box_algorithm="Detailed", scale=scale), scale)
 
         # set up player animation sprites
-        texture = arcade.load_texture(SPRITE_PATH, 0, 0, 128, 128)
+        texture = texture_cache.load_texture(SPRITE_PATH, 0, 0, 128, 128, scale=SPRITE_SCALING_PLAYER)
         anim = arcade.AnimationKeyframe(1, 10, texture)
         self.player_sprite.frames.append(anim)
         self.player_sprite.scale = SPRITE_SCALING_PLAYER
@@ -251,19 +353,20 @@ class Level6(arcade.View):
         # reset camera scrolling
         self.camera_target_x = 0
         self.scroll_speed = 2.0
-        self.obstacle_spawn_timer = 0.0
-        self.ground_spike_spawn_timer = 0.0
-        self.stone_spawn_timer = 0.0
         self.stone_inventory = 0
         self.boss_defeated = False
         self.boss_fade_started = False
         self.player_anim_stopped = False
         self.fade_active = False
         self.fade_alpha = 0
+        # what scrolled out of it behind the camera is dropped
+        self.activity_region = ActivityRegion(SCREEN_WIDTH, SCREEN_HEIGHT)
+        self.activity_region.move_to(self.camera_target_x, CAMERA_OFFSET_Y)
 
         # set up the map from Tiled
         map_name = "data/maps/level6.json"
-        self.tile_map = arcade.load_tilemap(map_name, scaling=TILE_SCALING, hit_box_algorithm="Detailed")
+        self.tile_map = load_tilemap(map_name, scaling=TILE_SCALING, hit_box_algorithm="Detailed")
+        texture_cache.enter_level(self.tile_map)
 
         # sprite_list is from Tiled map layers
         self.background = self.tile_map.sprite_lists["background"]
@@ -272,14 +375,19 @@ class Level6(arcade.View):
         self.vis_sprites_list = [self.platform_list]
 
         # setup physics engine
-        self.physics_engine = arcade.PhysicsEnginePlatformer(
+        self.physics_engine = GridPhysicsEnginePlatformer(
             self.player_sprite, 
             self.vis_sprites_list, 
             GRAVITY)
+
+        self.scheduler = Scheduler(self)
+        self.start_spawners()
         
         self.game_on = True
+        self.setup_snapshot()
         print("level 6 started")
         self.level_start_time = time.time()
+        self.recording = LevelRecording(self, "level6", SPRITE_PATH, SPRITE_SCALING_PLAYER)
 
 
     def on_draw(self):
@@ -293,6 +401,7 @@ class Level6(arcade.View):
         # self.obstacle_list.draw_hit_boxes()
         self.ground_spike_list.draw()
         # self.ground_spike_list.draw_hit_boxes()
+        self.recording.draw()
         self.player_list.draw()
         # self.player_list.draw_hit_boxes()
         # draw the sprite lists
@@ -374,6 +483,7 @@ class Level6(arcade.View):
             return
         if not self.game_on:
             return
+        self.recording.on_key_press(key)
         if key == arcade.key.UP or key == arcade.key.SPACE or key == arcade.key.W:
             self.jump_pressed = True
         if key == arcade.key.LEFT or key == arcade.key.A:
@@ -384,6 +494,7 @@ class Level6(arcade.View):
 
     def on_key_release(self, key, modifiers):
         """Called when the user releases a key. """
+        self.recording.on_key_release(key)
         if key == arcade.key.UP or key == arcade.key.SPACE or key == arcade.key.W:
             self.jump_pressed = False
         if key == arcade.key.LEFT or key == arcade.key.A:
@@ -426,6 +537,7 @@ class Level6(arcade.View):
         if self.paused:
             return
         self.time += delta_time
+        self.recording.frame(delta_time)
         self.frame_cnt += 1
 
         # If we're currently running the reset particle burst, wait until it finishes
@@ -441,7 +553,15 @@ class Level6(arcade.View):
         if self.fade_active:
             self.update_end_fade()
             return
-        
+
+        # going back in time instead of forward, see recording.py
+        if self.game_on:
+            if self.recording.tick(delta_time):
+                self.jetpack_particle_run = False
+                self._stop_jetpack_sound()
+                self.scroll_to_player()
+                return
+
         # Camera scrolling (slow down after boss defeat)
         if self.boss_defeated and self.scroll_speed > 0:
             self.scroll_speed = max(0, self.scroll_speed - self.scroll_deceleration * delta_time * 60)
@@ -458,67 +578,38 @@ class Level6(arcade.View):
         if self.boss_defeated:
             self.handle_boss_fade_and_idle()
         
-        # Update obstacles
-        for obstacle in self.obstacle_list:
-            obstacle.center_x -= self.obstacle_speed * delta_time * 60
-            if obstacle.center_x < -100:
-                obstacle.remove_from_sprite_lists()
-        
-        # Update ground spikes
-        for spike in self.ground_spike_list:
-            spike.center_x -= self.obstacle_speed * delta_time * 60
-            if spike.center_x < -100:
-                spike.remove_from_sprite_lists()
-        
-        # Update stones on ground
-        for stone in self.stone_list:
-            stone.center_x -= self.obstacle_speed * delta_time * 60
-            if stone.center_x < -100:
-                stone.remove_from_sprite_lists()
+        # Scroll obstacles, ground spikes and stones, and drop what fell behind the active region
+        scroll = self.obstacle_speed * delta_time * 60
+        for group in self.runner_groups:
+            group.move(-scroll, 0)
+            group.drop_behind(self.activity_region.left - group.offset[0])
         
         # Update thrown stones
         for thrown_stone in self.thrown_stone_list:
+            # where it was before this move, the hit on the BOSS is swept from here
+            thrown_stone.start = thrown_stone.position
             thrown_stone.v_y -= GRAVITY * delta_time * 60
             thrown_stone.center_x += thrown_stone.v_x * delta_time * 60
             thrown_stone.center_y += thrown_stone.v_y * delta_time * 60
-            # Remove if off screen
-            if thrown_stone.center_x < -100 or thrown_stone.center_x > self.player_sprite.center_x + SCREEN_WIDTH + 200:
-                thrown_stone.remove_from_sprite_lists()
-            if thrown_stone.center_y < -100:
+            # Remove once it left the active region, it can only come back from above
+            if not self.activity_region.contains_sprite(thrown_stone) and thrown_stone.bottom < self.activity_region.top:
                 thrown_stone.remove_from_sprite_lists()
         
-        # Spawn obstacles
+        # Spawn obstacles, ground spikes and stones
         if self.game_on and not self.boss_defeated:
-            self.obstacle_spawn_timer += delta_time
-            if self.obstacle_spawn_timer >= self.obstacle_spawn_interval:
-                self.spawn_obstacle()
-                self.obstacle_spawn_timer = 0.0
-                self.obstacle_spawn_interval = random.uniform(0.3, 1.0)
-            
-            # Spawn ground spikes
-            self.ground_spike_spawn_timer += delta_time
-            if self.ground_spike_spawn_timer >= self.ground_spike_spawn_interval:
-                self.spawn_ground_spike()
-                self.ground_spike_spawn_timer = 0.0
-                self.ground_spike_spawn_interval = random.uniform(1.5, 2.5)
-            
-            # Spawn stones
-            self.stone_spawn_timer += delta_time
-            if self.stone_spawn_timer >= self.stone_spawn_interval:
-                self.spawn_stone()
-                self.stone_spawn_timer = 0.0
-                self.stone_spawn_interval = random.uniform(1.5, 3.0)
+            self.scheduler.advance(delta_time)
         
         # Check stone pickup
         if self.game_on:
-            stone_hit_list = arcade.check_for_collision_with_list(self.player_sprite, self.stone_list)
-            for stone in stone_hit_list:
+            hits = self.collision_world.query(self.player_sprite, categories=(PICKUP,))
+            for stone in hits[PICKUP].get("stones", []):
                 stone.remove_from_sprite_lists()
                 self.stone_inventory += 1
         
         # Check thrown stone collisions with BOSS
         if self.game_on:
-            boss_hit_list = arcade.check_for_collision_with_list(self.boss_sprite, self.thrown_stone_list)
+            boss_hit_list = [thrown_stone for thrown_stone in self.thrown_stone_list
+                             if check_for_collision_with_list(thrown_stone, self.boss_list, rigid=False, start=thrown_stone.start)]
             for thrown_stone in boss_hit_list:
                 thrown_stone.remove_from_sprite_lists()
                 self.boss_sprite.hurt(self.time)
@@ -532,9 +623,6 @@ class Level6(arcade.View):
         self.boss_list.update()
         if self.boss_death_active or not self.boss_fade_started:
             self.boss_list.update_animation()
-        self.obstacle_list.update()
-        self.ground_spike_list.update()
-        self.stone_list.update()
         self.thrown_stone_list.update()
         self.player_list.update()
         if not self.player_anim_stopped:
@@ -608,14 +696,9 @@ class Level6(arcade.View):
         if not self.game_on:
             return
         
-        # check obstacle collisions
-        obstacle_hit_list = arcade.check_for_collision_with_list(self.player_sprite, self.obstacle_list)
-        if obstacle_hit_list:
-            self.reset()
-        
-        # check ground spike collisions
-        ground_spike_hit_list = arcade.check_for_collision_with_list(self.player_sprite, self.ground_spike_list)
-        if ground_spike_hit_list:
+        # check obstacle and ground spike collisions
+        hits = self.collision_world.query(self.player_sprite, categories=(HAZARD,))
+        if hits[HAZARD]:
             self.reset()
         
         # Scroll the screen to the player
@@ -641,6 +724,7 @@ class Level6(arcade.View):
         """
         resets the scene after death
         """
+        self.recording.died()
         self.trigger_particle_explosion(self.player_sprite.center_x, self.player_sprite.center_y)
         self.shake_camera()
         # disable jetpack particles during reset
@@ -667,33 +751,54 @@ class Level6(arcade.View):
         self.is_resetting = False
         self.death += 1
 
-        # reset moving parts
-        self.jetpack_fuel = 100
-        self.player_sprite.center_x = START_POS[0]
-        self.player_sprite.center_y = START_POS[1]
-        self.boss_sprite.center_x = 100
-        self.boss_sprite.center_y = 210
-        self.camera_target_x = 0
-        self.scroll_speed = 2.0
-        self.obstacle_spawn_timer = 0.0
-        self.ground_spike_spawn_timer = 0.0
-        self.obstacle_list.clear()
-        self.ground_spike_list.clear()
-        self.stone_list.clear()
-        self.thrown_stone_list.clear()
-        self.boss_sprite.health = 100
-        self.boss_sprite.reset_anim()
-        self.boss_sprite.alpha = 255
-        self.stone_inventory = 0
-        self.player_list.visible = True
-        self.boss_defeated = False
-        self.boss_fade_started = False
-        self.player_anim_stopped = False
-        self.fade_active = False
-        self.fade_alpha = 0
-        self.post_boss_cleared = False
+        # everything back the way the level started, the random numbers keep going
+        self.snapshot.restore(self.start_state, skip=("random",))
+        # a new try, recorded and raced against the ghost from its start
+        self.recording.restart()
+
+    def setup_snapshot(self):
+        """ register where the level keeps its state, see snapshot.py, and capture the start """
+        self.snapshot = Snapshot()
+        self.snapshot.add_sprite("player", self.player_sprite)
+        self.snapshot.add_attrs("player_list", self.player_list, ("visible",))
+        self.snapshot.add_attrs("level", self, (
+            "game_on", "jetpack_fuel", "stone_inventory", "camera_target_x", "scroll_speed",
+            "obstacle_spawn_interval", "ground_spike_spawn_interval", "stone_spawn_interval",
+            "boss_defeated", "boss_fade_started", "player_anim_stopped", "fade_active", "fade_alpha",
+            "post_boss_cleared", "boss_death_active", "boss_death_start_time",
+            "frames_since_land", "was_on_ground", "jump_sound_ready"))
+        self.snapshot.add_sprite("boss", self.boss_sprite)
+        self.snapshot.add_object("boss_anim", self.boss_sprite)
+        self.snapshot.add("runner", self.get_runner_state, self.set_runner_state)
+        self.snapshot.add_object("activity", self.activity_region)
+        self.snapshot.add_object("scheduler", self.scheduler)
+        self.snapshot.add_random()
+        self.start_state = self.snapshot.capture()
+
+    def get_runner_state(self):
+        """ the scrolling frame and what's in it, and the stones in the air """
+        return (tuple(group.offset for group in self.runner_groups),
+                self.obstacle_list.sprite_states(obstacle_state),
+                self.ground_spike_list.sprite_states(ground_spike_state),
+                self.stone_list.sprite_states(stone_state),
+                tuple((stone.center_x, stone.center_y, stone.v_x, stone.v_y) for stone in self.thrown_stone_list))
+
+    def set_runner_state(self, state):
+        """ put back a state from get_runner_state, only the sprites that aren't there any more are made again """
+        offsets, obstacles, spikes, stones, thrown_stones = state
+        for group, offset in zip(self.runner_groups, offsets):
+            group.place(*offset)
+        self.obstacle_list.set_sprite_states(obstacles, obstacle_state, self.make_obstacle)
+        self.ground_spike_list.set_sprite_states(spikes, ground_spike_state, self.make_ground_spike)
+        self.stone_list.set_sprite_states(stones, stone_state, lambda x, y: Stone(center_x=x, center_y=y, scale=0.25))
+        if len(thrown_stones) != len(self.thrown_stone_list):
+            self.thrown_stone_list.clear()
+            self.thrown_stone_list.extend(ThrownStone(*thrown_stone) for thrown_stone in thrown_stones)
+        for thrown_stone, (x, y, v_x, v_y) in zip(self.thrown_stone_list, thrown_stones):
+            thrown_stone.center_x, thrown_stone.center_y = x, y
+            thrown_stone.v_x, thrown_stone.v_y = v_x, v_y
+            thrown_stone.start = thrown_stone.position
 
-    
     def game_over(self):
         """ game over animation"""
         self.left_pressed = False
@@ -711,12 +816,16 @@ class Level6(arcade.View):
         self.boss_sprite.is_hurt = False
         self.boss_sprite.hurt_end_time = 0.0
         if not self.post_boss_cleared:
-            self.obstacle_list.clear()
-            self.ground_spike_list.clear()
-            self.stone_list.clear()
-            self.thrown_stone_list.clear()
+            self.clear_runner()
             self.post_boss_cleared = True
     
+    def clear_runner(self):
+        """Remove every obstacle, spike and stone, and put the scrolling frame back"""
+        for group in self.runner_groups:
+            group.clear()
+            group.place(0, 0)
+        self.thrown_stone_list.clear()
+
     def handle_boss_fade_and_idle(self):
         """Freeze player animation and advance boss death sequence."""
         if not self.player_anim_stopped:
@@ -760,13 +869,15 @@ class Level6(arcade.View):
         scroll the window to the player
         """
         self.camera_sprites.move_to(Vec2(self.camera_target_x, 0), 0.2)
+        self.activity_region.move_to(self.camera_target_x, CAMERA_OFFSET_Y)
 
 
     def set_anim(self, y):
         """ set up walking animation, input y in the sprite sheet """
+        self.anim_code = encode_anim(0, y, True)
         self.player_sprite.frames.clear()
         for i in range(4):
-            texture = arcade.load_texture(SPRITE_PATH, i * 128, y, 128, 128)
+            texture = load_texture(SPRITE_PATH, i * 128, y, 128, 128, scale=SPRITE_SCALING_PLAYER)
             # frame i, speed 50ms per frame
             anim = arcade.AnimationKeyframe(i, 50, texture)
             self.player_sprite.frames.append(anim)
@@ -774,15 +885,17 @@ class Level6(arcade.View):
 
     def clear_anim(self, x, y):
         """ clear animation to a static texture, input x,y in the sprite sheet """
+        self.anim_code = encode_anim(x, y, False)
         self.player_sprite.frames.clear()
         for i in range(4):
-            texture = arcade.load_texture(SPRITE_PATH, x, y, 128, 128)
+            texture = load_texture(SPRITE_PATH, x, y, 128, 128, scale=SPRITE_SCALING_PLAYER)
             # frame i, speed 10ms per frame
             anim = arcade.AnimationKeyframe(i, 10, texture)
             self.player_sprite.frames.append(anim)
     
     def level_complete(self):
         self.shake_camera()
+        self.recording.complete()
         elapsed = time.time() - self.level_start_time
         attempts = self.death + 1
         end_view = EndScreen(self.window, "Level 6 Complete", elapsed, attempts, self.__class__, None)
@@ -791,36 +904,60 @@ class Level6(arcade.View):
 
     def spawn_obstacle(self):
         """Spawn an obstacle at random position and angle"""
-        obstacle_types = [
-            ("data/sprites/bombline.png", 1.0),
-            ("data/sprites/lightning_32x32.png", 1.0),
-            ("data/sprites/lightning_32x64.png", 1.0),
-            ("data/sprites/spike.png", 0.5)
-        ]
-        
-        sprite_path, scale = random.choice(obstacle_types)
-        obstacle = arcade.Sprite(sprite_path, scale=scale, hit_box_algorithm="Detailed")
+        kind = random.randrange(len(OBSTACLE_TYPES))
         
         spawn_x = self.player_sprite.center_x + SCREEN_WIDTH + random.uniform(0, 200)
         spawn_y = random.uniform(100, SCREEN_HEIGHT - 100)
         
-        obstacle.center_x = spawn_x
-        obstacle.center_y = spawn_y
-        obstacle.angle = random.uniform(0, 360)
-        
-        self.obstacle_list.append(obstacle)
+        # in the scrolling frame
+        spawn_x -= self.obstacle_list.offset[0]
+        self.obstacle_list.append(self.make_obstacle(kind, random.uniform(0, 360), spawn_x, spawn_y))
+
+    def make_obstacle(self, kind, angle, x, y):
+        """ an obstacle of one of the OBSTACLE_TYPES, kind is its index """
+        sprite_path, scale = OBSTACLE_TYPES[kind]
+        texture = load_texture(sprite_path, hit_box_algorithm="Detailed", scale=scale)
+        obstacle = Obstacle(texture, scale, angle, x, y)
+        obstacle.kind = kind
+        return obstacle
     
+    def start_spawners(self):
+        """(re)start the spawn timers, each one schedules the next at a random interval"""
+        self.scheduler.cancel_all()
+        self.scheduler.after(self.obstacle_spawn_interval, self.on_obstacle_timer)
+        self.scheduler.after(self.ground_spike_spawn_interval, self.on_ground_spike_timer)
+        self.scheduler.after(self.stone_spawn_interval, self.on_stone_timer)
+
+    def on_obstacle_timer(self):
+        self.spawn_obstacle()
+        self.obstacle_spawn_interval = random.uniform(0.3, 1.0)
+        self.scheduler.after(self.obstacle_spawn_interval, self.on_obstacle_timer)
+
+    def on_ground_spike_timer(self):
+        self.spawn_ground_spike()
+        self.ground_spike_spawn_interval = random.uniform(1.5, 2.5)
+        self.scheduler.after(self.ground_spike_spawn_interval, self.on_ground_spike_timer)
+
+    def on_stone_timer(self):
+        self.spawn_stone()
+        self.stone_spawn_interval = random.uniform(1.5, 3.0)
+        self.scheduler.after(self.stone_spawn_interval, self.on_stone_timer)
+
     def spawn_ground_spike(self):
         """spawn 1-4 ground spikes in a row"""
         num_spikes = random.randint(1, 4)
-        base_spawn_x = self.player_sprite.center_x + SCREEN_WIDTH + 100
+        base_spawn_x = self.player_sprite.center_x + SCREEN_WIDTH + 100 - self.ground_spike_list.offset[0]
         
         for i in range(num_spikes):
             spawn_x = base_spawn_x + (i * 38)
-            ground_spike = arcade.Sprite("data/sprites/ground_spike.png", scale=0.5, hit_box_algorithm="Detailed")
-            ground_spike.center_x = spawn_x
-            ground_spike.center_y = 108
-            self.ground_spike_list.append(ground_spike)
+            self.ground_spike_list.append(self.make_ground_spike(spawn_x))
+
+    def make_ground_spike(self, x):
+        """ a ground spike, they all stand on the ground """
+        ground_spike = arcade.Sprite(texture=load_texture("data/sprites/ground_spike.png", hit_box_algorithm="Detailed", scale=0.5), scale=0.5)
+        ground_spike.center_x = x
+        ground_spike.center_y = 108
+        return ground_spike
     
     def draw_fuel_bar(self):
         x = int(self.player_sprite.center_x - 18)
@@ -918,7 +1055,7 @@ class Level6(arcade.View):
     def spawn_stone(self):
         """Spawn a stone at random position"""
         stone = Stone(
-            center_x=self.player_sprite.center_x + SCREEN_WIDTH + random.uniform(0, 200),
+            center_x=self.player_sprite.center_x + SCREEN_WIDTH + random.uniform(0, 200) - self.stone_list.offset[0],
             center_y=random.uniform(120, SCREEN_HEIGHT - 100),
             scale=0.25
         )
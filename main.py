@@ -1,3 +1,4 @@
+import argparse
 import arcade
 import arcade.gui
 import time
@@ -10,6 +11,7 @@ from level3 import Level3
 from level4 import Level4
 from level5 import Level5
 from level6 import Level6
+from telemetry import start_server, PORT
 
 SCREEN_WIDTH = 1000
 SCREEN_HEIGHT = 600
@@ -108,6 +110,12 @@ class GameWindow(arcade.Window):
 
 def main():
     """ main method """
+    parser = argparse.ArgumentParser(description="Evil Level")
+    parser.add_argument("--telemetry", type=int, nargs="?", const=PORT, metavar="PORT",
+                        help="stream the levels live on a local port, see telemetry.py")
+    args = parser.parse_args()
+    if args.telemetry is not None:
+        start_server(port=args.telemetry)
     window = GameWindow()
     window.setup()
     arcade.run()
@@ -0,0 +1,309 @@
+"""
+Binary map format compiled from the Tiled JSON maps.
+
+A compiled map is one header, a JSON metadata block and one uint16 GID grid
+per tile layer. Loading memory-maps the file and hands out NumPy views of the
+grids, so nothing is parsed besides the small metadata block.
+
+The metadata lists the tileset files the map was compiled with, a compiled
+map is stale once the map or one of them is newer, or once it was written by
+another VERSION of the format, and it is then compiled again on load.
+
+Run this file to compile every map in data/maps:
+    python mapbin.py
+"""
+import glob
+import json
+import mmap
+import os
+import struct
+from concurrent.futures import ThreadPoolExecutor
+
+import arcade
+import numpy as np
+
+import assetpack
+from texture_cache import texture_cache
+
+
+MAGIC = b"EVLM"
+VERSION = 2
+# magic, version, width, height, tile width, tile height, layer count, metadata size
+HEADER = struct.Struct("<4sHHHHHHI")
+# grids start on a 16 byte boundary
+ALIGN = 16
+
+# Tiled keeps the flip flags in the top bits of a GID, we keep them in the top
+# bits of the uint16 so up to 8191 tiles fit
+TILED_FLIPPED_HORIZONTALLY = 0x80000000
+TILED_FLIPPED_VERTICALLY = 0x40000000
+TILED_FLIPPED_DIAGONALLY = 0x20000000
+FLIPPED_HORIZONTALLY = 0x8000
+FLIPPED_VERTICALLY = 0x4000
+FLIPPED_DIAGONALLY = 0x2000
+GID_MASK = 0x1FFF
+
+MAP_DIR = "data/maps"
+
+# threads used to load a map, the image decoding and hit box tracing drop the GIL
+LOAD_WORKERS = min(8, (os.cpu_count() or 1) + 1)
+
+
+def _pack_gid(gid):
+    """ convert a 32 bit Tiled GID to our 16 bit one """
+    tile = gid & 0x1FFFFFFF
+    if tile > GID_MASK:
+        raise ValueError(f"GID {tile} doesn't fit in the binary map format")
+    if gid & TILED_FLIPPED_HORIZONTALLY:
+        tile |= FLIPPED_HORIZONTALLY
+    if gid & TILED_FLIPPED_VERTICALLY:
+        tile |= FLIPPED_VERTICALLY
+    if gid & TILED_FLIPPED_DIAGONALLY:
+        tile |= FLIPPED_DIAGONALLY
+    return tile
+
+
+def binary_path(map_name):
+    """ path of the compiled file for a Tiled map """
+    return os.path.splitext(map_name)[0] + ".bin"
+
+
+def compile_map(map_name, out_name=None):
+    """ compile a Tiled JSON map into the binary format, returns the output path """
+    if out_name is None:
+        out_name = binary_path(map_name)
+    map_dir = os.path.dirname(map_name)
+    with open(map_name) as f:
+        tiled_map = json.load(f)
+
+    tilesets = []
+    # the tileset files, relative to the map
+    sources = []
+    for tileset_ref in tiled_map["tilesets"]:
+        tileset = tileset_ref
+        if "source" in tileset_ref:
+            sources.append(tileset_ref["source"])
+            with open(os.path.join(map_dir, tileset_ref["source"])) as f:
+                tileset = json.load(f)
+        tilesets.append({
+            "firstgid": tileset_ref["firstgid"],
+            # stored relative to the map, like Tiled does
+            "image": tileset["image"],
+            "columns": tileset["columns"],
+            "tile_width": tileset["tilewidth"],
+            "tile_height": tileset["tileheight"],
+            "margin": tileset.get("margin", 0),
+            "spacing": tileset.get("spacing", 0),
+        })
+
+    width = tiled_map["width"]
+    height = tiled_map["height"]
+    layers = []
+    grids = []
+    for layer in tiled_map["layers"]:
+        if layer["type"] != "tilelayer":
+            raise ValueError(f"layer '{layer['name']}' in {map_name} is not a tile layer")
+        layers.append({
+            "name": layer["name"],
+            "visible": layer.get("visible", True),
+            "opacity": layer.get("opacity", 1),
+            "offset": (layer.get("offsetx", 0), layer.get("offsety", 0)),
+            "properties": {prop["name"]: prop["value"] for prop in layer.get("properties", [])},
+        })
+        grid = np.array([_pack_gid(gid) for gid in layer["data"]], dtype="<u2")
+        grids.append(grid.reshape(height, width))
+
+    meta = json.dumps({"tilesets": tilesets, "layers": layers, "sources": sources}).encode("utf-8")
+    meta += b" " * (-(HEADER.size + len(meta)) % ALIGN)
+    with open(out_name, "wb") as f:
+        f.write(HEADER.pack(MAGIC, VERSION, width, height, tiled_map["tilewidth"],
+                            tiled_map["tileheight"], len(layers), len(meta)))
+        f.write(meta)
+        for grid in grids:
+            f.write(grid.tobytes())
+    return out_name
+
+
+class BinaryMap():
+    """ a compiled map, layers are NumPy views into the underlying buffer """
+
+    def __init__(self, buffer):
+        """ initializer, buffer is anything supporting the buffer protocol """
+        self.buffer = buffer
+        magic, version, width, height, tile_width, tile_height, layer_count, meta_size = HEADER.unpack_from(buffer, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError("not a compiled map, or an old version of the format")
+        self.width = width
+        self.height = height
+        self.tile_width = tile_width
+        self.tile_height = tile_height
+        meta = json.loads(bytes(buffer[HEADER.size:HEADER.size + meta_size]).decode("utf-8"))
+        self.tilesets = meta["tilesets"]
+        self.layer_info = meta["layers"]
+        self.sources = meta["sources"]
+
+        # one (height, width) grid per layer, no copies
+        self.layers = {}
+        offset = HEADER.size + meta_size
+        for info in self.layer_info:
+            grid = np.frombuffer(buffer, dtype="<u2", count=width * height, offset=offset)
+            self.layers[info["name"]] = grid.reshape(height, width)
+            offset += grid.nbytes
+
+    @classmethod
+    def open(cls, file_name):
+        """ memory-map a compiled map file """
+        with open(file_name, "rb") as f:
+            buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return cls(buffer)
+
+    def close(self):
+        """ let go of the buffer, the layers can't be used after """
+        self.layers = {}
+        if isinstance(self.buffer, mmap.mmap):
+            self.buffer.close()
+
+
+def is_current(bin_name, map_name):
+    """ True if a map's compiled file is there, of this VERSION and newer than the map and its tilesets """
+    try:
+        binary_map = BinaryMap.open(bin_name)
+    except (OSError, ValueError, struct.error):
+        return False
+    try:
+        map_dir = os.path.dirname(map_name)
+        sources = [map_name] + [os.path.join(map_dir, source) for source in binary_map.sources]
+        compiled = os.path.getmtime(bin_name)
+        return all(os.path.getmtime(source) <= compiled for source in sources if os.path.exists(source))
+    finally:
+        binary_map.close()
+
+
+class BinaryTileMap():
+    """ sprite lists built from a compiled map, stands in for arcade's TileMap """
+
+    def __init__(self, binary_map, map_dir, scaling=1.0, hit_box_algorithm="Simple", hit_box_detail=4.5):
+        """ initializer """
+        self.binary_map = binary_map
+        self.width = binary_map.width
+        self.height = binary_map.height
+        self.tile_width = binary_map.tile_width * scaling
+        self.tile_height = binary_map.tile_height * scaling
+        self.scaling = scaling
+        self.hit_box_algorithm = hit_box_algorithm
+        self.hit_box_detail = hit_box_detail
+        self.tilesets = sorted(binary_map.tilesets, key=lambda tileset: tileset["firstgid"])
+        for tileset in self.tilesets:
+            tileset["image"] = os.path.normpath(os.path.join(map_dir, tileset["image"]))
+        self.tileset_images = [tileset["image"] for tileset in self.tilesets]
+
+        # the CPU work runs on a pool: decoding the tilesets, finding the tiles of
+        # each layer, and cutting the textures and tracing their hit boxes.
+        # Sprites are created back here, the GL upload happens on first draw.
+        with ThreadPoolExecutor(max_workers=LOAD_WORKERS) as executor:
+            layer_jobs = [executor.submit(self._layer_tiles, info, binary_map.layers[info["name"]])
+                          for info in binary_map.layer_info]
+            assetpack.preload_images(self.tileset_images, executor, scale=self.scaling)
+            layer_tiles = [job.result() for job in layer_jobs]
+
+            items = sorted(set().union(*(np.unique(tiles[2]).tolist() for tiles in layer_tiles)))
+            textures = dict(zip(items, executor.map(self._load_texture, items)))
+
+        self.sprite_lists = {}
+        for info, tiles in zip(binary_map.layer_info, layer_tiles):
+            self.sprite_lists[info["name"]] = self._build_layer(info, tiles, textures)
+
+    def _get_tileset(self, gid):
+        """ find the tileset a GID belongs to """
+        found = None
+        for tileset in self.tilesets:
+            if tileset["firstgid"] <= gid:
+                found = tileset
+        if found is None:
+            raise ValueError(f"Couldn't find tile for GID {gid}")
+        return found
+
+    def _get_texture(self, item):
+        """ load the texture of a packed GID, flip flags included, at the mip level the map is drawn at """
+        gid = item & GID_MASK
+        tileset = self._get_tileset(gid)
+        tile_id = gid - tileset["firstgid"]
+        row = tile_id // tileset["columns"]
+        col = tile_id % tileset["columns"]
+        image_x = tileset["margin"] + col * (tileset["tile_width"] + tileset["spacing"])
+        image_y = tileset["margin"] + row * (tileset["tile_height"] + tileset["spacing"])
+        texture = texture_cache.load_texture(
+            tileset["image"], image_x, image_y, tileset["tile_width"], tileset["tile_height"],
+            flipped_horizontally=bool(item & FLIPPED_HORIZONTALLY),
+            flipped_vertically=bool(item & FLIPPED_VERTICALLY),
+            flipped_diagonally=bool(item & FLIPPED_DIAGONALLY),
+            hit_box_algorithm=self.hit_box_algorithm,
+            hit_box_detail=self.hit_box_detail,
+            scale=self.scaling,
+        )
+        return texture, tile_id
+
+    def _load_texture(self, item):
+        """ load a texture and trace its hit box now, rather than on first use """
+        texture, tile_id = self._get_texture(item)
+        texture.hit_box_points
+        return texture, tile_id
+
+    def _layer_tiles(self, info, grid):
+        """ bottom left corners and packed GIDs of the tiles in one layer, same placement as arcade.load_tilemap """
+        rows, cols = np.nonzero(grid)
+        left = cols * self.tile_width + info["offset"][0] * self.scaling
+        bottom = (self.height - rows - 1) * self.tile_height - info["offset"][1] * self.scaling
+        return left.tolist(), bottom.tolist(), grid[rows, cols]
+
+    def _build_layer(self, info, tiles, textures):
+        """ create the sprite list of one layer """
+        sprite_list = arcade.SpriteList()
+        sprite_list.visible = info["visible"]
+        if info["properties"]:
+            sprite_list.properties = info["properties"]
+        opacity = info["opacity"]
+
+        for left, bottom, item in zip(tiles[0], tiles[1], tiles[2].tolist()):
+            texture, tile_id = textures[item]
+            sprite = arcade.Sprite(texture=texture, scale=self.scaling)
+            sprite.textures = [texture]
+            sprite.properties["tile_id"] = tile_id
+            sprite.center_x = left + sprite.width / 2
+            sprite.center_y = bottom + sprite.height / 2
+            if opacity:
+                sprite.alpha = int(opacity * 255)
+            sprite_list.append(sprite)
+        return sprite_list
+
+
+def load_tilemap(map_name, scaling=1.0, hit_box_algorithm="Simple", hit_box_detail=4.5):
+    """
+    Load a Tiled map through its compiled binary file.
+    The compiled map is read from the asset pack if it's in there, otherwise
+    it is (re)compiled first if the binary is missing or stale, see is_current.
+    """
+    bin_name = binary_path(map_name)
+    pack = assetpack.get_pack()
+    if pack is not None and bin_name in pack:
+        binary_map = BinaryMap(pack.read(bin_name))
+    else:
+        if not is_current(bin_name, map_name):
+            compile_map(map_name, bin_name)
+        binary_map = BinaryMap.open(bin_name)
+    return BinaryTileMap(binary_map, os.path.dirname(map_name),
+                         scaling=scaling, hit_box_algorithm=hit_box_algorithm, hit_box_detail=hit_box_detail)
+
+
+def main():
+    """ compile every map in the maps folder """
+    for map_name in sorted(glob.glob(os.path.join(MAP_DIR, "*.json"))):
+        with open(map_name) as f:
+            if json.load(f).get("type") != "map":
+                continue
+        out_name = compile_map(map_name)
+        print(f"{map_name} ({os.path.getsize(map_name)} bytes) -> {out_name} ({os.path.getsize(out_name)} bytes)")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,19 +1,144 @@
 import arcade
 import arcade.gui
 import math
+from pyglet.math import Mat4, Vec3
+from texture_cache import load_texture
+
+
+class SpriteGroup(arcade.SpriteList):
+    """
+    Sprites moved as one unit. The sprites stay where they were loaded and the
+    group is drawn and collided through a single offset, so moving, resetting
+    or hiding it doesn't touch the sprites.
+    """
+
+    def __init__(self, sprites=(), **kwargs):
+        """ initializer """
+        # counts sprites added and removed, so what's read off them is only read again after a change
+        self.changes = 0
+        # (changes, read, states) of the last sprite_states()
+        self.states = None
+        # lowest right edge of the sprites, nothing is behind a line left of it
+        self.min_right = None
+        super().__init__(**kwargs)
+        self.offset = (0, 0)
+        # the last move(), collision checks sweep it. place() doesn't count as a move
+        self.last_move = (0, 0)
+        self.extend(sprites)
+        # False takes the whole group out of collisions and physics, see collision.collidable
+        self.collidable = True
+        # bounding box of the group where it was loaded
+        self.box = None
+        if len(self):
+            self.box = (min(sprite.left for sprite in self), min(sprite.bottom for sprite in self),
+                        max(sprite.right for sprite in self), max(sprite.top for sprite in self))
+
+    def move(self, dx, dy):
+        """ move the whole group """
+        self.offset = (self.offset[0] + dx, self.offset[1] + dy)
+        self.last_move = (dx, dy)
+
+    def place(self, offset_x, offset_y):
+        """ put the group somewhere, a jump rather than a move """
+        self.offset = (offset_x, offset_y)
+        self.last_move = (0, 0)
+
+    def append(self, sprite):
+        """ add a sprite """
+        super().append(sprite)
+        self.changes += 1
+        if self.min_right is None or sprite.right < self.min_right:
+            self.min_right = sprite.right
+
+    def insert(self, index, sprite):
+        """ add a sprite at index """
+        super().insert(index, sprite)
+        self.changes += 1
+        if self.min_right is None or sprite.right < self.min_right:
+            self.min_right = sprite.right
+
+    def remove(self, sprite):
+        """ take a sprite out """
+        super().remove(sprite)
+        self.changes += 1
+
+    def clear(self, deep=True):
+        """ take every sprite out """
+        super().clear(deep)
+        self.changes += 1
+        self.min_right = None
+
+    def drop_behind(self, left):
+        """
+        Drop the sprites whose right edge is left of left, in the group's frame.
+        The sprites are only looked at once left passed the lowest right edge.
+        """
+        if self.min_right is None or left <= self.min_right:
+            return
+        dropped = [sprite for sprite in self if sprite.right < left]
+        for sprite in dropped:
+            self.remove(sprite)
+        self.min_right = min((sprite.right for sprite in self), default=None)
+
+    def sprite_states(self, read):
+        """
+        The tuple of read(sprite) for every sprite, for sprites that don't change
+        in the group's frame: it's only read again after a sprite was added or removed.
+        """
+        if self.states is None or self.states[:2] != (self.changes, read):
+            self.states = (self.changes, read, tuple(read(sprite) for sprite in self))
+        return self.states[2]
+
+    def set_sprite_states(self, states, read, make):
+        """
+        Put back what sprite_states(read) returned. Sprites already in the group
+        with the same state are kept, the others are made with make(*state).
+        """
+        if self.sprite_states(read) == states:
+            return
+        spare = {}
+        for sprite in self:
+            spare.setdefault(read(sprite), []).append(sprite)
+        sprites = [spare[state].pop() if spare.get(state) else make(*state) for state in states]
+        self.clear()
+        self.extend(sprites)
+        self.states = (self.changes, read, states)
+
+    @property
+    def bounds(self):
+        """ bounding box of the group where it is now, None if it's empty """
+        if self.box is None:
+            return None
+        return (self.box[0] + self.offset[0], self.box[1] + self.offset[1],
+                self.box[2] + self.offset[0], self.box[3] + self.offset[1])
+
+    def draw(self, **kwargs):
+        """ draw the sprites moved by the offset """
+        if self.offset == (0, 0):
+            super().draw(**kwargs)
+            return
+        ctx = arcade.get_window().ctx
+        projection = ctx.projection_2d_matrix
+        ctx.projection_2d_matrix = Mat4.from_translation(Vec3(self.offset[0], self.offset[1], 0)) @ projection
+        try:
+            super().draw(**kwargs)
+        finally:
+            ctx.projection_2d_matrix = projection
 
 
 class MovingWall():
     """ moving wall class """
 
-    def __init__(self, wall_sprites: arcade.SpriteList, move_speed: int, move_distance: int, move_direction='vertical', move_with_player=False, player_sprite=None, disappears=False, visible=True):
+    def __init__(self, wall_sprites: arcade.SpriteList, move_speed: int, move_distance: int, move_direction='vertical', disappears=False, visible=True, carry=False):
         """
         initializer
         move direction default is left and down.
         move_direction = 'vertical' or 'horizontal'
+        With carry the physics engine moves whatever stands on the wall along with it,
+        platforms do, trapdoors falling away don't.
         """
-        self.wall_list = wall_sprites
-        self.original_positions = [(wall.center_x, wall.center_y) for wall in wall_sprites]
+        self.wall_list = SpriteGroup(wall_sprites)
+        self.wall_list.carries = carry
         self.org_move_speed = move_speed
         self.move_speed = move_speed
         self.move_distance = move_distance
@@ -21,42 +146,13 @@ class MovingWall():
         self.moved_distance = 0
         self.triggered = False
         self.is_moving = False
-        self.move_with_player = move_with_player
-        self.player_sprite = player_sprite
         self.disappears = disappears
         self.visible = visible
         self.wall_list.visible = self.visible
-        self.player_on_platform = False
-
-    def _check_player_collision(self):
-        """Check if player sprite is colliding with any wall sprite using bounding boxes."""
-        if self.player_sprite is None:
-            return False
-        
-        player_left = self.player_sprite.left
-        player_right = self.player_sprite.right
-        player_bottom = self.player_sprite.bottom
-        player_top = self.player_sprite.top
-        
-        for wall_sprite in self.wall_list:
-            wall_left = wall_sprite.left
-            wall_right = wall_sprite.right
-            wall_bottom = wall_sprite.bottom
-            wall_top = wall_sprite.top
-            
-            # Check if bounding boxes overlap
-            if (player_right > wall_left and player_left < wall_right and
-                player_top > wall_bottom and player_bottom < wall_top + 2):
-                return True
-        
-        return False
 
     def update(self):
-        """Move wall sprites at a constant speed until moved target distance.
-        
-        If player_sprite is provided and colliding with the wall, the player
-        will move with the wall.
-        """
+        """Move wall sprites at a constant speed until moved target distance."""
+        self.wall_list.last_move = (0, 0)
         if not self.is_moving or not self.wall_list:
             return
 
@@ -69,25 +165,10 @@ class MovingWall():
         # move by the smaller of the speed or remaining distance to avoid overshoot
         delta = min(self.move_speed, remaining)
 
-        # Check for player collision before moving the wall using manual bounding box check
-        player_colliding = self._check_player_collision() if self.move_with_player and self.is_moving else False
-
-        for sprite in self.wall_list:
-            if self.move_direction == 'vertical':
-                sprite.center_y -= delta
-            else:
-                sprite.center_x -= delta
-
-        # Move the player with the wall if colliding
-        self.player_on_platform = False
-        if player_colliding and self.player_sprite is not None:
-            self.player_on_platform = True
-            # if self.move_direction == 'vertical':
-            #     # Move player vertically with the wall
-            #     self.player_sprite.center_y -= delta
-            # else:
-            #     # Move player horizontally with the wall
-            #     self.player_sprite.center_x -= delta
+        if self.move_direction == 'vertical':
+            self.wall_list.move(0, -delta)
+        else:
+            self.wall_list.move(-delta, 0)
 
         self.moved_distance += abs(delta)
 
@@ -104,24 +185,32 @@ class MovingWall():
     
     def finish_moving(self):
         self.is_moving = False
-        self.player_on_platform = False
         if self.disappears:
+            # gone from the screen and from collisions, the sprites stay where they are
             self.wall_list.visible = False
-            for sprite in self.wall_list:
-                # move it far far away so it "disappears"
-                sprite.center_x = 100000
-                sprite.center_y = 100000
+            self.wall_list.collidable = False
 
     def reset(self):
         """Reset wall positions to original locations."""
         self.wall_list.visible = self.visible
-        self.player_on_platform = False
+        self.wall_list.collidable = True
         self.triggered = False
         self.moved_distance = 0
         self.is_moving = False
         self.move_speed = self.org_move_speed
-        for i, wall in enumerate(self.wall_list):
-            wall.center_x, wall.center_y = self.original_positions[i]
+        self.wall_list.place(0, 0)
+
+    def get_state(self):
+        """ where the wall is and how far along its move, see snapshot.py """
+        return (self.wall_list.offset, self.moved_distance, self.triggered, self.is_moving, self.move_speed,
+                self.wall_list.visible, self.wall_list.collidable)
+
+    def set_state(self, state):
+        """ put back a state from get_state """
+        offset, self.moved_distance, self.triggered, self.is_moving, self.move_speed, visible, collidable = state
+        self.wall_list.place(*offset)
+        self.wall_list.visible = visible
+        self.wall_list.collidable = collidable
 
 
 class Door():
@@ -169,6 +258,16 @@ class Door():
         self.is_moving = False
         self.move_direction = None
         self.can_be_touched = True
+
+    def get_state(self):
+        """ where the door is and how it moves, see snapshot.py """
+        return (self.pos_x, self.pos_y, self.opacity, self.can_be_touched, self.move_speed, self.move_distance,
+                self.moved, self.is_moving, self.move_over, self.move_direction)
+
+    def set_state(self, state):
+        """ put back a state from get_state """
+        (self.pos_x, self.pos_y, self.opacity, self.can_be_touched, self.move_speed, self.move_distance,
+         self.moved, self.is_moving, self.move_over, self.move_direction) = state
     
     def start_moving_down(self):
         """ should be called when game ends """
@@ -256,10 +355,10 @@ class Button():
         self.pos_y = pos_y
         self.triggered = False
         self.sprite_list = arcade.SpriteList()
-        self.sprite1 = arcade.Sprite("data/sprites/button1.png", scale=0.25, center_x=pos_x, center_y=pos_y,
-         flipped_diagonally=flipped_diagonally, flipped_vertically=flipped_vertically)
-        self.sprite2 = arcade.Sprite("data/sprites/button2.png", scale=0.25, center_x=pos_x, center_y=pos_y,
-         flipped_diagonally=flipped_diagonally, flipped_vertically=flipped_vertically)
+        self.sprite1 = arcade.Sprite(texture=load_texture("data/sprites/button1.png", flipped_diagonally=flipped_diagonally,
+         flipped_vertically=flipped_vertically, scale=0.25), scale=0.25, center_x=pos_x, center_y=pos_y)
+        self.sprite2 = arcade.Sprite(texture=load_texture("data/sprites/button2.png", flipped_diagonally=flipped_diagonally,
+         flipped_vertically=flipped_vertically, scale=0.25), scale=0.25, center_x=pos_x, center_y=pos_y)
         self.sprite2.visible = False
         self.sprite_list.append(self.sprite1)
         self.sprite_list.append(self.sprite2)
@@ -276,6 +375,18 @@ class Button():
         self.triggered = False
         self.sprite1.visible = True
         self.sprite2.visible = False
+
+    def get_state(self):
+        """ pressed or not, and shown or not, see snapshot.py """
+        return (self.triggered, self.sprite_list.visible)
+
+    def set_state(self, state):
+        """ put back a state from get_state """
+        triggered, self.sprite_list.visible = state
+        if triggered:
+            self.touched()
+        else:
+            self.reset()
     
 
 class FireBall():
@@ -288,20 +399,22 @@ class FireBall():
         self.v_x = 0
         self.v_y = 0
         self.boundary = boundary
-        self.sprite = arcade.Sprite("data/sprites/fireball.png", scale=1, center_x=pos_x, center_y=pos_y)
+        self.sprite = arcade.Sprite(texture=load_texture("data/sprites/fireball.png"), scale=1, center_x=pos_x, center_y=pos_y)
         # self.sprite.set_hit_box([(-28, -28), (0, -42), (28, -28), (42, 0), (28, 28), (0, 42), (-28, 28), (-42, 0)])
     
     def draw(self):
         self.sprite.draw()
         # self.sprite.draw_hit_box()
 
-    def update(self, gravity):
-        if self.pos_y + self.v_y <= self.boundary:
-            self.v_y *= -1
-        else:
-            self.v_y -= (gravity * 0.6)
-        self.pos_x += self.v_x
-        self.pos_y += self.v_y
+    def update(self, gravity, frames=1):
+        """ advance some frames, the sprite is only moved once at the end """
+        for _ in range(frames):
+            if self.pos_y + self.v_y <= self.boundary:
+                self.v_y *= -1
+            else:
+                self.v_y -= (gravity * 0.6)
+            self.pos_x += self.v_x
+            self.pos_y += self.v_y
         self.sprite.center_x = self.pos_x
         self.sprite.center_y = self.pos_y
     
@@ -314,15 +427,30 @@ class FireBall():
         self.pos_y = self.init_y
         self.v_x = 0
         self.v_y = 0
+        self.sprite.center_x = self.pos_x
+        self.sprite.center_y = self.pos_y
+
+    def get_state(self):
+        """ position and velocity, see snapshot.py """
+        return (self.pos_x, self.pos_y, self.v_x, self.v_y)
+
+    def set_state(self, state):
+        """ put back a state from get_state """
+        self.pos_x, self.pos_y, self.v_x, self.v_y = state
+        self.sprite.center_x = self.pos_x
+        self.sprite.center_y = self.pos_y
 
 
 class Missile():
-    def __init__(self, pos_x: int, pos_y: int, player_sprite: arcade.AnimatedTimeBasedSprite, direction = "right"):
-        """ a missile class initializer"""
-        self.sprite = arcade.Sprite("data/sprites/missile.png", 2)
+    def __init__(self, pos_x: int, pos_y: int, player_sprite: arcade.AnimatedTimeBasedSprite, direction = "right", line_of_sight=None):
+        """ a missile class initializer, line_of_sight(x0, y0, x1, y1) tells if it can see the player """
+        self.sprite = arcade.Sprite(texture=load_texture("data/sprites/missile.png"), scale=2)
         self.pos_x = pos_x
         self.pos_y = pos_y
+        # where the missile was before its last move, for swept checks
+        self.start = (pos_x, pos_y)
         self.player_sprite = player_sprite
+        self.line_of_sight = line_of_sight
         self.speed = 3.0  # constant speed magnitude
         self.turn_rate = 0.15  # steering acceleration factor (how quickly it can turn)
         self.sprite.center_x = pos_x
@@ -340,14 +468,33 @@ class Missile():
         angle = math.degrees(math.atan2(self.v_y, self.v_x))
         self.sprite.angle = angle - 90
     
+    def get_state(self):
+        """ position and velocity, see snapshot.py """
+        return (self.pos_x, self.pos_y, self.v_x, self.v_y)
+
+    def set_state(self, state):
+        """ put back a state from get_state """
+        self.pos_x, self.pos_y, self.v_x, self.v_y = state
+        self.start = (self.pos_x, self.pos_y)
+        self.sprite.center_x = self.pos_x
+        self.sprite.center_y = self.pos_y
+        self._update_rotation()
+
+    def can_see_player(self):
+        """True if no wall is between the missile and the player"""
+        if self.line_of_sight is None:
+            return True
+        return self.line_of_sight(self.pos_x, self.pos_y, self.player_sprite.center_x, self.player_sprite.center_y)
+
     def draw(self):
         """Draw the missile sprite"""
         self.sprite.draw()
     
     def update(self):
         """Update missile position with realistic physics - gradual steering"""
-        if self.player_sprite is None:
-            # If no target, just move in current direction
+        self.start = (self.pos_x, self.pos_y)
+        if self.player_sprite is None or not self.can_see_player():
+            # If no target in sight, just move in current direction
             self.pos_x += self.v_x
             self.pos_y += self.v_y
             self.sprite.center_x = self.pos_x
@@ -414,6 +561,99 @@ class Missile():
         self._update_rotation()
 
 
+class Cannon():
+    """Cannon class that spawns missiles periodically"""
+    
+    def __init__(self, pos_x: int, pos_y: int, player_sprite, scheduler, flipped = False, line_of_sight = None, fire_line = None):
+        """Initialize cannon at given position, it fires on the level's scheduler (in seconds).
+        Its missiles only steer while line_of_sight() says they see the player.
+        It only fires once the player is past fire_line on the side it faces"""
+        self.sprite = arcade.Sprite()
+        self.sprite.scale = 0.5
+        self.sprite.center_x = pos_x
+        self.sprite.center_y = pos_y
+        self.flipped = flipped
+        self.sprite.flipped_horizontally = self.flipped
+        self.player_sprite = player_sprite
+        self.line_of_sight = line_of_sight
+        self.fire_line = fire_line
+        self.missile_list = []
+        self.scheduler = scheduler
+        self.spawn_interval = 3.0  # spawn every 3 seconds
+        # each cannon's timer needs its own name, see scheduler.py
+        self.timer_name = f"cannon {pos_x} {pos_y}"
+        self.scheduler.every(self.spawn_interval, self.fire, name=self.timer_name)
+        self.animation_duration = 0.5  # duration of firing animation in seconds
+        self.firing_start_time = None
+        
+        # Load animation textures
+        self.idle_texture = load_texture("data/sprites/cannon.png", flipped_horizontally=self.flipped, scale=self.sprite.scale)
+        self.firing_textures = [
+            load_texture("data/sprites/cannon2.png", flipped_horizontally=self.flipped, scale=self.sprite.scale),
+            load_texture("data/sprites/cannon3.png", flipped_horizontally=self.flipped, scale=self.sprite.scale),
+            load_texture("data/sprites/cannon4.png", flipped_horizontally=self.flipped, scale=self.sprite.scale),
+            load_texture("data/sprites/cannon5.png", flipped_horizontally=self.flipped, scale=self.sprite.scale),
+        ]
+        
+        # Set initial texture to idle
+        self.sprite.texture = self.idle_texture
+    
+    def draw(self):
+        """Draw the cannon and all active missiles"""
+        self.sprite.draw()
+        for missile in self.missile_list:
+            missile.draw()
+    
+    def start_firing_animation(self, current_time: float):
+        """Start the firing animation"""
+        self.firing_start_time = current_time
+        # Set to first frame of firing animation
+        self.sprite.texture = self.firing_textures[0]
+    
+    def fire(self):
+        """Spawn a missile if the player is on this cannon's side, runs every spawn_interval"""
+        if self.fire_line is None or (self.player_sprite.center_x < self.fire_line if self.flipped else self.player_sprite.center_x > self.fire_line):
+            missile = Missile(self.sprite.center_x + 30 if self.flipped else self.sprite.center_x - 30, self.sprite.center_y - 10, self.player_sprite, "right" if self.flipped else "left", self.line_of_sight)
+            self.missile_list.append(missile)
+            # Start firing animation
+            self.start_firing_animation(self.scheduler.now)
+
+    def update(self, current_time: float, animate: bool = True):
+        """Update the firing animation and the missiles, current_time is the scheduler's.
+        Off screen the firing animation can be skipped, it only depends on the time."""
+        # Update firing animation
+        if animate and self.firing_start_time is not None:
+            elapsed = current_time - self.firing_start_time
+            if elapsed >= self.animation_duration:
+                # Animation complete, return to idle
+                self.sprite.texture = self.idle_texture
+                self.firing_start_time = None
+            else:
+                # Calculate which frame to show
+                frame_index = int((elapsed / self.animation_duration) * len(self.firing_textures))
+                frame_index = min(frame_index, len(self.firing_textures) - 1)  # Clamp to valid range
+                self.sprite.texture = self.firing_textures[frame_index]
+        
+        # Update all missiles
+        for missile in self.missile_list[:]:  # Use slice to safely iterate while modifying
+            missile.update()
+    
+    def get_state(self):
+        """ the firing animation and the missiles, the timer is the scheduler's, see snapshot.py """
+        return (self.firing_start_time, tuple(missile.get_state() for missile in self.missile_list))
+
+    def set_state(self, state):
+        """ put back a state from get_state """
+        self.firing_start_time, missiles = state
+        self.sprite.texture = self.idle_texture if self.firing_start_time is None else self.firing_textures[0]
+        direction = "right" if self.flipped else "left"
+        self.missile_list.clear()
+        for missile_state in missiles:
+            missile = Missile(missile_state[0], missile_state[1], self.player_sprite, direction, self.line_of_sight)
+            missile.set_state(missile_state)
+            self.missile_list.append(missile)
+
+
 class EndScreen(arcade.View):
     """Simple end screen with stats and navigation buttons."""
     def __init__(self, window, title, elapsed_seconds, attempts, replay_view_class, next_view_class):
@@ -0,0 +1,369 @@
+"""
+Platformer physics on a tile grid.
+
+All our solid geometry is grid tiles, so instead of testing the player's
+polygon against every nearby sprite, each sprite list is turned into a grid of
+cells holding the bounding boxes of its tiles. Movement and ground checks only
+look at the few cells the player's box covers.
+
+Moves are swept: each axis move looks at everything between where the player
+is and where it's going, and a wall that moved into the player pushes it the
+way the wall was going. Neither depends on how far things move in a frame.
+
+A sprite list with collidable = False is skipped whole, see
+collision.collidable.
+
+Walls that move with carries set (MovingWalls made with carry=True) are
+kinematic platforms: whatever stands on one is carried by its move before the
+player's own move is resolved. Other walls move away under the player, a
+trapdoor drops and the player falls after it.
+
+The same grids answer ray casts: a segment walks the cells it crosses in order
+(DDA) and stops at the first tile box it enters, so line of sight checks cost
+a few cell lookups instead of a polygon test per sprite.
+"""
+import math
+
+import arcade
+
+from collision import collidable, list_offset
+
+
+# size of a grid cell, the tiles are 128px drawn at 0.25
+CELL_SIZE = 32
+# how close above a moving platform the player counts as standing on it
+CARRY_DISTANCE = 1
+
+
+class TileGrid():
+    """
+    Occupancy grid of one sprite list.
+
+    Boxes are stored relative to where the sprites were when the grid was
+    built. A list that is moved as a whole is followed through the offset of
+    its first sprite, or the group's for a SpriteGroup (a MovingWall), so the
+    grid never has to be rebuilt while it moves. Sprites moved on their own
+    aren't supported.
+    """
+
+    def __init__(self, sprite_list, cell_size=CELL_SIZE):
+        """ initializer """
+        self.sprite_list = sprite_list
+        self.cell_size = cell_size
+        self.build()
+
+    def build(self):
+        """ (re)build the cells from the sprites' current positions """
+        # (col, row) -> list of (left, bottom, right, top, sprite)
+        self.cells = {}
+        self.count = len(self.sprite_list)
+        self.reference = self.sprite_list[0] if self.count else None
+        self.origin = self.reference.position if self.reference else (0, 0)
+        for sprite in self.sprite_list:
+            points = sprite.get_adjusted_hit_box()
+            box = (min(x for x, y in points), min(y for x, y in points),
+                   max(x for x, y in points), max(y for x, y in points), sprite)
+            for cell in self._cells_in(box[0], box[1], box[2], box[3]):
+                self.cells.setdefault(cell, []).append(box)
+
+    def _cells_in(self, left, bottom, right, top):
+        """ every cell touched by a box, in grid coordinates """
+        for col in range(math.floor(left / self.cell_size), math.floor(right / self.cell_size) + 1):
+            for row in range(math.floor(bottom / self.cell_size), math.floor(top / self.cell_size) + 1):
+                yield col, row
+
+    @property
+    def offset(self):
+        """ how far the list has moved since the grid was built """
+        return list_offset(self.sprite_list, self.reference, self.origin)
+
+    def refresh(self):
+        """ rebuild if sprites were added or removed """
+        if len(self.sprite_list) != self.count or (self.count and self.sprite_list[0] is not self.reference):
+            self.build()
+
+    def boxes(self, left, bottom, right, top):
+        """ world boxes of the tiles overlapping a box, touching edges don't count """
+        self.refresh()
+        if not self.cells or not collidable(self.sprite_list):
+            return []
+        offset_x, offset_y = self.offset
+        found = []
+        for cell in self._cells_in(left - offset_x, bottom - offset_y, right - offset_x, top - offset_y):
+            for box_left, box_bottom, box_right, box_top, sprite in self.cells.get(cell, ()):
+                box = (box_left + offset_x, box_bottom + offset_y, box_right + offset_x, box_top + offset_y, sprite)
+                if box[0] < right and box[2] > left and box[1] < top and box[3] > bottom and box not in found:
+                    found.append(box)
+        return found
+
+    def raycast(self, start_x, start_y, end_x, end_y):
+        """
+        First tile a segment from start to end enters, as (fraction of the way
+        along, x, y, sprite), or None if it gets through.
+        """
+        self.refresh()
+        if not self.cells or not collidable(self.sprite_list):
+            return None
+        offset_x, offset_y = self.offset
+        x, y = start_x - offset_x, start_y - offset_y
+        dx, dy = end_x - start_x, end_y - start_y
+        size = self.cell_size
+        col, row = math.floor(x / size), math.floor(y / size)
+        end_col, end_row = math.floor((x + dx) / size), math.floor((y + dy) / size)
+        # how far along the segment the next column / row border is, and a cell's worth
+        step_col, step_row = (1 if dx > 0 else -1), (1 if dy > 0 else -1)
+        next_x = ((col + (dx > 0)) * size - x) / dx if dx else math.inf
+        next_y = ((row + (dy > 0)) * size - y) / dy if dy else math.inf
+        delta_x = size / abs(dx) if dx else math.inf
+        delta_y = size / abs(dy) if dy else math.inf
+
+        hit = None
+        while True:
+            for box in self.cells.get((col, row), ()):
+                t = segment_enters_box(x, y, dx, dy, box[0], box[1], box[2], box[3])
+                if t is not None and (hit is None or t < hit[0]):
+                    hit = (t, box[4])
+            cell_exit = min(next_x, next_y)
+            # boxes span cells, a hit past this cell might still be beaten in the next one
+            if (hit is not None and hit[0] <= cell_exit) or (col, row) == (end_col, end_row) or cell_exit > 1:
+                break
+            if next_x < next_y:
+                col += step_col
+                next_x += delta_x
+            else:
+                row += step_row
+                next_y += delta_y
+        if hit is None:
+            return None
+        t, sprite = hit
+        return t, start_x + dx * t, start_y + dy * t, sprite
+
+
+def segment_enters_box(x, y, dx, dy, left, bottom, right, top):
+    """
+    How far along a segment (0 to 1) it enters a box, 0 if it starts inside,
+    None if it misses. Running along an edge doesn't count.
+    """
+    enter, leave = 0.0, 1.0
+    for start, delta, low, high in ((x, dx, left, right), (y, dy, bottom, top)):
+        if not delta:
+            if not low < start < high:
+                return None
+            continue
+        t_low, t_high = (low - start) / delta, (high - start) / delta
+        if t_low > t_high:
+            t_low, t_high = t_high, t_low
+        enter, leave = max(enter, t_low), min(leave, t_high)
+        if enter >= leave:
+            return None
+    return enter
+
+
+class GridPhysicsEnginePlatformer():
+    """
+    Drop-in for arcade.PhysicsEnginePlatformer on tile levels.
+    The player collides with its hit box's bounding box, the walls with their
+    tiles' bounding boxes, looked up in a TileGrid per sprite list.
+    """
+
+    def __init__(self, player_sprite, platforms=None, gravity_constant=0.5, ladders=None, walls=None, cell_size=CELL_SIZE):
+        """ initializer, same arguments as arcade's engine (ladders aren't supported) """
+        if ladders:
+            raise ValueError("ladders aren't supported by the grid engine")
+        self.platforms = self._as_lists(platforms)
+        self.walls = self._as_lists(walls)
+        self.grids = [TileGrid(sprite_list, cell_size) for sprite_list in self.walls + self.platforms]
+        # where each grid was on the last update, to tell which way moving walls went
+        self.grid_offsets = [(grid.reference, grid.offset) for grid in self.grids]
+        self.player_sprite = player_sprite
+        self.gravity_constant = gravity_constant
+        self.jumps_since_ground = 0
+        self.allowed_jumps = 1
+        self.allow_multi_jump = False
+
+    def _as_lists(self, sprite_lists):
+        """ a sprite list, several or None, as a list """
+        if not sprite_lists:
+            return []
+        if isinstance(sprite_lists, arcade.SpriteList):
+            return [sprite_lists]
+        return list(sprite_lists)
+
+    def _player_box(self):
+        """ bounding box of the player's hit box """
+        points = self.player_sprite.get_adjusted_hit_box()
+        return (min(x for x, y in points), min(y for x, y in points),
+                max(x for x, y in points), max(y for x, y in points))
+
+    def hits(self, left, bottom, right, top):
+        """ boxes of every wall overlapping a box """
+        found = []
+        for grid in self.grids:
+            found += grid.boxes(left, bottom, right, top)
+        return found
+
+    def raycast(self, start_x, start_y, end_x, end_y):
+        """ first wall a segment hits, (fraction of the way along, x, y, sprite) or None """
+        first = None
+        for grid in self.grids:
+            hit = grid.raycast(start_x, start_y, end_x, end_y)
+            if hit is not None and (first is None or hit[0] < first[0]):
+                first = hit
+        return first
+
+    def line_of_sight(self, start_x, start_y, end_x, end_y):
+        """ True if no wall is in the way between two points """
+        return all(grid.raycast(start_x, start_y, end_x, end_y) is None for grid in self.grids)
+
+    def can_jump(self, y_distance=5):
+        """ True if there is a floor within y_distance under the player """
+        left, bottom, right, top = self._player_box()
+        if self.hits(left, bottom - y_distance, right, top - y_distance):
+            self.jumps_since_ground = 0
+            return True
+        return self.allow_multi_jump and self.jumps_since_ground < self.allowed_jumps
+
+    def enable_multi_jump(self, allowed_jumps):
+        """ allowed_jumps includes the first one, call increment_jump_counter() on every jump """
+        self.allowed_jumps = allowed_jumps
+        self.allow_multi_jump = True
+
+    def disable_multi_jump(self):
+        """ back to a single jump """
+        self.allow_multi_jump = False
+        self.allowed_jumps = 1
+        self.jumps_since_ground = 0
+
+    def jump(self, velocity):
+        """ have the player jump """
+        self.player_sprite.change_y = velocity
+        self.increment_jump_counter()
+
+    def increment_jump_counter(self):
+        """ count a jump for multi-jump """
+        if self.allow_multi_jump:
+            self.jumps_since_ground += 1
+
+    def _grid_moves(self):
+        """ how far each grid moved since the last update """
+        moves = []
+        for i, grid in enumerate(self.grids):
+            reference, offset = self.grid_offsets[i]
+            if grid.reference is not reference:
+                # rebuilt, it didn't move
+                moves.append((0, 0))
+            elif hasattr(grid.sprite_list, "last_move"):
+                # a SpriteGroup, jumps (place) aren't moves
+                moves.append(grid.sprite_list.last_move)
+            else:
+                moves.append((grid.offset[0] - offset[0], grid.offset[1] - offset[1]))
+            self.grid_offsets[i] = (grid.reference, grid.offset)
+        return moves
+
+    def _carry(self, moves):
+        """ move the player with the platform it was standing on """
+        left, bottom, right, top = self._player_box()
+        for grid, (move_x, move_y) in zip(self.grids, moves):
+            if not move_x and not move_y or not getattr(grid.sprite_list, "carries", False):
+                continue
+            # the platform's boxes before the move, under the player's feet
+            if grid.boxes(left + move_x, bottom + move_y - CARRY_DISTANCE, right + move_x, bottom + move_y):
+                self.player_sprite.center_x += move_x
+                self.player_sprite.center_y += move_y
+                return
+
+    def _push_out(self, moves):
+        """
+        If a wall moved into the player, push the player out the way the wall
+        was going, or the shortest way if it didn't move.
+        """
+        player = self.player_sprite
+        left, bottom, right, top = self._player_box()
+        for grid, moved in zip(self.grids, moves):
+            for box in grid.boxes(left, bottom, right, top):
+                if not (box[0] < right and box[2] > left and box[1] < top and box[3] > bottom):
+                    # already pushed clear by an earlier box
+                    continue
+                exits = [(box[2] - left, 0), (box[0] - right, 0), (0, box[3] - bottom), (0, box[1] - top)]
+                exits = [move for move in exits if move[0] * moved[0] + move[1] * moved[1] > 0] or exits
+                move_x, move_y = min(exits, key=lambda move: abs(move[0]) + abs(move[1]))
+                player.center_x += move_x
+                player.center_y += move_y
+                left, bottom, right, top = left + move_x, bottom + move_y, right + move_x, top + move_y
+
+    def update(self):
+        """ apply gravity, move the player and resolve collisions, returns the sprites hit """
+        player = self.player_sprite
+        player.change_y -= self.gravity_constant
+        moves = self._grid_moves()
+        self._carry(moves)
+        self._push_out(moves)
+        hit_sprites = []
+
+        # move in y, stop flush against the first thing in the way
+        left, bottom, right, top = self._player_box()
+        dy = player.change_y
+        hits = self.hits(left, min(bottom, bottom + dy), right, max(top, top + dy))
+        if hits:
+            if dy > 0:
+                dy = min(box[1] for box in hits) - top
+            elif dy < 0:
+                dy = max(box[3] for box in hits) - bottom
+            player.change_y = 0
+            hit_sprites += [box[4] for box in hits]
+        player.center_y = round(player.center_y + dy, 2)
+        bottom, top = bottom + dy, top + dy
+
+        # move in x, stepping up anything no higher than the move itself
+        dx = player.change_x
+        if dx:
+            hits = self.hits(min(left, left + dx), bottom, max(right, right + dx), top)
+            if hits:
+                hit_sprites += [box[4] for box in hits if box[4] not in hit_sprites]
+                step = max(box[3] for box in hits) - bottom
+                if 0 < step <= abs(dx) and not self.hits(min(left, left + dx), bottom + step, max(right, right + dx), top + step):
+                    player.center_y += step
+                elif dx > 0:
+                    dx = max(0, min(box[0] for box in hits) - right)
+                else:
+                    dx = min(0, max(box[2] for box in hits) - left)
+            player.center_x += dx
+
+        return hit_sprites
+
+
+def merge_tiles(sprite_list, cell_size=CELL_SIZE):
+    """
+    Merge solid tiles into as few rectangles as possible, for physics engines
+    that pay per shape. Greedy: each rectangle grows right along its row, then
+    up while the whole row above is solid. Tiles whose hit box doesn't fill
+    their cell are kept as their own box. Returns (left, bottom, right, top) boxes.
+    """
+    cells = set()
+    boxes = []
+    for sprite in sprite_list:
+        points = sprite.get_adjusted_hit_box()
+        left, bottom = min(x for x, y in points), min(y for x, y in points)
+        right, top = max(x for x, y in points), max(y for x, y in points)
+        col, row = round(left / cell_size), round(bottom / cell_size)
+        if (abs(left - col * cell_size) < 0.01 and abs(bottom - row * cell_size) < 0.01
+                and abs(right - left - cell_size) < 0.01 and abs(top - bottom - cell_size) < 0.01):
+            cells.add((col, row))
+        else:
+            boxes.append((left, bottom, right, top))
+
+    for row, col in sorted((row, col) for col, row in cells):
+        if (col, row) not in cells:
+            # already part of a rectangle
+            continue
+        end = col
+        while (end + 1, row) in cells:
+            end += 1
+        top = row
+        while all((c, top + 1) in cells for c in range(col, end + 1)):
+            top += 1
+        for c in range(col, end + 1):
+            for r in range(row, top + 1):
+                cells.discard((c, r))
+        boxes.append((col * cell_size, row * cell_size, (end + 1) * cell_size, (top + 1) * cell_size))
+    return boxes
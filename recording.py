@@ -0,0 +1,98 @@
+"""
+What a level keeps of its play besides the play itself.
+
+Every level has the same three: the last seconds of its snapshot to go back
+to while BACKSPACE is held (rewind.py), this try recorded and the best run
+played back along it (ghost.py), and the live telemetry stream when the game
+runs with one (telemetry.py). LevelRecording holds them for a level and is
+called from the same few places in each:
+
+    on_key_press / on_key_release   BACKSPACE starts and stops rewinding
+    frame(delta_time)               at the top of update(), for telemetry
+    tick(delta_time)                once the level is in play, True means the
+                                    tick went back in time and the level
+                                    skips the rest of its update
+    died()                          from reset()
+    restart()                       from finish_reset(), a new try
+    complete()                      from level_complete()
+"""
+import arcade
+
+from rewind import Rewind
+from ghost import Ghost, GhostRecorder, ghost_path, HIDDEN
+from telemetry import get_server
+
+
+class LevelRecording():
+    """ a level's rewind buffer, ghost and telemetry """
+
+    def __init__(self, view, level_name, sprite_path, scale):
+        """ initializer, the view's snapshot has to be set up """
+        self.view = view
+        self.level_name = level_name
+        self.rewind = Rewind(view.snapshot)
+        self.rewinding = False
+        # the best run so far played back, and this one recorded
+        self.ghost = Ghost.open(level_name, sprite_path, scale)
+        self.ghost_recorder = GhostRecorder()
+        self.telemetry = get_server()
+
+    def on_key_press(self, key):
+        """ BACKSPACE goes back in time while it's held """
+        if key == arcade.key.BACKSPACE:
+            self.rewinding = True
+
+    def on_key_release(self, key):
+        """ see on_key_press """
+        if key == arcade.key.BACKSPACE:
+            self.rewinding = False
+
+    def draw(self):
+        """ draw the ghost, if there's a best run """
+        if self.ghost is not None:
+            self.ghost.draw()
+
+    def frame(self, delta_time):
+        """ a tick of the level, from the top of its update() """
+        if self.telemetry is not None:
+            self.telemetry.frame(self.view, delta_time)
+
+    def tick(self, delta_time):
+        """
+        Keep the tick the level is about to play, or while rewinding go back
+        one instead and return True, the level then skips the tick.
+        """
+        if self.rewinding:
+            ticks = self.rewind.rewind()
+            # this try's recording and the ghost go back with it
+            self.ghost_recorder.rewind(ticks)
+            if self.ghost is not None:
+                self.ghost.rewind(ticks)
+            return True
+        self.rewind.record()
+        player = self.view.player_sprite
+        self.ghost_recorder.record(player.center_x, player.center_y,
+                                   self.view.anim_code if self.view.player_list.visible else HIDDEN)
+        if self.ghost is not None:
+            self.ghost.advance(delta_time)
+        return False
+
+    def died(self):
+        """ the player died, from the level's reset() """
+        if self.telemetry is not None:
+            self.telemetry.death(self.view)
+
+    def restart(self):
+        """ a new try, recorded from its start and raced against the ghost from its start """
+        self.rewind.clear()
+        self.ghost_recorder = GhostRecorder()
+        if self.ghost is not None:
+            self.ghost.restart()
+
+    def complete(self):
+        """ the level is done, keep this run if it's the best one, the old ghost's file gets replaced """
+        if self.ghost is not None:
+            self.ghost.close()
+        self.ghost_recorder.save_if_best(ghost_path(self.level_name))
+        if self.telemetry is not None:
+            self.telemetry.complete(self.view)
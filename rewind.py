@@ -0,0 +1,105 @@
+"""
+Rewind.
+
+The last few seconds of a level, one Snapshot capture per tick, in a ring
+buffer. Every KEYFRAME_INTERVAL ticks a whole capture is kept (a keyframe),
+the ticks in between only keep the entries that differ from their keyframe.
+Going back to any tick is then one keyframe plus one delta, restored in a
+single Snapshot.restore.
+
+Entries that didn't change since the tick before are kept as the very same
+object, so a delta is found by identity instead of comparing values, and
+state that sits still (the random generator's 625 words between spawns, a
+wall that's done moving) is stored once however many ticks refer to it.
+"""
+from collections import deque
+
+
+# seconds of play kept, at 60 ticks a second
+REWIND_SECONDS = 10
+TICKS_PER_SECOND = 60
+# ticks between full captures
+KEYFRAME_INTERVAL = 60
+
+
+class Rewind():
+    """ a ring buffer of the last ticks of a level's Snapshot """
+
+    def __init__(self, snapshot, seconds=REWIND_SECONDS, rate=TICKS_PER_SECOND, keyframe_interval=KEYFRAME_INTERVAL):
+        """ initializer """
+        self.snapshot = snapshot
+        self.keyframe_interval = keyframe_interval
+        # (keyframe, delta) per tick, oldest first. Keyframes are shared by
+        # their ticks and go away with the last of them
+        self.frames = deque(maxlen=seconds * rate)
+        self.keyframe = None
+        # ticks recorded since the keyframe
+        self.since_keyframe = 0
+        # the previous capture, to reuse unchanged values
+        self.last = {}
+
+    def __len__(self):
+        """ ticks that can be gone back to """
+        return len(self.frames)
+
+    def record(self):
+        """ keep the state as it is now as the newest tick, a buffer of 0 seconds keeps nothing """
+        if not self.frames.maxlen:
+            return
+        state = self.snapshot.capture()
+        last = self.last
+        for name, value in state.items():
+            previous = last.get(name)
+            if previous is not None and previous == value:
+                state[name] = previous
+        self.last = state
+
+        if self.keyframe is None or self.since_keyframe >= self.keyframe_interval:
+            self.keyframe = state
+            self.since_keyframe = 0
+            self.frames.append((state, None))
+        else:
+            keyframe = self.keyframe
+            delta = {name: value for name, value in state.items() if value is not keyframe.get(name)}
+            self.frames.append((keyframe, delta))
+        self.since_keyframe += 1
+
+    def state_at(self, ticks_back):
+        """ the state recorded ticks_back ticks before the newest one """
+        keyframe, delta = self.frames[-1 - ticks_back]
+        if not delta:
+            return keyframe
+        state = dict(keyframe)
+        state.update(delta)
+        return state
+
+    def rewind(self, ticks=1):
+        """
+        Undo some ticks, at most as many as are kept: the level is put back as
+        it was when the oldest of them was recorded, and they're forgotten, the
+        next record() records that tick again. Returns the ticks undone.
+        """
+        ticks = min(ticks, len(self.frames))
+        if ticks <= 0:
+            return 0
+        state = self.state_at(ticks - 1)
+        for _ in range(ticks):
+            self.frames.pop()
+        self.snapshot.restore(state)
+        # the next tick recorded carries on from the newest one left
+        if self.frames:
+            keyframe, delta = self.frames[-1]
+            self.keyframe = keyframe
+            self.since_keyframe = sum(1 for frame_keyframe, _ in self.frames if frame_keyframe is keyframe)
+        else:
+            self.keyframe = None
+            self.since_keyframe = 0
+        self.last = state
+        return ticks
+
+    def clear(self):
+        """ forget every tick """
+        self.frames.clear()
+        self.keyframe = None
+        self.since_keyframe = 0
+        self.last = {}
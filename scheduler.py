@@ -0,0 +1,122 @@
+"""
+Timed events for level scripting.
+
+Levels register one-shot and repeating callbacks on a Scheduler and advance
+it once per update. Pending timers sit in a heap ordered by when they're due,
+so an update with nothing due only looks at the top of the heap.
+
+Time is whatever the level advances it by: frames for the levels whose traps
+are timed in frames, seconds (delta_time) for the ones timed in seconds.
+Only the time the scheduler was advanced counts, so a level that stops
+advancing it (paused, resetting) stops its timers too.
+
+Timers have names, the callback's by default, so the pending ones can be
+saved as plain data (get_state) and put back (set_state) and cancelled by
+name. Callbacks sharing a name (two cannons' fire) need their own names.
+A state can name a timer this scheduler never had, when it comes from
+another copy of the level (solver.py's workers): its callback is then the
+owner's method of that name.
+"""
+import heapq
+
+
+class Timer():
+    """ a scheduled callback, returned by Scheduler.after and Scheduler.every """
+
+    def __init__(self, due, callback, interval=None, name=None):
+        """ initializer """
+        self.due = due
+        self.callback = callback
+        self.name = name or callback.__name__
+        # None for a one-shot timer
+        self.interval = interval
+        self.cancelled = False
+
+    def cancel(self):
+        """ drop the timer, it's skipped when it comes up """
+        self.cancelled = True
+
+
+class Scheduler():
+    """ a heap of timers on the level's simulation time """
+
+    def __init__(self, owner=None):
+        """ initializer, owner is the level whose methods the timers call """
+        self.owner = owner
+        self.now = 0
+        # (due, order, timer), order keeps timers due together in the order they were added
+        self.heap = []
+        self.order = 0
+        # the timer whose callback is running, it's out of the heap meanwhile
+        self.running = None
+        # timer name -> callback, to rebuild timers from their state
+        self.callbacks = {}
+
+    def _push(self, timer):
+        """ put a timer in the heap """
+        known = self.callbacks.setdefault(timer.name, timer.callback)
+        if known != timer.callback:
+            raise ValueError(f"timer name '{timer.name}' is already used by another callback")
+        heapq.heappush(self.heap, (timer.due, self.order, timer))
+        self.order += 1
+        return timer
+
+    def after(self, delay, callback, name=None):
+        """ call callback() once, delay from now """
+        return self._push(Timer(self.now + delay, callback, name=name))
+
+    def every(self, interval, callback, delay=None, name=None):
+        """ call callback() every interval, the first time after delay (one interval by default) """
+        if interval <= 0:
+            raise ValueError("a repeating timer needs an interval above 0")
+        return self._push(Timer(self.now + (interval if delay is None else delay), callback, interval, name))
+
+    def advance(self, amount):
+        """ move time forward and run every timer that came due, in order """
+        self.now += amount
+        while self.heap and self.heap[0][0] <= self.now:
+            timer = heapq.heappop(self.heap)[2]
+            if timer.cancelled:
+                continue
+            self.running = timer
+            try:
+                timer.callback()
+            finally:
+                self.running = None
+            if timer.interval is not None and not timer.cancelled:
+                # from when it was due, not from now, so it doesn't drift
+                timer.due += timer.interval
+                self._push(timer)
+
+    def cancel(self, name):
+        """ drop the pending timers with a name """
+        for _, _, timer in self.heap:
+            if timer.name == name:
+                timer.cancel()
+        if self.running is not None and self.running.name == name:
+            self.running.cancel()
+
+    def cancel_all(self):
+        """ drop every pending timer """
+        for _, _, timer in self.heap:
+            timer.cancel()
+        if self.running is not None:
+            self.running.cancel()
+        self.heap = []
+
+    def get_state(self):
+        """ the time and the pending timers, as plain data """
+        timers = tuple((due, order, timer.interval, timer.name)
+                       for due, order, timer in sorted(self.heap, key=lambda entry: entry[:2]) if not timer.cancelled)
+        return (self.now, self.order, timers)
+
+    def set_state(self, state):
+        """ put back a state from get_state, the timers pending now are dropped """
+        self.cancel_all()
+        self.now, self.order, timers = state
+        for due, order, interval, name in timers:
+            if name not in self.callbacks:
+                self.callbacks[name] = getattr(self.owner, name)
+            timer = Timer(due, self.callbacks[name], interval, name)
+            self.heap.append((due, order, timer))
+        heapq.heapify(self.heap)
@@ -0,0 +1,95 @@
+"""
+Level state snapshots.
+
+A snapshot is everything about a level that changes while it's played: the
+player, the door, the traps and their progress, the timers and the random
+generator. A level registers where that state lives once, then capture()
+takes all of it in one go and restore() puts all of it back, which is how
+the levels reset after a death (restoring the state captured at the start)
+and what checkpoints and tools build on.
+
+The state is plain data: a dict of entry name -> tuple of numbers, strings,
+bools and None (nested tuples for lists of things), so it can be compared
+entry by entry, hashed, and written out with dumps(). Objects take part
+through two methods:
+
+    get_state()       returns their state as such a tuple
+    set_state(state)  puts it back, from the tuple or the lists JSON made of it
+
+Presentation isn't part of it: the camera, particles, sounds, the death count
+and the clock keep going across a restore.
+"""
+import json
+import random
+
+
+def sprite_state(sprite):
+    """ where a sprite is, how it moves and shows """
+    return (sprite.center_x, sprite.center_y, sprite.change_x, sprite.change_y, sprite.angle, sprite.alpha, sprite.visible)
+
+
+def set_sprite_state(sprite, state):
+    """ put back a state from sprite_state """
+    sprite.center_x, sprite.center_y, sprite.change_x, sprite.change_y, sprite.angle, alpha, visible = state
+    # arcade keeps visibility as the alpha, setting visible would undo a partial alpha
+    sprite.alpha = alpha if visible else 0
+
+
+class Snapshot():
+    """ the places a level keeps its state, captured and restored together """
+
+    def __init__(self):
+        """ initializer """
+        # name -> (get, set), in the order they were added
+        self.entries = {}
+
+    def add(self, name, get, set):
+        """ register state read by get() and put back by set(state) """
+        if name in self.entries:
+            raise ValueError(f"snapshot entry '{name}' is already registered")
+        self.entries[name] = (get, set)
+
+    def add_object(self, name, obj):
+        """ register an object with get_state() and set_state(state) """
+        self.add(name, obj.get_state, obj.set_state)
+
+    def add_sprite(self, name, sprite):
+        """ register a sprite's position, velocity, angle, alpha and visibility """
+        self.add(name, lambda: sprite_state(sprite), lambda state: set_sprite_state(sprite, state))
+
+    def add_attrs(self, name, obj, attrs):
+        """ register some plain attributes of an object """
+        def get():
+            return tuple(getattr(obj, attr) for attr in attrs)
+
+        def set(state):
+            for attr, value in zip(attrs, state):
+                setattr(obj, attr, value)
+        self.add(name, get, set)
+
+    def add_random(self, name="random", rng=random):
+        """ register a random generator, the random module's by default """
+        def set(state):
+            version, internal, gauss = state
+            rng.setstate((version, tuple(internal), gauss))
+        self.add(name, rng.getstate, set)
+
+    def capture(self, skip=()):
+        """ the state of every entry, entries in skip aren't read """
+        return {name: get() for name, (get, _) in self.entries.items() if name not in skip}
+
+    def restore(self, state, skip=()):
+        """ put back a captured state, entries in skip keep what they have now """
+        for name, (_, set) in self.entries.items():
+            if name in state and name not in skip:
+                set(state[name])
+
+
+def dumps(state):
+    """ a captured state as bytes """
+    return json.dumps(state, separators=(",", ":")).encode("utf-8")
+
+
+def loads(data):
+    """ a state written by dumps, tuples come back as lists """
+    return json.loads(data)
@@ -0,0 +1,193 @@
+"""
+Speedrun route solver.
+
+Finds fast inputs through a level by beam search over headless runs of it
+(see headless.py). Every search step takes the states kept so far, tries each
+input on each of them for a few ticks, and keeps the beam_width most promising
+results: closest to the door, or for level 6 the BOSS the most hurt. Deaths
+are dropped, so are results that are the same state as one already kept: the
+player's position and speed rounded, plus everything else about the level
+(traps, walls, timers), hashed. The steps run on a process pool, each worker
+with its own copy of the level, states go back and forth as snapshot bytes.
+
+The first route reaching the door is written as an input script, a JSON file
+that replay() runs again:
+
+    {"level": 1, "seed": 0, "ticks": 412, "inputs": [["right", 24], ["right+jump", 8], ...]}
+
+Run it from the game's folder:
+    python solver.py 1 --beam 256 --workers 8
+    python solver.py --replay routes/level1.json
+"""
+import argparse
+import hashlib
+import heapq
+import json
+import os
+import sys
+import time
+from multiprocessing import get_context
+
+from headless import HeadlessLevel, PLAYING, FINISHED, buttons_name, parse_buttons, STEP
+from snapshot import dumps
+
+
+BEAM_WIDTH = 256
+# ticks an input is held for, the search's step
+REPEAT = 4
+# give up after this many seconds of play
+MAX_SECONDS = 90
+# what's rounded off the player before states are compared, in pixels and pixels per tick
+POSITION_STEP = 2
+SPEED_STEP = 0.5
+# entries left out of the state compared: the player is rounded instead, the
+# random numbers and the camera and activity region that follow the player
+# don't make a state new
+KEY_SKIP = ("player", "random", "camera", "activity")
+
+ROUTE_DIR = "routes"
+
+_level = None
+
+
+def route_path(number):
+    """ the default route file of a level """
+    return os.path.join(ROUTE_DIR, f"level{number}.json")
+
+
+def state_key(level_state):
+    """ the key two states are the same by, see KEY_SKIP """
+    x, y, change_x, change_y = level_state["player"][:4]
+    rest = {name: value for name, value in level_state.items() if name not in KEY_SKIP}
+    digest = hashlib.blake2b(dumps(rest), digest_size=8).digest()
+    return (round(x / POSITION_STEP), round(y / POSITION_STEP),
+            round(change_x / SPEED_STEP), round(change_y / SPEED_STEP), digest)
+
+
+def _start_worker(number, seed):
+    """ pool initializer, a level per worker """
+    global _level
+    # the levels print as they go, one line per death would drown the search's output
+    sys.stdout = open(os.devnull, "w")
+    _level = HeadlessLevel(number, seed)
+
+
+def _expand(job):
+    """ run an input from a state, returns (status, ticks, state, key, score) """
+    state, buttons, repeat = job
+    _level.set_state(state)
+    status, ticks = _level.step(buttons, repeat)
+    if status != PLAYING:
+        return status, ticks, None, None, None
+    captured = _level.capture()
+    return status, ticks, dumps(captured), state_key(captured["level"]), _level.progress()
+
+
+class Node():
+    """ a state of the search, and how it was reached """
+
+    def __init__(self, state, parent=None, buttons=0, ticks=0):
+        """ initializer """
+        self.state = state
+        self.parent = parent
+        self.buttons = buttons
+        # ticks from the start of the level
+        self.ticks = ticks
+
+    def inputs(self):
+        """ the run-length encoded inputs from the start to here """
+        steps = []
+        node = self
+        while node.parent is not None:
+            steps.append((node.buttons, node.ticks - node.parent.ticks))
+            node = node.parent
+        inputs = []
+        for buttons, ticks in reversed(steps):
+            if inputs and inputs[-1][0] == buttons:
+                inputs[-1][1] += ticks
+            else:
+                inputs.append([buttons, ticks])
+        return [[buttons_name(buttons), ticks] for buttons, ticks in inputs]
+
+
+def solve(number, seed=0, beam_width=BEAM_WIDTH, repeat=REPEAT, workers=None, max_seconds=MAX_SECONDS, log=print):
+    """ search a route through a level, returns its input script or None """
+    max_ticks = int(max_seconds / STEP)
+    workers = workers or os.cpu_count() or 1
+    with get_context("spawn").Pool(workers, initializer=_start_worker, initargs=(number, seed)) as pool:
+        start = HeadlessLevel(number, seed)
+        inputs = start.actions
+        beam = [Node(start.start_state)]
+        started = time.perf_counter()
+        expanded = 0
+        while beam and beam[0].ticks < max_ticks:
+            jobs = [(node.state, buttons, repeat) for node in beam for buttons in inputs]
+            results = pool.map(_expand, jobs, chunksize=max(1, len(jobs) // (workers * 4)))
+            expanded += len(jobs)
+
+            finished = []
+            seen = set()
+            children = []
+            for index, (status, ticks, state, key, score) in enumerate(results):
+                parent = beam[index // len(inputs)]
+                buttons = inputs[index % len(inputs)]
+                if status == FINISHED:
+                    finished.append(Node(None, parent, buttons, parent.ticks + ticks))
+                elif status == PLAYING and key not in seen:
+                    seen.add(key)
+                    children.append((score, index, Node(state, parent, buttons, parent.ticks + ticks)))
+            if finished:
+                best = min(finished, key=lambda node: node.ticks)
+                log(f"level {number}: route of {best.ticks} ticks ({best.ticks * STEP:.2f}s), "
+                    f"{expanded} steps in {time.perf_counter() - started:.1f}s")
+                return {"level": number, "seed": seed, "ticks": best.ticks, "inputs": best.inputs()}
+            beam = [node for _, _, node in heapq.nlargest(beam_width, children, key=lambda child: child[:2])]
+            if beam and (beam[0].ticks // repeat) % 60 == 0:
+                log(f"level {number}: {beam[0].ticks * STEP:.0f}s in, {len(children)} states, "
+                    f"best {max(child[0] for child in children):.0f}, "
+                    f"{expanded / (time.perf_counter() - started):.0f} steps/s")
+    log(f"level {number}: no route found")
+    return None
+
+
+def replay(script):
+    """ run an input script, returns the ticks to the door or None if it doesn't get there """
+    level = HeadlessLevel(script["level"], script.get("seed", 0))
+    for name, ticks in script["inputs"]:
+        status, ran = level.step(parse_buttons(name), ticks)
+        if status == FINISHED:
+            return level.ticks
+        if status != PLAYING:
+            return None
+    return None
+
+
+def main():
+    """ main method """
+    parser = argparse.ArgumentParser(description="search speedrun routes through the levels")
+    parser.add_argument("levels", nargs="*", type=int, help="levels to solve")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--beam", type=int, default=BEAM_WIDTH, help="states kept per step")
+    parser.add_argument("--repeat", type=int, default=REPEAT, help="ticks an input is held")
+    parser.add_argument("--workers", type=int, default=None, help="processes, one per CPU by default")
+    parser.add_argument("--seconds", type=float, default=MAX_SECONDS, help="longest route searched")
+    parser.add_argument("--replay", help="run a route file instead")
+    args = parser.parse_args()
+
+    if args.replay:
+        with open(args.replay) as f:
+            script = json.load(f)
+        ticks = replay(script)
+        print("didn't reach the end" if ticks is None else f"reached the end in {ticks} ticks ({ticks * STEP:.2f}s)")
+        return
+
+    for number in args.levels:
+        script = solve(number, args.seed, args.beam, args.repeat, args.workers, args.seconds)
+        if script is not None:
+            os.makedirs(ROUTE_DIR, exist_ok=True)
+            with open(route_path(number), "w") as f:
+                json.dump(script, f)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,503 @@
+"""
+Live telemetry.
+
+An optional server in the game's process that streams what's going on in a
+level over a local TCP socket, for a viewer or recorder in another process:
+the player's pose, the state of the traps and everything else in the level's
+snapshot (see snapshot.py), deaths, the level being completed and the frame
+timings.
+
+The level only hands over what it has, from update(), reset() and
+level_complete(): a few numbers and a snapshot capture, which is plain
+immutable data. A frame is the level as its update() found it, the state
+last drawn. Encoding and sending happen on background threads. Every
+queue between them is bounded and nothing on the level's side ever waits:
+a frame that doesn't fit is dropped and counted. Nothing is captured while no
+one is connected.
+
+The stream is binary, little endian. It opens with MAGIC and VERSION
+(HELLO), then messages of a MESSAGE header (kind, frame number, payload
+length) and a payload:
+
+    KEYFRAME  timing, pose, then the level's name, its snapshot entry names
+              and every entry's value
+    DELTA     timing, pose, then a count and (entry index, value) for the
+              entries that changed since the previous frame
+    DEATH     pose where the player died
+    COMPLETE  the level's clock and its death count
+
+timing is TIMING (the frame's delta_time in microseconds and how many frames
+were dropped since the previous one) and pose is POSE (x, y, change_x,
+change_y as floats and the animation code of ghost.py). Values are encoded by
+encode_value. A reader gets a KEYFRAME first and then whenever it fell behind
+and its queue was emptied, or the level changed; DELTAs in between apply to
+the state it has. TelemetryReader does all of this.
+
+Start the game with the server on, then run the reader in another terminal:
+    python main.py --telemetry
+    python telemetry.py --record run.bin
+"""
+import argparse
+import queue
+import socket
+import struct
+import threading
+import time
+
+from ghost import HIDDEN
+
+
+HOST = "127.0.0.1"
+PORT = 47800
+MAGIC = b"EVLT"
+VERSION = 1
+HELLO = struct.Struct("<4sH")
+# kind, frame number, payload length
+MESSAGE = struct.Struct("<BII")
+# delta_time in microseconds, frames dropped since the previous one
+TIMING = struct.Struct("<IH")
+# x, y, change_x, change_y, animation code
+POSE = struct.Struct("<ffffh")
+COUNT = struct.Struct("<H")
+
+# message kinds
+KEYFRAME = 1
+DELTA = 2
+DEATH = 3
+COMPLETE = 4
+
+# snapshot entries that aren't captured: the player goes as the pose, the
+# random generator's state and Level6's runner (every obstacle, spike and
+# stone) are big and mean little to a viewer
+SKIP = ("player", "random", "runner")
+
+# frames waiting to be encoded
+QUEUE_SIZE = 8
+# messages waiting to be sent to one reader, about a second of play
+CLIENT_QUEUE_SIZE = 64
+
+_server = None
+
+
+def start_server(host=HOST, port=PORT):
+    """ start the server the levels stream to, once per process """
+    global _server
+    if _server is None:
+        _server = TelemetryServer(host, port)
+        print(f"telemetry on {_server.address[0]}:{_server.address[1]}")
+    return _server
+
+
+def get_server():
+    """ the server started by start_server, None if there's none """
+    return _server
+
+
+def encode_value(value, out):
+    """ append a snapshot value to a bytearray: a tag byte, then what it holds """
+    if value is None:
+        out += b"N"
+    elif value is True:
+        out += b"T"
+    elif value is False:
+        out += b"F"
+    elif isinstance(value, int):
+        if -(1 << 63) <= value < (1 << 63):
+            out += b"i" + struct.pack("<q", value)
+        else:
+            text = str(value).encode("ascii")
+            out += b"I" + COUNT.pack(len(text)) + text
+    elif isinstance(value, float):
+        out += b"d" + struct.pack("<d", value)
+    elif isinstance(value, str):
+        text = value.encode("utf-8")
+        out += b"s" + COUNT.pack(len(text)) + text
+    elif isinstance(value, (tuple, list)):
+        out += b"(" + struct.pack("<I", len(value))
+        for item in value:
+            encode_value(item, out)
+    else:
+        raise TypeError(f"can't send a {type(value).__name__} as telemetry")
+
+
+def decode_value(data, offset=0):
+    """ a value written by encode_value, returns (value, offset after it) """
+    tag = data[offset:offset + 1]
+    offset += 1
+    if tag == b"N":
+        return None, offset
+    if tag == b"T":
+        return True, offset
+    if tag == b"F":
+        return False, offset
+    if tag == b"i":
+        return struct.unpack_from("<q", data, offset)[0], offset + 8
+    if tag == b"d":
+        return struct.unpack_from("<d", data, offset)[0], offset + 8
+    if tag in (b"s", b"I"):
+        length, = COUNT.unpack_from(data, offset)
+        offset += COUNT.size
+        text = bytes(data[offset:offset + length]).decode("utf-8")
+        return (text if tag == b"s" else int(text)), offset + length
+    if tag == b"(":
+        count, = struct.unpack_from("<I", data, offset)
+        offset += 4
+        items = []
+        for _ in range(count):
+            item, offset = decode_value(data, offset)
+            items.append(item)
+        return tuple(items), offset
+    raise ValueError(f"unknown telemetry value tag {tag!r}")
+
+
+def player_pose(view):
+    """ the player's pose as POSE values """
+    player = view.player_sprite
+    anim = view.anim_code if view.player_list.visible else HIDDEN
+    return (player.center_x, player.center_y, player.change_x, player.change_y, anim)
+
+
+class _Client():
+    """ a connected reader, sent to by a thread of its own """
+
+    def __init__(self, connection, queue_size):
+        """ initializer """
+        self.connection = connection
+        self.outbox = queue.Queue(queue_size)
+        # False until it got a keyframe, and again when it fell behind
+        self.synced = False
+        self.open = True
+        self.thread = threading.Thread(target=self._send_loop, name="telemetry-send", daemon=True)
+        self.thread.start()
+
+    def offer(self, message):
+        """ queue a message, False if the reader is too far behind to take it """
+        try:
+            self.outbox.put_nowait(message)
+            return True
+        except queue.Full:
+            return False
+
+    def drain(self):
+        """ throw away what's waiting to be sent """
+        try:
+            while True:
+                self.outbox.get_nowait()
+        except queue.Empty:
+            pass
+
+    def close(self):
+        """ stop sending, the thread ends after the message it's on """
+        self.open = False
+        self.drain()
+        self.outbox.put_nowait(None)
+
+    def _send_loop(self):
+        """ the sending thread """
+        while True:
+            message = self.outbox.get()
+            if message is None:
+                break
+            try:
+                self.connection.sendall(message)
+            except OSError:
+                break
+        self.open = False
+        self.connection.close()
+
+
+class TelemetryServer():
+    """ streams the levels' telemetry to whoever connects """
+
+    def __init__(self, host=HOST, port=PORT, queue_size=QUEUE_SIZE, client_queue_size=CLIENT_QUEUE_SIZE):
+        """ initializer, port 0 picks a free one, see address """
+        self.client_queue_size = client_queue_size
+        self.listener = socket.create_server((host, port))
+        # closing a socket doesn't wake up an accept() on every platform
+        self.listener.settimeout(0.2)
+        self.address = self.listener.getsockname()
+        self.frames = queue.Queue(queue_size)
+        # replaced rather than changed, the level's side reads it without the lock
+        self.clients = []
+        self.clients_lock = threading.Lock()
+        self.running = True
+        # counted on the level's side, frames that didn't fit in the queue
+        self.frame_number = 0
+        self.dropped = 0
+
+        # the encoder's side: the state the last DELTA was taken from
+        self.level_name = None
+        self.names = None
+        self.values = None
+        self.reported_dropped = 0
+
+        self.accept_thread = threading.Thread(target=self._accept_loop, name="telemetry-accept", daemon=True)
+        self.encode_thread = threading.Thread(target=self._encode_loop, name="telemetry-encode", daemon=True)
+        self.accept_thread.start()
+        self.encode_thread.start()
+
+    # the level's side, none of these wait
+
+    def frame(self, view, delta_time):
+        """ a tick of a level, from its update() """
+        self.frame_number += 1
+        if not self.clients:
+            return
+        self._put((DELTA, self.frame_number, type(view).__name__, delta_time, self.dropped,
+                   player_pose(view), view.snapshot.capture(skip=SKIP)))
+
+    def death(self, view):
+        """ the player died, from the level's reset() """
+        if self.clients:
+            self._put((DEATH, self.frame_number, player_pose(view)))
+
+    def complete(self, view):
+        """ the door was reached, from the level's level_complete() """
+        if self.clients:
+            self._put((COMPLETE, self.frame_number, view.time, view.death))
+
+    def _put(self, item):
+        """ hand something to the encoder, or drop it """
+        try:
+            self.frames.put_nowait(item)
+        except queue.Full:
+            self.dropped += 1
+
+    def close(self):
+        """ stop the server and disconnect everyone """
+        self.running = False
+        self.listener.close()
+        try:
+            self.frames.put_nowait(None)
+        except queue.Full:
+            # the encoder checks running after every item
+            pass
+        self.accept_thread.join(1)
+        self.encode_thread.join(1)
+
+    # the background side
+
+    def _accept_loop(self):
+        """ the thread taking in readers """
+        while self.running:
+            try:
+                connection, _ = self.listener.accept()
+            except socket.timeout:
+                continue
+            except OSError:
+                break
+            connection.settimeout(None)
+            connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            try:
+                connection.sendall(HELLO.pack(MAGIC, VERSION))
+            except OSError:
+                connection.close()
+                continue
+            with self.clients_lock:
+                self.clients = self.clients + [_Client(connection, self.client_queue_size)]
+
+    def _encode_loop(self):
+        """ the thread encoding what the levels put in the queue and handing it to the readers """
+        while self.running:
+            item = self.frames.get()
+            if item is None:
+                break
+            with self.clients_lock:
+                self.clients = clients = [client for client in self.clients if client.open]
+            if item[0] == DELTA:
+                self._send_frame(clients, *item[1:])
+            else:
+                self._send_event(clients, item)
+        with self.clients_lock:
+            for client in self.clients:
+                client.close()
+            self.clients = []
+
+    def _send_frame(self, clients, frame_number, level_name, delta_time, dropped, pose, state):
+        """ send a frame to every reader, as a DELTA or to the ones that need it a KEYFRAME """
+        names = tuple(state)
+        values = [state[name] for name in names]
+        timing = TIMING.pack(min(int(delta_time * 1000000), 0xFFFFFFFF), min(dropped - self.reported_dropped, 0xFFFF))
+        self.reported_dropped = dropped
+        head = timing + POSE.pack(*pose)
+
+        if level_name != self.level_name or names != self.names:
+            # another level, what the readers have doesn't apply any more
+            for client in clients:
+                client.synced = False
+            delta = None
+        else:
+            changed = [(index, value) for index, (value, last) in enumerate(zip(values, self.values)) if value != last]
+            payload = bytearray(head)
+            payload += COUNT.pack(len(changed))
+            for index, value in changed:
+                payload += COUNT.pack(index)
+                encode_value(value, payload)
+            delta = MESSAGE.pack(DELTA, frame_number, len(payload)) + payload
+        self.level_name, self.names, self.values = level_name, names, values
+
+        keyframe = None
+        for client in clients:
+            if client.synced:
+                message = delta
+            else:
+                if keyframe is None:
+                    payload = bytearray(head)
+                    encode_value(level_name, payload)
+                    encode_value(names, payload)
+                    encode_value(values, payload)
+                    keyframe = MESSAGE.pack(KEYFRAME, frame_number, len(payload)) + payload
+                message = keyframe
+            if client.offer(message):
+                client.synced = True
+            else:
+                # too far behind for deltas, it starts over from the next keyframe
+                client.drain()
+                client.synced = False
+
+    def _send_event(self, clients, item):
+        """ send a DEATH or COMPLETE to the readers following along """
+        kind, frame_number = item[:2]
+        if kind == DEATH:
+            payload = POSE.pack(*item[2])
+        else:
+            payload = struct.pack("<dI", item[2], item[3])
+        message = MESSAGE.pack(kind, frame_number, len(payload)) + payload
+        for client in clients:
+            if client.synced and not client.offer(message):
+                client.drain()
+                client.synced = False
+
+
+def read_exactly(stream, size):
+    """ size bytes from a binary stream, None at its end """
+    data = stream.read(size)
+    if len(data) < size:
+        return None
+    return data
+
+
+class TelemetryReader():
+    """ the other end of the stream, keeps the level's state up to date as messages come """
+
+    def __init__(self, stream):
+        """ initializer, stream is a binary file: a socket's makefile("rb") or a recording """
+        self.stream = stream
+        hello = read_exactly(stream, HELLO.size)
+        if hello is None:
+            raise ValueError("telemetry stream ended before it started")
+        magic, version = HELLO.unpack(hello)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"not a telemetry stream of version {VERSION}")
+        self.level_name = None
+        self.names = ()
+        # entry name -> value, as sent
+        self.state = {}
+        self.pose = None
+        self.frame_us = 0
+        self.dropped = 0
+        self.frame_number = 0
+
+    @classmethod
+    def connect(cls, host=HOST, port=PORT):
+        """ a reader of a running server """
+        connection = socket.create_connection((host, port))
+        return cls(connection.makefile("rb"))
+
+    def read_raw(self):
+        """ the next message as (kind, frame number, payload), None at the end """
+        header = read_exactly(self.stream, MESSAGE.size)
+        if header is None:
+            return None
+        kind, frame_number, length = MESSAGE.unpack(header)
+        payload = read_exactly(self.stream, length)
+        if payload is None:
+            return None
+        return kind, frame_number, payload
+
+    def read(self):
+        """ the next message, applied: (kind, frame number, what it said), None at the end """
+        message = self.read_raw()
+        if message is None:
+            return None
+        return self.apply(*message)
+
+    def apply(self, kind, frame_number, payload):
+        """ update the state with a message from read_raw, returns (kind, frame number, what it said) """
+        self.frame_number = frame_number
+        if kind == DEATH:
+            return kind, frame_number, POSE.unpack_from(payload)
+        if kind == COMPLETE:
+            return kind, frame_number, struct.unpack_from("<dI", payload)
+        self.frame_us, self.dropped = TIMING.unpack_from(payload)
+        offset = TIMING.size
+        self.pose = POSE.unpack_from(payload, offset)
+        offset += POSE.size
+        if kind == KEYFRAME:
+            self.level_name, offset = decode_value(payload, offset)
+            self.names, offset = decode_value(payload, offset)
+            values, offset = decode_value(payload, offset)
+            self.state = dict(zip(self.names, values))
+            return kind, frame_number, self.names
+        if kind == DELTA:
+            count, = COUNT.unpack_from(payload, offset)
+            offset += COUNT.size
+            changed = []
+            for _ in range(count):
+                index, = COUNT.unpack_from(payload, offset)
+                value, offset = decode_value(payload, offset + COUNT.size)
+                self.state[self.names[index]] = value
+                changed.append(self.names[index])
+            return kind, frame_number, tuple(changed)
+        raise ValueError(f"unknown telemetry message kind {kind}")
+
+
+def main():
+    """ main method, follows a running game and prints what happens, optionally recording the stream """
+    parser = argparse.ArgumentParser(description="follow the telemetry of a running game")
+    parser.add_argument("--host", default=HOST)
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--record", help="also write the stream to this file, TelemetryReader reads it back")
+    args = parser.parse_args()
+
+    reader = TelemetryReader.connect(args.host, args.port)
+    record = open(args.record, "wb") if args.record else None
+    if record is not None:
+        record.write(HELLO.pack(MAGIC, VERSION))
+    frames = 0
+    received = 0
+    longest = 0
+    reported = time.perf_counter()
+    try:
+        while True:
+            message = reader.read_raw()
+            if message is None:
+                break
+            if record is not None:
+                record.write(MESSAGE.pack(message[0], message[1], len(message[2])) + message[2])
+            kind, frame_number, said = reader.apply(*message)
+            received += MESSAGE.size + len(message[2])
+            if kind in (KEYFRAME, DELTA):
+                frames += 1
+                longest = max(longest, reader.frame_us)
+            if kind == KEYFRAME:
+                print(f"{reader.level_name}: frame {frame_number}, {len(said)} entries")
+            elif kind == DEATH:
+                print(f"{reader.level_name}: died at ({said[0]:.0f}, {said[1]:.0f})")
+            elif kind == COMPLETE:
+                print(f"{reader.level_name}: complete in {said[0]:.1f}s, {said[1]} deaths")
+            now = time.perf_counter()
+            if now - reported >= 5:
+                print(f"{frames / (now - reported):.0f} frames/s, longest {longest / 1000:.1f} ms, "
+                      f"{received / (now - reported) / 1024:.1f} KB/s")
+                frames = received = longest = 0
+                reported = now
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if record is not None:
+            record.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,45 @@
+"""
+Shared setup of the tests: the game's modules are imported from the folder
+above and run from it, the way the game is started, and headless is imported
+first so arcade opens its window without a display and without sound.
+"""
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import headless  # noqa: E402
+import arcade  # noqa: E402
+import pytest  # noqa: E402
+
+
+@pytest.fixture(autouse=True)
+def game_folder(monkeypatch):
+    """ data/ paths are relative to the game's folder """
+    monkeypatch.chdir(ROOT)
+
+
+@pytest.fixture(scope="session")
+def window():
+    """ the hidden window, arcade needs one for sprite lists """
+    return headless.get_window()
+
+
+def make_tiles(positions, size=32, color=arcade.color.WHITE):
+    """ a sprite list of square tiles, by their bottom left corners """
+    tiles = arcade.SpriteList(use_spatial_hash=True)
+    for left, bottom in positions:
+        tile = arcade.SpriteSolidColor(size, size, color)
+        tile.left = left
+        tile.bottom = bottom
+        tiles.append(tile)
+    return tiles
+
+
+def make_player(center_x, bottom, width=20, height=30):
+    """ a box standing in for the player """
+    player = arcade.SpriteSolidColor(width, height, arcade.color.RED)
+    player.center_x = center_x
+    player.bottom = bottom
+    return player
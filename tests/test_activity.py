@@ -0,0 +1,97 @@
+"""
+Activity regions: suspended entities stop where they are, throttled ones
+catch up on every frame they missed.
+"""
+import pytest
+
+from activity import ActivityRegion, SUSPEND, THROTTLE
+from conftest import make_player
+
+
+class Walker():
+    """ moves a pixel a frame, stepping frame by frame like the levels' entities """
+
+    def __init__(self, center_x):
+        """ initializer """
+        self.sprite = make_player(center_x, 0)
+        self.frames = 0
+        self.calls = []
+
+    def update(self, frames):
+        self.calls.append(frames)
+        for _ in range(frames):
+            self.frames += 1
+            self.sprite.center_x += 1
+
+
+def region_with(*walkers_and_policies, interval=4):
+    """ a 100x100 view at the origin with no margin, tracking the walkers """
+    region = ActivityRegion(100, 100, margin=0, interval=interval)
+    for walker, policy in walkers_and_policies:
+        region.add(walker.sprite, walker.update, policy)
+    return region
+
+
+def test_inside_everything_runs_every_frame(window):
+    walker = Walker(50)
+    region = region_with((walker, SUSPEND))
+    for _ in range(5):
+        region.update()
+    assert walker.calls == [1] * 5
+
+
+def test_suspended_outside_and_resumed_where_it_was(window):
+    walker = Walker(500)
+    region = region_with((walker, SUSPEND))
+    for _ in range(10):
+        region.update()
+    assert walker.frames == 0
+    region.move_to(450, 0)
+    region.update()
+    assert walker.calls == [1]
+
+
+def test_throttled_catches_up_exactly(window):
+    walker, reference = Walker(500), Walker(500)
+    region = region_with((walker, THROTTLE), interval=4)
+    for _ in range(10):
+        region.update()
+        reference.update(1)
+    assert walker.calls == [4, 4]
+    # back in view, the frames owed come first
+    region.move_to(450, 0)
+    region.update()
+    reference.update(1)
+    assert walker.calls == [4, 4, 3]
+    assert walker.sprite.center_x == reference.sprite.center_x
+
+
+def test_entering_and_leaving_is_reported(window):
+    walker = Walker(90)
+    changes = []
+    region = ActivityRegion(100, 100, margin=0)
+    region.add(walker.sprite, walker.update, on_change=changes.append)
+    for _ in range(30):
+        region.update()
+    # suspended once its left edge reached the view's right edge
+    assert changes == [False]
+    assert walker.sprite.left == 100
+
+
+def test_state_round_trip(window):
+    walker = Walker(500)
+    region = region_with((walker, THROTTLE), interval=8)
+    for _ in range(3):
+        region.update()
+    state = region.get_state()
+    region.move_to(400, 0)
+    region.update()
+    region.set_state(state)
+    assert region.get_state() == state == ((0, 0), ((False, 3),))
+    region.reset()
+    assert region.get_state() == ((0, 0), ((True, 0),))
+
+
+def test_unknown_policy():
+    with pytest.raises(ValueError):
+        ActivityRegion(100, 100).add(None, policy="sleep")
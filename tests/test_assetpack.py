@@ -0,0 +1,101 @@
+"""
+The asset pack: what goes in comes back out byte for byte, with the mip
+levels of the sprites, and the loaders read from it.
+"""
+import os
+
+import arcade
+import PIL.Image
+import pytest
+
+import assetpack
+
+
+def save_image(file_name, size, pixels=None):
+    """ an RGBA png, every pixel a different color unless pixels are given """
+    image = PIL.Image.new("RGBA", size)
+    image.putdata(pixels or [(i * 7 % 256, i * 13 % 256, i * 29 % 256, 255) for i in range(size[0] * size[1])])
+    image.save(file_name)
+    return image
+
+
+@pytest.fixture
+def game(tmp_path, monkeypatch):
+    """ a game folder with a few assets, the loaders looking there and at an empty arcade cache """
+    for folder in ("data/sprites", "data/sounds", "data/maps"):
+        os.makedirs(tmp_path / folder)
+    save_image(tmp_path / "data/sprites/sheet.png", (8, 4))
+    save_image(tmp_path / "data/sprites/odd.png", (6, 6))
+    (tmp_path / "data/sprites/sheet.xcf").write_bytes(b"source")
+    (tmp_path / "data/sprites/Thumbs.db").write_bytes(b"junk")
+    (tmp_path / "data/sounds/jump.wav").write_bytes(b"RIFF" + bytes(range(40)))
+    (tmp_path / "data/maps/level1.traps.json").write_text('{"layers": {}}')
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(assetpack, "_pack", False)
+    monkeypatch.setattr(arcade.load_texture, "texture_cache", {})
+    monkeypatch.setattr(assetpack, "_full_cuts", {})
+    monkeypatch.setattr(assetpack, "_last_source", (None, None))
+    return tmp_path
+
+
+def test_round_trip(game):
+    pack = assetpack.AssetPack(assetpack.build_pack())
+    assert set(pack.index) == {
+        "data/sprites/sheet.png", "data/sprites/sheet.png@0.5", "data/sprites/sheet.png@0.25",
+        "data/sprites/odd.png", "data/sprites/odd.png@0.5",
+        "data/sounds/jump.wav", "data/maps/level1.traps.json",
+    }
+    for name in ("data/sprites/sheet.png", "data/sounds/jump.wav", "data/maps/level1.traps.json"):
+        assert bytes(pack.read(name)) == (game / name).read_bytes()
+        assert os.path.join(*name.split("/")) in pack
+    assert all(offset % assetpack.ALIGN == 0 for offset, _ in pack.index.values())
+
+
+def test_loaders_read_from_the_pack(game, monkeypatch):
+    assetpack.build_pack()
+    # building looked for a pack before there was one
+    monkeypatch.setattr(assetpack, "_pack", False)
+    original = PIL.Image.open("data/sprites/sheet.png").convert("RGBA")
+    os.remove("data/sprites/sheet.png")
+    os.remove("data/sounds/jump.wav")
+
+    assert assetpack.get_pack() is not None
+    assert bytes(assetpack.read_asset("data/sounds/jump.wav")).startswith(b"RIFF")
+    assert list(assetpack.decode_image("data/sprites/sheet.png").getdata()) == list(original.getdata())
+    mip = assetpack.decode_image("data/sprites/sheet.png@0.5")
+    assert list(mip.getdata()) == list(assetpack.mip_image(original, 0.5).getdata())
+    # what isn't packed comes from disk
+    (game / "data/extra.txt").write_bytes(b"loose")
+    assert assetpack.read_asset("data/extra.txt") == b"loose"
+
+
+def test_not_a_pack(game):
+    (game / "data/assets.pak").write_bytes(b"PAK!" + bytes(64))
+    with pytest.raises(ValueError):
+        assetpack.AssetPack()
+
+
+def test_mip_levels_are_premultiplied():
+    image = PIL.Image.new("RGBA", (2, 2))
+    image.putdata([(255, 0, 0, 255), (0, 255, 0, 0), (255, 0, 0, 255), (0, 255, 0, 0)])
+    # the transparent green doesn't bleed into the red
+    assert assetpack.mip_image(image, 0.5).getpixel((0, 0)) == (255, 0, 0, 128)
+    assert assetpack.mip_image(image, 0.25) is None
+
+
+def test_scaled_texture_keeps_the_full_size(game, window):
+    full = arcade.load_texture("data/sprites/sheet.png", 4, 0, 4, 4)
+    for scale, size in ((1, (4, 4)), (0.5, (2, 2)), (0.25, (1, 1))):
+        texture = assetpack.load_texture("data/sprites/sheet.png", 4, 0, 4, 4, scale=scale)
+        assert texture.image.size == size
+        assert (texture.width, texture.height) == (4, 4)
+        assert texture.hit_box_points == full.hit_box_points
+    # a cut that doesn't line up with a mip level's pixels stays full size
+    assert assetpack.load_texture("data/sprites/sheet.png", 1, 0, 2, 2, scale=0.25).image.size == (2, 2)
+
+
+def test_mip_level_keeps_only_the_hit_box_of_the_full_image(game, window):
+    texture = assetpack.load_texture("data/sprites/sheet.png", 4, 0, 4, 4, hit_box_algorithm="Detailed", scale=0.5)
+    assert set(arcade.load_texture.texture_cache) == {"data/sprites/sheet.png@0.5", texture.name}
+    full = arcade.load_texture("data/sprites/sheet.png", 4, 0, 4, 4, hit_box_algorithm="Detailed")
+    assert texture.hit_box_points == full.hit_box_points
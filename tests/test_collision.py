@@ -0,0 +1,117 @@
+"""
+Batched and swept collision: the same hits as arcade, edges included, and a
+fast move can't skip a thin sprite.
+"""
+import arcade
+
+from collision import (check_for_collision_with_list, get_batch, swept_hit_boxes, CollisionWorld,
+                       HAZARD, SOLID, TRIGGER)
+from conftest import make_tiles, make_player
+
+
+def arcade_hits(sprite, sprite_list):
+    return set(map(id, arcade.check_for_collision_with_list(sprite, sprite_list)))
+
+
+def batch_hits(sprite, sprite_list):
+    return set(map(id, get_batch(sprite_list).collide(sprite)))
+
+
+def test_batch_matches_arcade_edges_included(window):
+    tiles = make_tiles([(x * 32, y * 32) for x in range(8) for y in range(4)])
+    player = make_player(0, 0)
+    # every half pixel around a tile corner: overlapping, touching and apart
+    for x in range(-24, 24):
+        for y in range(-24, 24):
+            player.center_x = 64 + x / 2
+            player.bottom = 128 + y / 2
+            assert batch_hits(player, tiles) == arcade_hits(player, tiles), player.position
+
+
+def test_touching_is_not_a_hit(window):
+    tiles = make_tiles([(0, 0)])
+    player = make_player(10, 32)
+    assert check_for_collision_with_list(player, tiles, start=player.position) == []
+    assert get_batch(tiles).collide(player) == []
+    player.bottom = 31.9
+    assert get_batch(tiles).collide(player) == list(tiles)
+
+
+def test_batch_matches_arcade_on_rotated_boxes(window):
+    tiles = make_tiles([(x * 40, 0) for x in range(6)])
+    for i, tile in enumerate(tiles):
+        tile.angle = 15 * i
+    player = make_player(0, 0)
+    player.angle = 30
+    for x in range(0, 240, 3):
+        for y in range(-30, 60, 3):
+            player.center_x, player.center_y = x, y
+            assert batch_hits(player, tiles) == arcade_hits(player, tiles), player.position
+
+
+def test_batch_follows_a_list_moved_as_a_whole(window):
+    tiles = make_tiles([(x * 32, 0) for x in range(4)])
+    player = make_player(200, 40)
+    assert get_batch(tiles).collide(player) == []
+    for tile in tiles:
+        tile.center_x += 100
+        tile.center_y += 20
+    assert batch_hits(player, tiles) == arcade_hits(player, tiles) != set()
+
+
+def test_fast_move_through_a_thin_sprite_is_swept(window):
+    spike = arcade.SpriteList()
+    spike.append(arcade.SpriteSolidColor(2, 40, arcade.color.WHITE))
+    spike[0].position = (100, 20)
+    player = make_player(150, 5)
+    start = (50, player.center_y)
+    # the hit boxes at both ends miss the spike, the way between doesn't
+    assert arcade.check_for_collision_with_list(player, spike) == []
+    assert check_for_collision_with_list(player, spike, start=start) == list(spike)
+    assert check_for_collision_with_list(player, spike, rigid=False, start=start) == list(spike)
+    # moving away from it
+    assert check_for_collision_with_list(player, spike, start=(180, player.center_y)) == []
+
+
+def test_swept_area_covers_both_ends(window):
+    player = make_player(100, 0)
+    [(polygon, center, radius)] = swept_hit_boxes(player, (40, player.center_y))
+    xs = [x for x, _ in polygon]
+    assert (min(xs), max(xs)) == (30, 110)
+    assert center == (70, player.center_y)
+    assert radius == player.collision_radius + 30
+
+
+def test_sweep_goes_along_y_then_x(window):
+    block = make_tiles([(100, 40)])
+    world = CollisionWorld()
+    world.add_layer("block", block, HAZARD)
+    # up and right: a straight line would cut the block's corner, going up first passes over it
+    player = make_player(150, 85)
+    assert check_for_collision_with_list(player, block, start=(50, 30)) == []
+    assert world.query(player, start=(50, 30))[HAZARD] == {}
+    # down and right goes through it
+    player = make_player(150, 15)
+    assert check_for_collision_with_list(player, block, start=(50, 100)) == list(block)
+    assert world.query(player, start=(50, 100))[HAZARD] == {"block": list(block)}
+
+
+def test_world_query_by_category_and_enabled(window):
+    floor = make_tiles([(x * 32, 0) for x in range(4)])
+    spikes = make_tiles([(32, 32)])
+    trigger = make_tiles([(64, 32)])
+    world = CollisionWorld()
+    world.add_layer("floor", floor, SOLID)
+    world.add_layer("spikes", spikes, HAZARD)
+    world.add_layer("trigger", trigger, TRIGGER, rigid=False)
+    player = make_player(64, 31)
+
+    hits = world.query(player)
+    assert hits[SOLID]["floor"] and hits[HAZARD]["spikes"] == list(spikes)
+    assert hits[TRIGGER]["trigger"] == list(trigger)
+    assert world.query(player, categories=(HAZARD,))[SOLID] == {}
+
+    world.set_enabled("spikes", False)
+    assert "spikes" not in world.query(player)[HAZARD]
+    trigger.collidable = False
+    assert "trigger" not in world.query(player)[TRIGGER]
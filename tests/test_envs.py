@@ -0,0 +1,55 @@
+"""
+The batched level environments: observations come back in their shapes,
+runs don't share anything, and a run that's done starts over.
+"""
+import numpy as np
+import pytest
+
+from envs import SequentialLevelEnv, PATCH_CELLS, HAZARD_COUNT, DEATH_PENALTY
+from headless import RIGHT
+
+
+@pytest.fixture(scope="module")
+def env(window):
+    """ three runs of level 1 """
+    return SequentialLevelEnv(1, 3, frame_skip=4)
+
+
+def check_shapes(env, observations):
+    assert observations["patch"].shape == (env.num_envs, 2, PATCH_CELLS, PATCH_CELLS)
+    assert observations["patch"].dtype == np.uint8
+    assert observations["velocity"].shape == (env.num_envs, 2)
+    assert observations["hazards"].shape == (env.num_envs, HAZARD_COUNT, 3)
+
+
+def test_reset_and_step(env):
+    observations = env.reset()
+    check_shapes(env, observations)
+    # every run starts the same, standing on the floor
+    assert (observations["patch"] == observations["patch"][0]).all()
+    assert observations["patch"][0, 0].any()
+
+    right = env.actions.index(RIGHT)
+    observations, rewards, dones, infos = env.step([right, 0, right])
+    check_shapes(env, observations)
+    assert rewards.shape == dones.shape == infos["finished"].shape == (env.num_envs,)
+    assert not dones.any()
+    # the runs held different buttons and went their own ways
+    assert rewards[0] == rewards[2] > rewards[1]
+    assert observations["velocity"][0, 0] > 0 == observations["velocity"][1, 0]
+
+
+def test_done_runs_start_over(env):
+    first = env.reset()
+    right = env.actions.index(RIGHT)
+    # running right falls into level 1's pit
+    for _ in range(20):
+        observations, rewards, dones, infos = env.step([right, 0, 0])
+        if dones[0]:
+            break
+    assert dones[0] and not dones[1:].any()
+    assert not infos["finished"][0]
+    assert rewards[0] < -DEATH_PENALTY / 2
+    # what comes back is already the new run's first observation
+    assert (observations["patch"][0] == first["patch"][0]).all()
+    assert (observations["velocity"][0] == 0).all()
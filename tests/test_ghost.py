@@ -0,0 +1,78 @@
+import ghost
+from ghost import Ghost, GhostRecorder, HEADER, MAGIC, VERSION, QUANTUM, HIDDEN, best_ticks, encode_anim, decode_anim
+
+SHEET = "data/sprites/sprite.png"
+
+
+def recorded_run(positions):
+    """ a recorder fed (x, y, anim) per tick """
+    recorder = GhostRecorder()
+    for x, y, anim in positions:
+        recorder.record(x, y, anim)
+    return recorder
+
+
+def test_anim_codes_round_trip():
+    for x, y, animated in ((0, 0, False), (384, 256, False), (0, 128, True)):
+        assert decode_anim(encode_anim(x, y, animated)) == (x if not animated else 0, y, animated)
+
+
+def test_file_round_trip(tmp_path, window):
+    positions = [(100 + tick * 3.3, 50 - tick * 0.6, tick % 3) for tick in range(200)]
+    # a respawn, a jump too big for one int16 move
+    positions += [(20000.0, 50.0, HIDDEN), (20000.0, 50.0, 1)]
+    file_name = str(tmp_path / "level1.ghost")
+    recorded_run(positions).save(file_name)
+    assert best_ticks(file_name) == len(positions)
+
+    played = Ghost(file_name, SHEET, 0.25)
+    for tick, (x, y, anim) in enumerate(positions):
+        played.advance()
+        if tick < 200:
+            assert abs(played.center_x - x) <= QUANTUM / 2 and abs(played.center_y - y) <= QUANTUM / 2
+        assert played.anim == anim
+    played.close()
+
+
+def test_only_a_shorter_run_replaces_the_best(tmp_path):
+    file_name = str(tmp_path / "level1.ghost")
+    assert recorded_run([(0, 0, 0)] * 50).save_if_best(file_name)
+    assert not recorded_run([(0, 0, 0)] * 60).save_if_best(file_name)
+    assert recorded_run([(0, 0, 0)] * 40).save_if_best(file_name)
+    assert best_ticks(file_name) == 40
+
+
+def test_truncated_file_is_no_ghost(tmp_path, monkeypatch):
+    monkeypatch.setattr(ghost, "GHOST_DIR", str(tmp_path))
+    file_name = ghost.ghost_path("level1")
+    with open(file_name, "wb") as f:
+        f.write(HEADER.pack(MAGIC, VERSION, 1000, 0, 0, 0) + b"\0" * 60)
+    assert best_ticks(file_name) is None
+    assert Ghost.open("level1", SHEET, 0.25) is None
+    # and any finished run replaces it
+    assert recorded_run([(0, 0, 0)] * 5000).save_if_best(file_name)
+
+
+def test_recorder_rewind_forgets_the_last_ticks():
+    positions = [(tick * 2.0, tick * 1.5, 0) for tick in range(30)]
+    recorder = recorded_run(positions)
+    recorder.rewind(10)
+    for position in positions[20:]:
+        recorder.record(*position)
+    assert recorder.records == recorded_run(positions).records
+
+
+def test_ghost_rewind_goes_back_with_the_level(tmp_path, window):
+    file_name = str(tmp_path / "level1.ghost")
+    recorded_run([(tick * 4.0, 10.0, tick % 4) for tick in range(20)]).save(file_name)
+    played = Ghost(file_name, SHEET, 0.25)
+    for _ in range(25):
+        played.advance()
+    # five ticks past the end of the run, then back into it
+    played.rewind(8)
+    assert (played.tick, played.center_x, played.anim) == (17, 64.0, 0)
+    played.advance()
+    assert (played.center_x, played.anim) == (68.0, 1)
+    played.rewind(100)
+    assert (played.tick, played.center_x, played.anim) == (0, 0.0, 0)
+    played.close()
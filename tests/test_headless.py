@@ -0,0 +1,74 @@
+"""
+Headless levels and the route solver: a restored state plays the same ticks
+again, states are told apart by what matters, routes come out run-length
+encoded and play back to the door.
+"""
+import pytest
+
+from headless import HeadlessLevel, LEFT, RIGHT, JUMP, PLAYING, DEAD, parse_buttons
+from solver import Node, state_key, replay, POSITION_STEP
+
+
+# a route solve() found through level 1 with seed 0
+ROUTE = [["right", 12], ["right+jump", 4], ["right", 24], ["right+jump", 4], ["right", 36], ["right+jump", 4],
+         ["right", 20], ["right+jump", 4], ["right", 44], ["right+jump", 4], ["right", 24], ["right+jump", 4],
+         ["right", 24], ["right+jump", 4], ["right", 64], ["none", 8], ["right", 52], ["none", 4], ["left", 104],
+         ["left+jump", 4], ["left", 40], ["left+jump", 4], ["left", 24], ["left+jump", 4], ["left", 16],
+         ["right", 4], ["left+jump", 4], ["left", 8], ["none", 4], ["left", 4], ["none", 4], ["left", 4],
+         ["none", 4], ["left+jump", 4], ["left", 32], ["left+jump", 4], ["left", 20], ["left+jump", 4],
+         ["left", 40], ["none", 1]]
+
+
+@pytest.fixture(scope="module")
+def level(window):
+    """ level 1, back at its start for every test """
+    return HeadlessLevel(1)
+
+
+def test_restored_state_plays_the_same_ticks(level):
+    level.reset()
+    level.step(RIGHT, 10)
+    state = level.get_state()
+    level.step(RIGHT | JUMP, 20)
+    level.step(LEFT, 15)
+    after = level.get_state()
+
+    level.set_state(state)
+    assert level.get_state() == state
+    level.step(RIGHT | JUMP, 20)
+    level.step(LEFT, 15)
+    assert level.get_state() == after
+
+
+def test_death_stops_a_step(level):
+    level.reset()
+    assert level.step(RIGHT, 30) == (PLAYING, 30)
+    status, ticks = level.step(RIGHT, 30)
+    assert status == DEAD and ticks < 30
+
+
+def test_state_key():
+    state = {"player": (100.2, 50.0, 3.1, -0.1), "door": (False,), "random": (3, (1, 2), None),
+             "camera": ((0, 0),), "activity": ((0, 0), ())}
+    key = state_key(state)
+    # what follows the player, and less than a step of it, doesn't make a state new
+    same = dict(state, player=(100.2 + POSITION_STEP / 4, 50.0, 3.0, 0.0), random=(3, (2, 1), None),
+                camera=((40, 0),), activity=((40, 0), ()))
+    assert state_key(same) == key
+    assert state_key(dict(state, player=(100.2 + POSITION_STEP, 50.0, 3.1, -0.1))) != key
+    assert state_key(dict(state, door=(True,))) != key
+
+
+def test_inputs_are_run_length_encoded():
+    node = Node(None)
+    for buttons, ticks in ((RIGHT, 4), (RIGHT, 8), (RIGHT | JUMP, 12), (0, 13)):
+        node = Node(None, node, buttons, ticks)
+    assert node.inputs() == [["right", 8], ["right+jump", 4], ["none", 1]]
+    assert [parse_buttons(name) for name, _ in node.inputs()] == [RIGHT, RIGHT | JUMP, 0]
+
+
+def test_replay(window):
+    # running into the pit, and running out of inputs, don't get there
+    assert replay({"level": 1, "inputs": [["right", 60]]}) is None
+    assert replay({"level": 1, "inputs": [["left", 20], ["none", 10]]}) is None
+    assert replay({"level": 1, "seed": 0, "inputs": ROUTE}) == 677
@@ -0,0 +1,86 @@
+import json
+import os
+import struct
+
+import arcade
+import numpy as np
+
+import mapbin
+from mapbin import BinaryMap, HEADER, MAGIC, VERSION, compile_map, is_current
+
+
+def write_map(folder, data):
+    """ a 3x2 Tiled map with an external tileset, returns its path """
+    with open(os.path.join(folder, "tiles.json"), "w") as f:
+        json.dump({"image": "tiles.png", "columns": 4, "tilewidth": 128, "tileheight": 128}, f)
+    map_name = os.path.join(folder, "level.json")
+    with open(map_name, "w") as f:
+        json.dump({
+            "type": "map", "width": 3, "height": 2, "tilewidth": 128, "tileheight": 128,
+            "tilesets": [{"firstgid": 1, "source": "tiles.json"}],
+            "layers": [{"type": "tilelayer", "name": "walls", "data": data,
+                        "properties": [{"name": "role", "type": "string", "value": "solid"}]}],
+        }, f)
+    return map_name
+
+
+def set_mtime(file_name, when):
+    os.utime(file_name, (when, when))
+
+
+def test_round_trip(tmp_path):
+    flipped = 3 | mapbin.TILED_FLIPPED_HORIZONTALLY | mapbin.TILED_FLIPPED_DIAGONALLY
+    map_name = write_map(tmp_path, [0, 1, 2, flipped, 0, 4])
+    binary_map = BinaryMap.open(compile_map(map_name))
+    assert (binary_map.width, binary_map.height, binary_map.tile_width) == (3, 2, 128)
+    expected = [[0, 1, 2], [3 | mapbin.FLIPPED_HORIZONTALLY | mapbin.FLIPPED_DIAGONALLY, 0, 4]]
+    assert np.array_equal(binary_map.layers["walls"], expected)
+    assert binary_map.layer_info[0]["properties"] == {"role": "solid"}
+    assert binary_map.tilesets[0]["columns"] == 4
+    assert binary_map.sources == ["tiles.json"]
+    binary_map.close()
+
+
+def test_compiled_map_is_stale_when_a_source_is_newer(tmp_path):
+    map_name = write_map(tmp_path, [1] * 6)
+    bin_name = compile_map(map_name)
+    for source in (map_name, os.path.join(tmp_path, "tiles.json")):
+        set_mtime(source, 1000)
+    set_mtime(bin_name, 2000)
+    assert is_current(bin_name, map_name)
+    set_mtime(os.path.join(tmp_path, "tiles.json"), 3000)
+    assert not is_current(bin_name, map_name)
+
+
+def test_old_version_is_recompiled_on_load(tmp_path, monkeypatch):
+    map_name = write_map(tmp_path, [1] * 6)
+    bin_name = compile_map(map_name)
+    with open(bin_name, "r+b") as f:
+        fields = list(HEADER.unpack(f.read(HEADER.size)))
+        fields[1] = VERSION - 1
+        f.seek(0)
+        f.write(HEADER.pack(*fields))
+    assert not is_current(bin_name, map_name)
+
+    # only the compiled map is checked here, not the sprites built from it
+    monkeypatch.setattr(mapbin, "BinaryTileMap", lambda binary_map, *args, **kwargs: binary_map)
+    binary_map = mapbin.load_tilemap(map_name)
+    assert np.array_equal(binary_map.layers["walls"], np.ones((2, 3)))
+    with open(bin_name, "rb") as f:
+        assert struct.unpack_from("<4sH", f.read(6)) == (MAGIC, VERSION)
+
+
+def sprite_summary(sprite_list):
+    """ where the sprites of a layer are, how they're turned and their hit boxes """
+    return sorted((sprite.center_x, sprite.center_y, sprite.width, sprite.height,
+                   tuple(map(tuple, sprite.get_adjusted_hit_box()))) for sprite in sprite_list)
+
+
+def test_loaded_layers_match_arcade(window, tmp_path):
+    map_name = "data/maps/level1.json"
+    binary_map = BinaryMap.open(compile_map(map_name, str(tmp_path / "level1.bin")))
+    tile_map = mapbin.BinaryTileMap(binary_map, "data/maps", scaling=0.25, hit_box_algorithm="Detailed")
+    expected = arcade.load_tilemap(map_name, scaling=0.25, hit_box_algorithm="Detailed")
+    assert set(tile_map.sprite_lists) == set(expected.sprite_lists)
+    for name, sprite_list in expected.sprite_lists.items():
+        assert sprite_summary(tile_map.sprite_lists[name]) == sprite_summary(sprite_list), name
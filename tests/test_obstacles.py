@@ -0,0 +1,40 @@
+"""
+Level6 obstacles: the hit box looked up for the snapped angle is the one
+arcade works out for a sprite at that angle.
+"""
+import arcade
+import pytest
+
+from level6 import Obstacle, OBSTACLE_TYPES, OBSTACLE_ANGLE_STEPS
+from texture_cache import load_texture
+
+
+def points(sprite):
+    """ a sprite's hit box in the world, as tuples """
+    return [tuple(point) for point in sprite.get_adjusted_hit_box()]
+
+
+@pytest.mark.parametrize("sprite_path, scale", OBSTACLE_TYPES)
+def test_hit_box_matches_arcade(window, sprite_path, scale):
+    texture = load_texture(sprite_path, hit_box_algorithm="Detailed", scale=scale)
+    for angle in (0, 3, 5.7, 90, 181, 300, 359.9):
+        obstacle = Obstacle(texture, scale, angle, 400.5, 250)
+        assert obstacle.angle % (360 / OBSTACLE_ANGLE_STEPS) == 0
+        assert abs((obstacle.angle - angle + 180) % 360 - 180) <= 180 / OBSTACLE_ANGLE_STEPS
+
+        sprite = arcade.Sprite(texture=texture, scale=scale, center_x=400.5, center_y=250)
+        sprite.angle = obstacle.angle
+        assert points(obstacle) == points(sprite)
+        # and still once moved
+        obstacle.center_x -= 17
+        sprite.center_x -= 17
+        assert points(obstacle) == points(sprite)
+
+
+def test_tables_are_made_once(window):
+    sprite_path, scale = OBSTACLE_TYPES[0]
+    texture = load_texture(sprite_path, hit_box_algorithm="Detailed", scale=scale)
+    table = Obstacle.hit_box_table(texture, scale)
+    assert len(table) == OBSTACLE_ANGLE_STEPS
+    assert Obstacle.hit_box_table(texture, scale) is table
+    assert Obstacle(texture, scale, 0, 0, 0).rotated_hit_box is table[0]
@@ -0,0 +1,138 @@
+"""
+The grid platformer engine: landing, walls, stepping up, platforms that
+carry, walls that push, ray casts, and merging tiles into rectangles.
+"""
+import arcade
+
+from conftest import make_tiles, make_player
+from physics import GridPhysicsEnginePlatformer, merge_tiles
+
+
+def floor_level(*lists, gravity=1):
+    """ a player standing on a floor of ten tiles, with more walls if given """
+    floor = make_tiles([(x * 32, 0) for x in range(10)])
+    player = make_player(40, 32)
+    engine = GridPhysicsEnginePlatformer(player, walls=[floor, *lists], gravity_constant=gravity)
+    return player, engine
+
+
+def ledge(left, bottom, height):
+    """ a sprite list with a single low box """
+    walls = arcade.SpriteList()
+    box = arcade.SpriteSolidColor(32, height, arcade.color.WHITE)
+    box.left, box.bottom = left, bottom
+    walls.append(box)
+    return walls
+
+
+def test_fast_fall_lands_flush(window):
+    player, engine = floor_level()
+    player.bottom = 200
+    player.change_y = -250
+    engine.update()
+    assert player.bottom == 32
+    assert player.change_y == 0
+    assert engine.can_jump()
+
+
+def test_steps_up_a_ledge_no_higher_than_the_move(window):
+    player, engine = floor_level(ledge(100, 32, 4))
+    player.right = 98
+    player.change_x = 5
+    engine.update()
+    assert player.bottom == 36
+    assert player.right == 103
+
+
+def test_stops_flush_against_a_higher_wall(window):
+    player, engine = floor_level(ledge(100, 32, 6))
+    player.right = 98
+    player.change_x = 5
+    engine.update()
+    assert player.bottom == 32
+    assert player.right == 100
+
+
+def test_carrying_platform_takes_the_player_along(window):
+    platform = make_tiles([(0, 100), (32, 100)])
+    platform.carries = True
+    player = make_player(32, 132)
+    engine = GridPhysicsEnginePlatformer(player, walls=platform, gravity_constant=1)
+    engine.update()
+    for _ in range(3):
+        for tile in platform:
+            tile.center_x += 4
+            tile.center_y += 2
+        engine.update()
+    assert (player.center_x, player.bottom) == (44, 138)
+    assert engine.can_jump()
+
+
+def test_other_walls_move_out_from_under_the_player(window):
+    platform = make_tiles([(0, 100), (32, 100)])
+    player = make_player(32, 132)
+    engine = GridPhysicsEnginePlatformer(player, walls=platform, gravity_constant=1)
+    engine.update()
+    for tile in platform:
+        tile.center_x += 4
+    engine.update()
+    assert player.center_x == 32
+
+
+def test_wall_moving_into_the_player_pushes_it_along(window):
+    wall = make_tiles([(0, 32)])
+    player, engine = floor_level(wall)
+    player.left = 34
+    engine.update()
+    for tile in wall:
+        tile.center_x += 6
+    engine.update()
+    assert player.left == 38
+
+
+def test_switched_off_walls_are_skipped(window):
+    wall = make_tiles([(64, 32)])
+    player, engine = floor_level(wall)
+    wall.collidable = False
+    player.right = 62
+    player.change_x = 5
+    engine.update()
+    assert player.right == 67
+
+
+def test_raycast_stops_at_the_first_wall(window):
+    wall = make_tiles([(96, 32), (160, 32)])
+    player, engine = floor_level(wall)
+    t, x, y, sprite = engine.raycast(40, 48, 240, 48)
+    assert (x, y) == (96, 48)
+    assert t == (96 - 40) / 200
+    assert sprite is wall[0]
+    assert not engine.line_of_sight(40, 48, 240, 48)
+    # along the top of the floor, edges don't block
+    assert engine.line_of_sight(0, 32, 90, 32)
+
+
+def covered_cells(boxes, size=32):
+    """ every grid cell the boxes cover, with how many boxes cover it """
+    cells = {}
+    for left, bottom, right, top in boxes:
+        for col in range(int(left) // size, int(right) // size):
+            for row in range(int(bottom) // size, int(top) // size):
+                cells[col, row] = cells.get((col, row), 0) + 1
+    return cells
+
+
+def test_merged_tiles_cover_the_same_cells_once(window):
+    positions = [(x, y) for x in range(10) for y in range(3)] + [(x, 5) for x in range(3, 7)] + [(12, 0), (12, 1)]
+    tiles = make_tiles([(x * 32, y * 32) for x, y in positions])
+    boxes = merge_tiles(tiles)
+    assert covered_cells(boxes) == {position: 1 for position in positions}
+    assert sorted(boxes) == [(0, 0, 320, 96), (96, 160, 224, 192), (384, 0, 416, 64)]
+
+
+def test_partial_tiles_keep_their_own_box(window):
+    tiles = make_tiles([(0, 0), (32, 0)])
+    half = arcade.SpriteSolidColor(32, 16, arcade.color.WHITE)
+    half.left, half.bottom = 64, 0
+    tiles.append(half)
+    assert sorted(merge_tiles(tiles)) == [(0, 0, 64, 32), (64, 0, 96, 16)]
@@ -0,0 +1,125 @@
+"""
+Rewind: going back any number of ticks, across keyframes and past the end
+of the buffer, puts back exactly what was recorded then. A level's
+recording rewinds while BACKSPACE is held, its ghost recording with it.
+"""
+import random
+from types import SimpleNamespace
+
+import arcade
+
+from conftest import make_player
+from recording import LevelRecording
+from rewind import Rewind
+from snapshot import Snapshot
+
+
+class World():
+    """ a few values that change every tick, some of them only now and then """
+
+    def __init__(self):
+        """ initializer """
+        self.tick = 0
+        self.position = 0.0
+        self.door = "closed"
+        self.rng = random.Random(1)
+        self.snapshot = Snapshot()
+        self.snapshot.add_attrs("clock", self, ("tick", "position"))
+        self.snapshot.add_attrs("door", self, ("door",))
+        self.snapshot.add_random("random", self.rng)
+
+    def step(self):
+        self.tick += 1
+        self.position += self.rng.random()
+        if self.tick % 7 == 0:
+            self.door = "open" if self.door == "closed" else "closed"
+
+
+def recorded(world, rewind, ticks):
+    """ record and play some ticks, the way a level's update does, returns the state recorded each tick """
+    states = []
+    for _ in range(ticks):
+        rewind.record()
+        states.append(world.snapshot.capture())
+        world.step()
+    return states
+
+
+def test_any_tick_comes_back():
+    for back in range(1, 25):
+        world = World()
+        rewind = Rewind(world.snapshot, seconds=4, rate=5, keyframe_interval=6)
+        states = recorded(world, rewind, 23)
+        assert len(rewind) == 20
+        undone = rewind.rewind(back)
+        assert undone == min(back, 20)
+        assert world.snapshot.capture() == states[-undone]
+        assert len(rewind) == 20 - undone
+
+
+def test_one_tick_at_a_time():
+    world = World()
+    rewind = Rewind(world.snapshot, seconds=2, rate=5, keyframe_interval=3)
+    states = recorded(world, rewind, 10)
+    for back in range(1, 11):
+        assert rewind.rewind() == 1
+        assert world.snapshot.capture() == states[-back]
+    assert rewind.rewind() == 0
+    assert world.snapshot.capture() == states[0]
+
+
+def test_play_on_after_a_rewind():
+    world = World()
+    rewind = Rewind(world.snapshot, seconds=10, rate=5, keyframe_interval=4)
+    recorded(world, rewind, 9)
+    rewind.rewind(5)
+    # the ticks that follow are recorded again, and replay the same way
+    states = recorded(world, rewind, 12)
+    assert len(rewind) == 4 + 12
+    rewind.rewind(12)
+    assert world.snapshot.capture() == states[0]
+    assert recorded(world, rewind, 12) == states
+
+
+def test_unchanged_entries_are_stored_once():
+    world = World()
+    rewind = Rewind(world.snapshot, keyframe_interval=60)
+    recorded(world, rewind, 6)
+    doors = {id(keyframe["door"]) if delta is None or "door" not in delta else id(delta["door"])
+             for keyframe, delta in rewind.frames}
+    assert len(doors) == 1
+    assert all(delta is None or "clock" in delta for _, delta in rewind.frames)
+
+
+def test_empty_buffer():
+    world = World()
+    rewind = Rewind(world.snapshot, seconds=0)
+    recorded(world, rewind, 3)
+    assert len(rewind) == 0
+    assert rewind.rewind(3) == 0
+    rewind = Rewind(world.snapshot)
+    recorded(world, rewind, 3)
+    rewind.clear()
+    assert rewind.rewind() == 0
+
+
+def test_level_recording_rewinds_while_backspace_is_held(window):
+    world = World()
+    world.player_sprite = make_player(0, 0)
+    world.player_list = SimpleNamespace(visible=True)
+    world.anim_code = 0
+    recording = LevelRecording(world, "no level", "data/sprites/sprite.png", 1)
+    assert recording.ghost is None
+    states = []
+    for _ in range(5):
+        assert not recording.tick(1 / 60)
+        states.append(world.snapshot.capture())
+        world.step()
+    recording.on_key_press(arcade.key.BACKSPACE)
+    assert recording.tick(1 / 60) and recording.tick(1 / 60)
+    assert world.snapshot.capture() == states[3]
+    assert len(recording.rewind) == len(recording.ghost_recorder) == 3
+    recording.on_key_release(arcade.key.BACKSPACE)
+    assert not recording.tick(1 / 60)
+    recording.restart()
+    assert len(recording.rewind) == len(recording.ghost_recorder) == 0
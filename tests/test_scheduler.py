@@ -0,0 +1,136 @@
+"""
+The timer heap: what's due runs in order, cancelled timers don't, and the
+pending timers survive a get_state / set_state round trip. Cannons fire
+on their own named timers.
+"""
+import pytest
+
+from conftest import make_player
+from modals import Cannon
+from scheduler import Scheduler
+
+
+def recorder(log, scheduler, label):
+    """ a callback logging its label and the time it ran at """
+    def callback():
+        log.append((label, scheduler.now))
+    callback.__name__ = label
+    return callback
+
+
+def test_due_timers_run_in_order():
+    scheduler, log = Scheduler(), []
+    scheduler.after(5, recorder(log, scheduler, "late"))
+    scheduler.after(2, recorder(log, scheduler, "early"))
+    scheduler.after(2, recorder(log, scheduler, "early too"))
+    scheduler.advance(1)
+    assert log == []
+    # one big step still runs each in the order it was due, ties in the order added
+    scheduler.advance(10)
+    assert [label for label, _ in log] == ["early", "early too", "late"]
+
+
+def test_repeating_timer_keeps_its_rhythm():
+    scheduler, log = Scheduler(), []
+    scheduler.every(3, recorder(log, scheduler, "tick"), delay=1)
+    for _ in range(10):
+        scheduler.advance(1)
+    assert [now for _, now in log] == [1, 4, 7, 10]
+    # late updates don't push the next ones back
+    scheduler.advance(7)
+    scheduler.advance(2)
+    assert [now for _, now in log][4:] == [17, 17, 19]
+
+
+def test_cancelled_timers_dont_run():
+    scheduler, log = Scheduler(), []
+    timer = scheduler.after(1, recorder(log, scheduler, "one"))
+    scheduler.every(1, recorder(log, scheduler, "named"))
+    scheduler.after(1, recorder(log, scheduler, "kept"))
+    timer.cancel()
+    scheduler.cancel("named")
+    scheduler.advance(3)
+    assert log == [("kept", 3)]
+
+
+def test_repeating_timer_can_cancel_itself():
+    scheduler, log = Scheduler(), []
+
+    def three_times():
+        log.append(scheduler.now)
+        if len(log) == 3:
+            scheduler.cancel("three_times")
+    scheduler.every(1, three_times)
+    for _ in range(5):
+        scheduler.advance(1)
+    assert log == [1, 2, 3]
+
+
+def test_cancel_all_and_a_callback_adding_timers():
+    scheduler, log = Scheduler(), []
+    chained = recorder(log, scheduler, "chained")
+    scheduler.after(1, lambda: scheduler.after(1, chained), name="chain")
+    scheduler.advance(1)
+    scheduler.advance(1)
+    assert log == [("chained", 2)]
+    scheduler.every(1, chained)
+    scheduler.cancel_all()
+    scheduler.advance(5)
+    assert log == [("chained", 2)]
+
+
+def test_state_round_trip():
+    scheduler, log = Scheduler(), []
+    scheduler.every(2, recorder(log, scheduler, "spikes"))
+    scheduler.after(5, recorder(log, scheduler, "door"))
+    scheduler.after(1, recorder(log, scheduler, "gone")).cancel()
+    scheduler.advance(3)
+    state = scheduler.get_state()
+    assert state == (3, 4, ((4, 3, 2, "spikes"), (5, 1, None, "door")))
+
+    scheduler.advance(10)
+    played = log[len(log) - 6:]
+    del log[1:]
+    scheduler.set_state(state)
+    scheduler.advance(10)
+    assert log[1:] == played
+
+
+def test_timers_of_another_copy_call_the_owners_methods():
+    class Level():
+        def __init__(self):
+            self.log = []
+            self.scheduler = Scheduler(self)
+
+        def open_door(self):
+            self.log.append(self.scheduler.now)
+
+    first, second = Level(), Level()
+    first.scheduler.after(5, first.open_door)
+    first.scheduler.advance(2)
+    # the second copy never scheduled open_door itself
+    second.scheduler.set_state(first.scheduler.get_state())
+    second.scheduler.advance(3)
+    assert second.log == [5] and first.log == []
+
+
+def test_names_are_checked():
+    scheduler = Scheduler()
+    scheduler.after(1, lambda: None, name="fire")
+    with pytest.raises(ValueError):
+        scheduler.after(1, lambda: None, name="fire")
+    with pytest.raises(ValueError):
+        scheduler.every(0, lambda: None, name="other")
+
+
+def test_cannons_fire_on_their_own_timers_past_their_line(window):
+    scheduler = Scheduler()
+    player = make_player(800, 0)
+    left = Cannon(100, 100, player, scheduler, True, fire_line=735)
+    right = Cannon(1500, 100, player, scheduler, False, fire_line=735)
+    scheduler.advance(3)
+    assert (len(left.missile_list), len(right.missile_list)) == (0, 1)
+    player.center_x = 700
+    scheduler.advance(3)
+    assert (len(left.missile_list), len(right.missile_list)) == (1, 1)
+    assert left.firing_start_time == 6
@@ -0,0 +1,95 @@
+"""
+Snapshots put a level's state back exactly, straight from capture() or
+through dumps() and loads().
+"""
+import random
+
+import arcade
+import pytest
+
+from scheduler import Scheduler
+from snapshot import Snapshot, dumps, loads
+
+
+class Door():
+    """ an object keeping its own state """
+
+    def __init__(self):
+        """ initializer """
+        self.opened = False
+        self.keys = []
+
+    def get_state(self):
+        return (self.opened, tuple(self.keys))
+
+    def set_state(self, state):
+        self.opened, keys = state
+        self.keys = list(keys)
+
+
+def level_state(window):
+    """ a snapshot over the kinds of state a level registers """
+    sprite = arcade.SpriteSolidColor(10, 10, arcade.color.WHITE)
+    door = Door()
+    counters = type("Counters", (), {"deaths_here": 0, "phase": "start"})()
+    scheduler = Scheduler()
+    rng = random.Random(4)
+    snapshot = Snapshot()
+    snapshot.add_sprite("player", sprite)
+    snapshot.add_object("door", door)
+    snapshot.add_attrs("counters", counters, ("deaths_here", "phase"))
+    snapshot.add_object("scheduler", scheduler)
+    snapshot.add_random("random", rng)
+    return snapshot, sprite, door, counters, scheduler, rng
+
+
+def play(sprite, door, counters, scheduler, rng):
+    """ change everything a bit """
+    sprite.center_x += rng.random() * 10
+    sprite.change_y = -3
+    sprite.angle = 45
+    sprite.alpha = 128
+    door.keys.append(rng.randrange(100))
+    door.opened = not door.opened
+    counters.phase = f"phase {len(door.keys)}"
+    scheduler.advance(1)
+
+
+@pytest.mark.parametrize("through_bytes", [False, True])
+def test_round_trip(window, through_bytes):
+    snapshot, *state = level_state(window)
+    sprite, door, counters, scheduler, rng = state
+    scheduler.every(2, lambda: None, name="spikes")
+    play(*state)
+    saved = snapshot.capture()
+    if through_bytes:
+        saved = loads(dumps(saved))
+    expected = [rng.random() for _ in range(3)]
+
+    for _ in range(5):
+        play(*state)
+    scheduler.after(1, lambda: None, name="late")
+    snapshot.restore(saved)
+
+    assert loads(dumps(snapshot.capture())) == loads(dumps(saved))
+    assert [rng.random() for _ in range(3)] == expected
+    assert sprite.alpha == 128 and sprite.visible
+    assert scheduler.get_state()[2] == ((2, 0, 2, "spikes"),)
+
+
+def test_skip_and_invisible_sprites(window):
+    snapshot, sprite, door, counters, scheduler, rng = level_state(window)
+    sprite.visible = False
+    saved = snapshot.capture()
+    sprite.visible = True
+    door.opened = True
+    snapshot.restore(saved, skip=("door",))
+    assert not sprite.visible
+    assert door.opened
+    assert "door" in saved and set(snapshot.capture(skip=("door",))) == set(saved) - {"door"}
+
+
+def test_names_are_unique(window):
+    snapshot = level_state(window)[0]
+    with pytest.raises(ValueError):
+        snapshot.add_attrs("door", object(), ())
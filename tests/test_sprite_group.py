@@ -0,0 +1,106 @@
+"""
+SpriteGroups move as one offset: collisions follow the offset, a move is
+swept, spawns and despawns in the same frame still repack, and states are
+only read again and sprites only made again when something changed.
+"""
+from collision import check_for_collision_with_list, CollisionWorld, HAZARD
+from conftest import make_tiles, make_player
+from modals import MovingWall, SpriteGroup
+
+
+def test_collisions_follow_the_offset(window):
+    group = SpriteGroup(make_tiles([(0, 0), (32, 0)]))
+    player = make_player(170, 10)
+    assert check_for_collision_with_list(player, group) == []
+    group.move(120, 0)
+    assert check_for_collision_with_list(player, group) == [group[1]]
+    # the sprites themselves never moved
+    assert group[1].left == 32
+    assert group.bounds == (120, 0, 184, 32)
+    group.place(0, 0)
+    assert check_for_collision_with_list(player, group) == []
+
+
+def test_world_sweeps_a_group_moving_through_the_player(window):
+    group = SpriteGroup(make_tiles([(0, 0)]))
+    world = CollisionWorld()
+    world.add_layer("spikes", group, HAZARD)
+    player = make_player(100, 10)
+    # a big step right past the player
+    group.move(150, 0)
+    assert world.query(player)[HAZARD] == {}
+    assert world.query(player, start=player.position)[HAZARD] == {"spikes": [group[0]]}
+    # a jump isn't swept
+    group.place(150, 0)
+    assert world.query(player, start=player.position)[HAZARD] == {}
+
+
+def test_spawn_and_despawn_in_one_frame_repack(window):
+    group = SpriteGroup(make_tiles([(0, 0), (100, 0)]))
+    world = CollisionWorld()
+    world.add_layer("obstacles", group, HAZARD)
+    player = make_player(216, 10)
+    assert world.query(player)[HAZARD] == {}
+    # same count, same first sprite
+    group.drop_behind(50)
+    group.append(make_tiles([(200, 0)])[0])
+    assert world.query(player)[HAZARD] == {"obstacles": [group[1]]}
+
+
+def test_drop_behind_waits_for_the_first_sprite_to_be_passed(window):
+    group = SpriteGroup(make_tiles([(100, 0), (0, 0), (200, 0)]))
+    group.drop_behind(32)
+    assert len(group) == 3 and group.changes == 3
+    group.drop_behind(40)
+    assert [sprite.left for sprite in group] == [100, 200]
+    assert group.min_right == 132
+    changes = group.changes
+    group.drop_behind(132)
+    assert group.changes == changes
+
+
+def test_states_are_read_again_only_after_a_change(window):
+    def read(sprite):
+        return (sprite.left,)
+
+    group = SpriteGroup(make_tiles([(0, 0), (32, 0)]))
+    states = group.sprite_states(read)
+    assert states == ((0,), (32,))
+    assert group.sprite_states(read) is states
+    group.pop()
+    assert group.sprite_states(read) == ((0,),)
+
+
+def test_setting_states_reuses_the_sprites_it_has(window):
+    def read(sprite):
+        return (sprite.left,)
+
+    def make(left):
+        made.append(left)
+        return make_tiles([(left, 0)])[0]
+
+    made = []
+    group = SpriteGroup(make_tiles([(0, 0), (32, 0)]))
+    first, second = group
+    group.set_sprite_states(((32,), (64,)), read, make)
+    assert made == [64]
+    assert group[0] is second
+    assert group.sprite_states(read) == ((32,), (64,))
+    # setting the same states again changes nothing
+    changes = group.changes
+    group.set_sprite_states(((32,), (64,)), read, make)
+    assert group.changes == changes and made == [64]
+
+
+def test_moving_wall_stops_at_its_distance_and_resets(window):
+    wall = MovingWall(make_tiles([(0, 64)]), 5, 12, "horizontal", disappears=True)
+    wall.start_moving()
+    moves = []
+    for _ in range(5):
+        wall.update()
+        moves.append(wall.wall_list.last_move)
+    assert moves == [(-5, 0), (-5, 0), (-2, 0), (0, 0), (0, 0)]
+    assert wall.wall_list.offset == (-12, 0)
+    assert not wall.wall_list.visible and not wall.wall_list.collidable
+    wall.reset()
+    assert wall.wall_list.offset == (0, 0) and wall.wall_list.collidable
@@ -0,0 +1,89 @@
+"""
+Telemetry: values survive encoding, and a reader on the socket ends up with
+the state the level handed over, frame by frame.
+"""
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from telemetry import (encode_value, decode_value, TelemetryServer, TelemetryReader,
+                       KEYFRAME, DELTA, DEATH, COMPLETE)
+
+
+@pytest.mark.parametrize("value", [
+    None, True, False, 0, -5, 1 << 70, -(1 << 63), 2.5, "", "trappe ↓",
+    (), (1, (2.0, "three", (None,)), (True, False)),
+])
+def test_value_round_trip(value):
+    out = bytearray(b"head")
+    encode_value(value, out)
+    decoded, offset = decode_value(out, 4)
+    assert offset == len(out)
+    assert decoded == value
+    assert type(decoded) is type(value)
+
+
+def test_lists_come_back_as_tuples():
+    out = bytearray()
+    encode_value([1, [2]], out)
+    assert decode_value(out) == ((1, (2,)), len(out))
+
+
+def test_unsendable_values():
+    with pytest.raises(TypeError):
+        encode_value({"a": 1}, bytearray())
+    with pytest.raises(ValueError):
+        decode_value(b"?")
+
+
+class Level1():
+    """ enough of a level for the server """
+
+    def __init__(self):
+        """ initializer """
+        self.player_sprite = SimpleNamespace(center_x=10.0, center_y=20.0, change_x=1.0, change_y=-2.0)
+        self.player_list = SimpleNamespace(visible=True)
+        self.anim_code = 3
+        self.time = 12.5
+        self.death = 2
+        self.state = {"player": (10.0, 20.0), "random": (3, (1, 2), None), "door": (False,), "tick": (0,)}
+        self.snapshot = SimpleNamespace(capture=self.capture)
+
+    def capture(self, skip=()):
+        """ like Snapshot.capture """
+        return {name: value for name, value in self.state.items() if name not in skip}
+
+
+def test_reader_follows_the_level():
+    server = TelemetryServer(port=0)
+    try:
+        reader = TelemetryReader.connect(*server.address)
+        deadline = time.monotonic() + 5
+        while not server.clients and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+        view = Level1()
+        server.frame(view, 1 / 60)
+        view.state["tick"] = (1,)
+        view.player_sprite.center_x = 11.0
+        server.frame(view, 1 / 60)
+        view.state["door"] = (True,)
+        server.frame(view, 1 / 30)
+        server.death(view)
+        server.complete(view)
+
+        kind, frame_number, names = reader.read()
+        assert (kind, frame_number, names) == (KEYFRAME, 1, ("door", "tick"))
+        assert reader.level_name == "Level1"
+        assert reader.state == {"door": (False,), "tick": (0,)}
+        assert reader.read() == (DELTA, 2, ("tick",))
+        assert reader.pose == (11.0, 20.0, 1.0, -2.0, 3)
+        assert reader.read() == (DELTA, 3, ("door",))
+        assert reader.state == {"door": (True,), "tick": (1,)}
+        assert reader.frame_us == 33333
+        assert reader.read() == (DEATH, 3, (11.0, 20.0, 1.0, -2.0, 3))
+        assert reader.read() == (COMPLETE, 3, (12.5, 2))
+    finally:
+        server.close()
+    assert reader.read() is None
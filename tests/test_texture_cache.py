@@ -0,0 +1,106 @@
+"""
+The texture LRU: every texture in arcade's cache is indexed under its image
+file, and the least recently used files go once over the budget.
+"""
+import os
+
+import arcade
+import pytest
+
+from texture_cache import TextureCache, group_of
+
+CANNONS = ["data/sprites/cannon.png", "data/sprites/cannon2.png", "data/sprites/cannon3.png"]
+
+
+@pytest.fixture
+def empty_cache(monkeypatch):
+    """ start from an empty arcade cache, the game's is put back afterwards """
+    monkeypatch.setattr(arcade.load_texture, "texture_cache", {})
+
+
+def file_size(file_name):
+    """ bytes used by one texture of the whole image """
+    width, height = arcade.load_texture(file_name).image.size
+    return width * height * 4
+
+
+def test_group_of_cut_mip_and_solid_keys():
+    group = os.path.abspath("data/sprites/sprite.png")
+    assert group_of("data/sprites/sprite.png") == group
+    assert group_of("data/sprites/sprite.png-0-128-128-128-False-True-False-Simple ") == group
+    assert group_of("data/sprites/sprite.png@0.25-0-128-128-128-False-False-False-Detailed ") == group
+    assert group_of("Solid-20-30-(255, 0, 0, 255)") is None
+
+
+def test_every_texture_is_indexed(empty_cache):
+    cache = TextureCache()
+    cache.load_texture(CANNONS[0], scale=0.5)
+    # arcade's own loads go through the index too
+    arcade.load_texture(CANNONS[1], flipped_horizontally=True)
+    arcade.SpriteSolidColor(10, 10, arcade.color.RED)
+
+    keys = cache.keys[os.path.abspath(CANNONS[0])]
+    # the mip level image and its cut, the full size image isn't kept
+    assert len(keys) == 2
+    assert set(cache.groups) == {os.path.abspath(name) for name in CANNONS[:2]}
+    assert cache.memory_used == sum(cache.groups.values())
+    assert cache.memory_used == sum(sum(keys.values()) for keys in cache.keys.values())
+
+    used = cache.memory_used
+    key = next(iter(keys))
+    size = keys[key]
+    arcade.load_texture.texture_cache.pop(key)
+    assert cache.memory_used == used - size
+    assert key not in cache.keys[os.path.abspath(CANNONS[0])]
+
+
+def test_least_recently_used_file_is_evicted(empty_cache):
+    # room for the source image and the cut of two of the files
+    budget = 2 * 2 * file_size(CANNONS[0])
+    arcade.load_texture.texture_cache.clear()
+    cache = TextureCache(budget=budget)
+
+    cache.load_texture(CANNONS[0])
+    cache.load_texture(CANNONS[1])
+    cache.load_texture(CANNONS[0])
+    cache.load_texture(CANNONS[2])
+
+    assert os.path.abspath(CANNONS[1]) not in cache.groups
+    assert not any(key.startswith(CANNONS[1]) for key in arcade.load_texture.texture_cache)
+    assert list(cache.groups) == [os.path.abspath(CANNONS[0]), os.path.abspath(CANNONS[2])]
+    assert cache.memory_used <= cache.budget
+
+
+def test_pinned_files_stay(empty_cache):
+    cache = TextureCache(budget=1)
+    cache.pin(CANNONS[0])
+    cache.load_texture(CANNONS[0])
+    cache.load_texture(CANNONS[1])
+
+    assert list(cache.groups) == [os.path.abspath(CANNONS[0])]
+
+
+def test_textures_in_use_stay(empty_cache):
+    cache = TextureCache()
+    sprite = arcade.Sprite(texture=cache.load_texture(CANNONS[0], 0, 0, 16, 16))
+    cache.budget = 1
+    cache.load_texture(CANNONS[1])
+
+    # the whole image went, the cut the sprite shows didn't
+    assert list(cache.keys) == [os.path.abspath(CANNONS[0])]
+    assert list(cache.keys[os.path.abspath(CANNONS[0])]) == [sprite.texture.name]
+    assert arcade.load_texture.texture_cache[sprite.texture.name] is sprite.texture
+    del sprite
+    cache.trim()
+    assert not cache.groups
+
+
+def test_replaced_arcade_cache_is_indexed_again(empty_cache):
+    cache = TextureCache()
+    cache.load_texture(CANNONS[0])
+    arcade.cleanup_texture_cache()
+    assert arcade.load_texture.texture_cache is not cache.cache
+
+    cache.load_texture(CANNONS[1])
+    assert arcade.load_texture.texture_cache is cache.cache
+    assert list(cache.groups) == [os.path.abspath(CANNONS[1])]
@@ -0,0 +1,85 @@
+import json
+import os
+from types import SimpleNamespace
+
+import pytest
+
+from collision import CollisionWorld, PUSHER
+from conftest import make_tiles, make_player
+from mapbin import load_tilemap
+from physics import GridPhysicsEnginePlatformer
+from traps import TrapEngine, load_definitions
+
+
+def level1_definitions():
+    """ the trap file shipped with level 1 """
+    path = os.path.join(os.path.dirname(__file__), "..", "data", "maps", "level1.traps.json")
+    with open(path) as f:
+        return json.load(f)["layers"]
+
+
+def trapdoor_level(definitions):
+    """ a floor of five tiles as gap1 and a trigger to drop it """
+    tile_map = SimpleNamespace(sprite_lists={
+        "gap1": make_tiles([(i * 32, 0) for i in range(5)]),
+        "trig1": make_tiles([(400, 0)]),
+    })
+    traps = TrapEngine(tile_map, {"gap1": definitions["gap1"], "trig1": definitions["trig1"]})
+    player = make_player(80, 32)
+    engine = GridPhysicsEnginePlatformer(player, walls=traps.lists("solid"), gravity_constant=1)
+    engine.update()
+    return traps, player, engine
+
+
+def test_player_falls_through_dropping_trapdoor(window):
+    traps, player, engine = trapdoor_level(level1_definitions())
+    assert engine.can_jump()
+    traps.fire(["trig1"])
+    bottoms = []
+    for _ in range(4):
+        traps.update()
+        engine.update()
+        bottoms.append(player.bottom)
+        # falling, not riding the floor down
+        assert not engine.can_jump()
+    # free fall from rest under gravity 1, the floor drops 10 a tick
+    assert bottoms == [31, 29, 26, 22]
+
+
+def test_carrying_trap_wall_takes_the_player_along(window):
+    definitions = level1_definitions()
+    definitions["gap1"] = dict(definitions["gap1"], carry=True)
+    traps, player, engine = trapdoor_level(definitions)
+    traps.fire(["trig1"])
+    for tick in range(1, 4):
+        traps.update()
+        engine.update()
+        assert player.bottom == 32 - 10 * tick
+        assert engine.can_jump()
+
+
+def test_triggers_wait_for_the_ones_before_them(window):
+    calls = []
+    tile_map = SimpleNamespace(sprite_lists={"trig1": make_tiles([(0, 0)]), "trig2": make_tiles([(64, 0)])})
+    traps = TrapEngine(tile_map, {
+        "trig1": {"role": "trigger", "actions": "call one"},
+        "trig2": {"role": "trigger", "after": "trig1", "actions": "call two"},
+    }, {"one": lambda: calls.append(1), "two": lambda: calls.append(2)})
+    traps.fire(["trig2"])
+    assert calls == []
+    traps.fire(["trig1", "trig2"])
+    traps.fire(["trig1", "trig2"])
+    assert calls == [1, 2]
+
+
+@pytest.mark.parametrize("number", [1, 2, 3])
+def test_shipped_trap_files_compile(window, number):
+    map_name = f"data/maps/level{number}.json"
+    tile_map = load_tilemap(map_name, scaling=0.25, hit_box_algorithm="None")
+    definitions = load_definitions(map_name, tile_map)
+    assert set(definitions) <= set(tile_map.sprite_lists)
+    traps = TrapEngine(tile_map, definitions, {"escape": lambda: None})
+    world = CollisionWorld()
+    traps.register(world)
+    pushers = {name for name, layer in world.layers.items() if layer.category == PUSHER}
+    assert pushers == ({"wall1", "ceiling"} if number == 3 else set())
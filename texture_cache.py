@@ -0,0 +1,253 @@
+"""
+Budgeted texture cache.
+
+Every texture arcade caches, whoever loaded it (load_texture here, the asset
+pack's mip levels and preloading, arcade itself), is put under the image
+file it was cut from. arcade's cache dict is swapped for one that tells the
+TextureCache about each texture added or dropped, so the groups, their keys
+and their sizes are kept up to date as it goes instead of being found by
+scanning the cache. Loading through load_texture marks the file as just
+used; the least recently used groups are evicted once the cached images go
+over the budget, except for the textures something still refers to.
+"""
+import gc
+import os
+import re
+import threading
+import types
+from collections import OrderedDict
+
+import arcade
+
+import assetpack
+
+
+# memory budget for cached texture images, in bytes
+TEXTURE_BUDGET = 32 * 1024 * 1024
+# number of recently played levels whose tilesets stay resident
+RESIDENT_LEVELS = 2
+
+# sprites used by every level, these are never evicted
+SHARED_SPRITES = [
+    "data/sprites/sprite.png",
+    "data/sprites/sprite_jetpack.png",
+    "data/sprites/button1.png",
+    "data/sprites/button2.png",
+    "data/sprites/arrow_left.png",
+    "data/sprites/spike.png",
+    "data/sprites/ground_spike.png",
+]
+
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".bmp", ".gif")
+# what arcade.load_texture puts after the file name in the cache name of a cut
+CUT_SUFFIX = re.compile(r"-[\d.]+-[\d.]+-[\d.]+-[\d.]+-(True|False)-(True|False)-(True|False)-\S* $")
+MIP_SUFFIX = re.compile("@(" + "|".join(re.escape(str(level)) for level in assetpack.MIP_LEVELS) + ")$")
+
+
+def group_of(key):
+    """ the image file a texture cache key belongs to, None if it's not from a file (solid colors) """
+    name = MIP_SUFFIX.sub("", CUT_SUFFIX.sub("", key))
+    if not name.lower().endswith(IMAGE_EXTENSIONS):
+        return None
+    return os.path.abspath(name)
+
+
+def _tileset_images(tile_map):
+    """ list the tileset image files used by a loaded tile map """
+    if hasattr(tile_map, "tileset_images"):
+        return tile_map.tileset_images
+    return [tileset.image for tileset in tile_map.tiled_map.tilesets.values() if tileset.image]
+
+
+def _in_use(textures, *holders):
+    """ the ids of the textures referred to by anything but the holders (running code doesn't count) """
+    if not textures:
+        return set()
+    wanted = {id(texture) for texture in textures}
+    ignored = {id(holder) for holder in holders} | {id(textures)}
+    used = set()
+    for referrer in gc.get_referrers(*textures):
+        if id(referrer) in ignored or isinstance(referrer, types.FrameType):
+            continue
+        used.update(id(item) for item in gc.get_referents(referrer) if id(item) in wanted)
+    return used
+
+
+class _IndexedTextureDict(dict):
+    """ arcade's texture cache, telling a TextureCache about every texture added or dropped """
+
+    def __init__(self, owner, entries):
+        """ initializer """
+        super().__init__(entries)
+        self.owner = owner
+
+    def __setitem__(self, key, texture):
+        super().__setitem__(key, texture)
+        self.owner._added(key, texture)
+
+    def __delitem__(self, key):
+        super().__delitem__(key)
+        self.owner._removed(key)
+
+    def pop(self, key, *default):
+        texture = super().pop(key, *default)
+        self.owner._removed(key)
+        return texture
+
+
+class TextureCache():
+    """
+    LRU cache on top of arcade's texture cache.
+
+    Textures are grouped by the image file they were cut from, and the least
+    recently used group is evicted when the cached images go over the budget.
+    Pinned files and the tilesets of the last few played levels are never evicted.
+    """
+
+    def __init__(self, budget=TEXTURE_BUDGET, resident_levels=RESIDENT_LEVELS):
+        """ initializer """
+        self.budget = budget
+        self.resident_levels = resident_levels
+        self.pinned = set()
+        # tileset files of the recently played levels, most recent first
+        self.recent_levels = []
+        # image file -> bytes used by its textures, most recently used last
+        self.groups = OrderedDict()
+        # image file -> {cache key: bytes}
+        self.keys = {}
+        self.memory_used = 0
+        # maps load on worker threads, their textures are added from there
+        self.lock = threading.Lock()
+        self.cache = None
+        self.install()
+
+    def install(self):
+        """ put the indexed dict in arcade's place, again if arcade.cleanup_texture_cache replaced it """
+        if arcade.load_texture.texture_cache is self.cache:
+            return
+        with self.lock:
+            self.groups.clear()
+            self.keys.clear()
+            self.memory_used = 0
+        self.cache = _IndexedTextureDict(self, {})
+        for key, texture in arcade.load_texture.texture_cache.items():
+            self.cache[key] = texture
+        arcade.load_texture.texture_cache = self.cache
+
+    def _added(self, key, texture):
+        """ a texture went into arcade's cache """
+        group = group_of(key)
+        if group is None:
+            return
+        width, height = texture.image.size
+        size = width * height * 4
+        with self.lock:
+            group_keys = self.keys.setdefault(group, {})
+            change = size - group_keys.get(key, 0)
+            group_keys[key] = size
+            self.groups[group] = self.groups.get(group, 0) + change
+            self.groups.move_to_end(group)
+            self.memory_used += change
+
+    def _removed(self, key):
+        """ a texture left arcade's cache """
+        group = group_of(key)
+        with self.lock:
+            size = self.keys.get(group, {}).pop(key, None)
+            if size is None:
+                return
+            self.groups[group] -= size
+            self.memory_used -= size
+            if not self.keys[group]:
+                del self.keys[group]
+                del self.groups[group]
+
+    def pin(self, file_name):
+        """ keep a file's textures loaded for good """
+        self.pinned.add(os.path.abspath(file_name))
+
+    def is_resident(self, file_name):
+        """ True if the group can't be evicted """
+        group = os.path.abspath(file_name)
+        if group in self.pinned:
+            return True
+        return any(group in level for level in self.recent_levels)
+
+    def touch(self, file_name):
+        """ mark a file as just used """
+        group = os.path.abspath(file_name)
+        with self.lock:
+            if group in self.groups:
+                self.groups.move_to_end(group)
+        self.trim()
+
+    def load_texture(self, file_name, *args, **kwargs):
+        """ load a texture (from the asset pack if there is one) and mark its file as just used """
+        self.install()
+        texture = assetpack.load_texture(file_name, *args, **kwargs)
+        self.touch(file_name)
+        return texture
+
+    def enter_level(self, tile_map):
+        """ call after a level's tile map is loaded, keeps its tilesets warm """
+        level = tuple(os.path.abspath(image) for image in _tileset_images(tile_map))
+        if level in self.recent_levels:
+            self.recent_levels.remove(level)
+        self.recent_levels.insert(0, level)
+        del self.recent_levels[self.resident_levels:]
+        for image in level:
+            self.touch(image)
+
+    def trim(self):
+        """ evict least recently used groups until under budget """
+        if self.memory_used <= self.budget:
+            return
+        # the atlas can only be changed from the thread drawing, workers leave it for later
+        if threading.current_thread() is not threading.main_thread():
+            return
+        with self.lock:
+            groups = list(self.groups)
+        for group in groups:
+            if self.memory_used <= self.budget:
+                break
+            if not self.is_resident(group):
+                self.evict(group)
+
+    def evict(self, file_name):
+        """
+        Drop the textures cut from a file from arcade's cache and the atlas.
+        Textures something still holds (a sprite showing it, a level's
+        animation frames) stay, a sheet loaded once in setup is kept for as
+        long as the level uses it.
+        """
+        group = os.path.abspath(file_name)
+        with self.lock:
+            keys = list(self.keys.get(group, ()))
+        cached = {key: self.cache[key] for key in keys if key in self.cache}
+        try:
+            atlas = arcade.get_window().ctx.default_atlas
+        except Exception:
+            # no window yet, nothing was uploaded
+            atlas = None
+        used = _in_use(list(cached.values()), self.cache, cached, atlas and atlas._textures)
+        textures = [self.cache.pop(key) for key, texture in cached.items() if id(texture) not in used]
+
+        if atlas is None:
+            return
+        removed = False
+        for texture in textures:
+            if atlas.has_texture(texture):
+                atlas.remove(texture)
+                removed = True
+        if removed:
+            # reclaim the freed space in the atlas
+            atlas.rebuild()
+
+texture_cache = TextureCache()
+for sprite_path in SHARED_SPRITES:
+    texture_cache.pin(sprite_path)
+
+
+def load_texture(file_name, *args, **kwargs):
+    """ assetpack.load_texture through the shared cache, see TextureCache.load_texture """
+    return texture_cache.load_texture(file_name, *args, **kwargs)
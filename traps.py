@@ -0,0 +1,245 @@
+"""
+Data driven traps.
+
+A level's traps are described per map layer instead of in the level's code:
+as custom properties on the layer in Tiled, and/or in a sidecar file next to
+the map (data/maps/level1.json -> data/maps/level1.traps.json) whose entries
+override the Tiled ones key by key:
+
+    {"layers": {
+        "gap1": {"role": "solid", "speed": 10, "distance": 400, "direction": "vertical"},
+        "trig1": {"role": "trigger", "actions": "move gap1"},
+        "trig5": {"role": "trigger", "after": "trig4", "actions": ["move gap5", "call escape"]}
+    }}
+
+Layer keys:
+    role        solid (the player stands on it), hazard (kills), trigger
+                (fires actions when touched), pusher (the level moves the
+                player when touched) or scenery (only drawn, the default)
+    visible     drawn from the start, default true
+    behind      drawn by draw_behind() instead of draw(), under the player
+    speed, distance, direction ('vertical' or 'horizontal'), disappears,
+    carry       make it a MovingWall, see modals.MovingWall. carry true moves
+                the player standing on it along, a platform rather than a
+                trapdoor. Walls don't carry by default
+    autostart   the wall starts moving as soon as the level starts
+    actions     for triggers, what happens when touched, "; " separated in Tiled:
+                    move <layer>            start a wall
+                    speed <layer> <speed>   change a wall's speed
+                    show <layer>, hide <layer>
+                    enable <layer>, disable <layer>   switch its collisions
+                    call <hook>             one of the level's hooks
+    after       triggers that have to fire first, "; " separated in Tiled
+
+Loading compiles all of it once into an event graph: every trigger name maps
+to its prerequisites and a list of bound calls, so a frame costs a dict lookup
+per trigger touched, whatever the number of traps. Layers without a role are
+left to the level.
+"""
+import json
+import os
+
+from assetpack import get_pack, read_asset
+from collision import HAZARD, TRIGGER, PUSHER
+from modals import MovingWall
+
+
+ROLES = ("solid", "hazard", "trigger", "pusher", "scenery")
+WALL_KEYS = ("speed", "distance", "direction", "disappears", "carry", "autostart")
+
+
+def sidecar_path(map_name):
+    """ the trap file of a map """
+    return os.path.splitext(map_name)[0] + ".traps.json"
+
+
+def load_definitions(map_name, tile_map):
+    """ layer name -> trap definition, from the Tiled layer properties and the sidecar file """
+    definitions = {}
+    for name, sprite_list in tile_map.sprite_lists.items():
+        properties = getattr(sprite_list, "properties", None)
+        if properties and "role" in properties:
+            definitions[name] = dict(properties)
+
+    file_name = sidecar_path(map_name)
+    pack = get_pack()
+    if (pack is not None and file_name in pack) or os.path.exists(file_name):
+        for name, definition in json.loads(read_asset(file_name)).get("layers", {}).items():
+            definitions.setdefault(name, {}).update(definition)
+    return definitions
+
+
+def _split(value):
+    """ a list of strings, from a list or a '; ' separated Tiled string """
+    if not value:
+        return []
+    if isinstance(value, str):
+        return [part.strip() for part in value.split(";") if part.strip()]
+    return list(value)
+
+
+class Trigger():
+    """ a node of the event graph """
+
+    def __init__(self, name, after, calls):
+        """ initializer """
+        self.name = name
+        # names of the triggers that have to fire first
+        self.after = after
+        # (function, args) run in order when it fires
+        self.calls = calls
+
+
+class TrapEngine():
+    """ the traps of one level, compiled from their definitions """
+
+    def __init__(self, tile_map, definitions, hooks=None):
+        """ initializer, hooks maps names to the level's methods for call actions """
+        self.hooks = hooks or {}
+        # sprite lists (a wall's SpriteGroup for walls) by layer name, in map order
+        self.layers = {}
+        self.roles = {}
+        self.behind = set()
+        self.visible = {}
+        self.walls = {}
+        self.autostart = []
+        self.triggers = {}
+        # triggers that fired since the last reset
+        self.fired = set()
+
+        for name, sprite_list in tile_map.sprite_lists.items():
+            definition = definitions.get(name)
+            if definition is None:
+                continue
+            role = definition.get("role", "scenery")
+            if role not in ROLES:
+                raise ValueError(f"layer '{name}' has an unknown role {role}")
+            if any(key in definition for key in WALL_KEYS):
+                wall = MovingWall(sprite_list, definition.get("speed", 0), definition.get("distance", 0),
+                                  definition.get("direction", "vertical"), definition.get("disappears", False),
+                                  definition.get("visible", True), definition.get("carry", False))
+                self.walls[name] = wall
+                if definition.get("autostart", False):
+                    self.autostart.append(wall)
+                sprite_list = wall.wall_list
+            self.layers[name] = sprite_list
+            self.roles[name] = role
+            self.visible[name] = definition.get("visible", role != "trigger")
+            if definition.get("behind", False):
+                self.behind.add(name)
+
+        # compiled after every layer is known, actions can point at any of them
+        for name, definition in definitions.items():
+            if self.roles.get(name) == "trigger":
+                calls = [self._compile(name, action) for action in _split(definition.get("actions"))]
+                self.triggers[name] = Trigger(name, _split(definition.get("after")), calls)
+        for trigger in self.triggers.values():
+            for name in trigger.after:
+                if name not in self.triggers:
+                    raise ValueError(f"trigger '{trigger.name}' comes after unknown trigger '{name}'")
+        self.reset()
+
+    def _compile(self, trigger, action):
+        """ turn an action string into (function, args) """
+        verb, *args = action.split()
+        if verb == "call":
+            if not args or args[0] not in self.hooks:
+                raise ValueError(f"trigger '{trigger}' has a bad action '{action}'")
+            return self.hooks[args[0]], ()
+        if not args or args[0] not in self.layers:
+            raise ValueError(f"trigger '{trigger}' has a bad action '{action}'")
+        if verb == "move" and args[0] in self.walls:
+            return self.walls[args[0]].start_moving, ()
+        if verb == "speed" and args[0] in self.walls and len(args) == 2:
+            return self._set_speed, (self.walls[args[0]], float(args[1]))
+        if verb in ("show", "hide"):
+            return self._set_visible, (self.layers[args[0]], verb == "show")
+        if verb in ("enable", "disable"):
+            return self._set_collidable, (self.layers[args[0]], verb == "enable")
+        raise ValueError(f"trigger '{trigger}' has a bad action '{action}'")
+
+    def _set_speed(self, wall, speed):
+        """ action: change a wall's speed """
+        wall.move_speed = speed
+
+    def _set_visible(self, sprite_list, visible):
+        """ action: show or hide a layer """
+        sprite_list.visible = visible
+
+    def _set_collidable(self, sprite_list, collidable):
+        """ action: switch a layer's collisions, the whole list at once """
+        sprite_list.collidable = collidable
+
+    def lists(self, role):
+        """ the sprite lists with a role, in map order """
+        return [sprite_list for name, sprite_list in self.layers.items() if self.roles[name] == role]
+
+    def register(self, collision_world):
+        """ add the hazard, trigger and pusher layers to a CollisionWorld """
+        for name, sprite_list in self.layers.items():
+            if self.roles[name] == "hazard":
+                collision_world.add_layer(name, sprite_list, HAZARD)
+            elif self.roles[name] == "trigger":
+                collision_world.add_layer(name, sprite_list, TRIGGER)
+            elif self.roles[name] == "pusher":
+                collision_world.add_layer(name, sprite_list, PUSHER)
+
+    def update(self):
+        """ move the walls """
+        for wall in self.walls.values():
+            wall.update()
+
+    def fire(self, touched):
+        """ fire the triggers touched, given the trigger hits of a CollisionWorld query """
+        for name in touched:
+            trigger = self.triggers.get(name)
+            if trigger is None or name in self.fired:
+                continue
+            if not all(before in self.fired for before in trigger.after):
+                continue
+            self.fired.add(name)
+            for function, args in trigger.calls:
+                function(*args)
+
+    def has_fired(self, name):
+        """ True if a trigger fired since the last reset """
+        return name in self.fired
+
+    def reset(self):
+        """ put every trap back the way the level starts """
+        self.fired.clear()
+        for wall in self.walls.values():
+            wall.reset()
+        for name, sprite_list in self.layers.items():
+            sprite_list.visible = self.visible[name]
+            sprite_list.collidable = True
+        for wall in self.autostart:
+            wall.start_moving()
+
+    def get_state(self):
+        """ the triggers fired, the walls and what's shown and collidable, see snapshot.py """
+        return (tuple(sorted(self.fired)),
+                tuple(wall.get_state() for wall in self.walls.values()),
+                tuple((sprite_list.visible, getattr(sprite_list, "collidable", True)) for sprite_list in self.layers.values()))
+
+    def set_state(self, state):
+        """ put back a state from get_state """
+        fired, walls, layers = state
+        self.fired = set(fired)
+        for wall, wall_state in zip(self.walls.values(), walls):
+            wall.set_state(wall_state)
+        for sprite_list, (visible, collidable) in zip(self.layers.values(), layers):
+            sprite_list.visible = visible
+            sprite_list.collidable = collidable
+
+    def draw_behind(self):
+        """ draw the layers under the player """
+        for name, sprite_list in self.layers.items():
+            if name in self.behind and self.roles[name] != "trigger":
+                sprite_list.draw()
+
+    def draw(self):
+        """ draw the layers over the player, in map order """
+        for name, sprite_list in self.layers.items():
+            if name not in self.behind and self.roles[name] != "trigger":
+                sprite_list.draw()